@@ -1,5 +1,6 @@
 
 #include <WiFi.h>
+#include <ESPmDNS.h>
 #include <Wire.h>
 #include <Adafruit_GFX.h>
 #include <Adafruit_SH110X.h>
@@ -155,6 +156,17 @@ void conectarWiFi() {
     display.print("IP: ");
     display.println(WiFi.localIP());
     Serial.println("WiFi conectado - IP: " + WiFi.localIP().toString());
+    // Anuncia finbox-a1b2c3.local (3 últimos bytes de la MAC) para que el PC la
+    // encuentre aunque cambie la IP; con el nombre fijo varias cajas chocaban
+    uint8_t mac[6];
+    WiFi.macAddress(mac);
+    char nombre[16];
+    snprintf(nombre, sizeof(nombre), "finbox-%02x%02x%02x", mac[3], mac[4], mac[5]);
+    if (MDNS.begin(nombre)) {
+      MDNS.addService("http", "tcp", 80);
+      MDNS.addServiceTxt("http", "tcp", "id", WiFi.macAddress());
+      Serial.println("mDNS: " + String(nombre) + ".local");
+    }
   } else {
     display.println("WiFi ERROR");
     display.println("Modo offline");
@@ -172,7 +184,8 @@ void configurarServidor() {
   
   // Endpoint para verificar estado
   server.on("/status", HTTP_GET, [](AsyncWebServerRequest *request){
-    String status = "{\"ventas\":" + String(numVentas) + ",\"status\":\"ok\"}";
+    // "id" (la MAC) permite al PC reconocer esta caja aunque el DHCP le cambie la IP
+    String status = "{\"ventas\":" + String(numVentas) + ",\"status\":\"ok\",\"id\":\"" + WiFi.macAddress() + "\"}";
     request->send(200, "application/json", status);
   });
   
@@ -396,6 +409,8 @@ String generarReporteJSON() {
   DynamicJsonDocument doc(8192);
   
   doc["fecha"] = obtenerFecha();
+  // La MAC distingue las cajas: varios reportes del mismo día y caja son fotos del acumulado
+  doc["dispositivo"] = WiFi.macAddress();
   doc["total_ventas"] = numVentas;
   
   int totalDia = 0;
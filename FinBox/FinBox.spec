@@ -1,4 +1,39 @@
 # -*- mode: python ; coding: utf-8 -*-
+#
+# Perfiles de compilación (los argumentos van después de `--`):
+#
+#   pyinstaller FinBox.spec                      -> onefile, igual que antes
+#   pyinstaller FinBox.spec -- --release         -> onefile sin módulos no usados
+#   pyinstaller FinBox.spec -- --release --onedir
+#                                                -> carpeta dist/FinBox/, arranca sin
+#                                                   descomprimir en un directorio temporal
+#
+# Para comparar tamaño y arranque en frío de los resultados: python medir_build.py
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--release', action='store_true',
+                    help='Excluye módulos que la app no usa y optimiza el bytecode')
+parser.add_argument('--onedir', action='store_true',
+                    help='Genera una carpeta en vez de un solo .exe')
+opciones = parser.parse_args()
+
+# Módulos que PyInstaller arrastra (ver warn-FinBox.txt / Analysis-00.toc)
+# pero que la app nunca importa en tiempo de ejecución.
+EXCLUDES_RELEASE = [
+    # Herramientas de empaquetado y consola interactiva
+    'setuptools', 'pkg_resources', '_distutils_hack', 'distutils',
+    '_pyrepl', 'curses', 'pydoc_data', 'xmlrpc',
+    # Resaltado de sintaxis que solo usa el CLI de openai
+    'pygments', 'openai.cli',
+    # Backends de matplotlib distintos de TkAgg/Agg
+    'matplotlib.backends.backend_qt', 'matplotlib.backends.backend_qtagg',
+    'matplotlib.backends.backend_qt5agg', 'matplotlib.backends.backend_gtk3agg',
+    'matplotlib.backends.backend_gtk4agg', 'matplotlib.backends.backend_wxagg',
+    'matplotlib.backends.backend_webagg', 'matplotlib.backends.backend_nbagg',
+    'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'wx', 'IPython',
+]
 
 
 a = Analysis(
@@ -10,29 +45,59 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES_RELEASE if opciones.release else [],
     noarchive=False,
-    optimize=0,
+    # 1 = sin asserts; 2 quitaría docstrings que matplotlib usa al importar
+    optimize=1 if opciones.release else 0,
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='FinBox',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if opciones.onedir:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='FinBox',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        # UPX ahorra disco pero cada DLL se descomprime al cargarla
+        upx=not opciones.release,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=not opciones.release,
+        upx_exclude=[],
+        name='FinBox',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='FinBox',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=not opciones.release,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
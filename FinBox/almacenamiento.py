@@ -0,0 +1,415 @@
+import json
+import os
+import gzip
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import metricas
+
+# Formatos de almacenamiento de reportes:
+#   "json"   -> un archivo reporte_<fecha>_<hora>.json por descarga (legible, el de siempre)
+#   "ndjson" -> un reporte por línea en segmentos mensuales reportes/segmentos/<YYYY-MM>.ndjson
+# Los meses cerrados se compactan (compactacion.py) en reportes/archivo/YYYY/MM/
+# como un solo NDJSON comprimido, con un índice del rango de fechas de cada mes.
+FORMATOS = ("json", "ndjson")
+CARPETA_SEGMENTOS = "segmentos"
+CARPETA_ARCHIVO = "archivo"
+ARCHIVO_INDICE = "indice.json"
+ESPERA_BLOQUEO = 30  # segundos que se espera un segmento bloqueado por otro proceso
+BLOQUEO_VENCIDO = 300  # un candado más viejo lo dejó un proceso que se cortó
+
+# Decodificadores disponibles (reciben bytes o str). orjson se usa si está instalado.
+DECODIFICADORES = {"json": json.loads}
+try:
+    import orjson
+    DECODIFICADORES["orjson"] = orjson.loads
+except ImportError:
+    pass
+
+decodificador = "orjson" if "orjson" in DECODIFICADORES else "json"
+_loads = DECODIFICADORES[decodificador]
+
+# Campos que usan las estadísticas; el resto (descripcion, numero...) se descarta en modo ligero
+CAMPOS_VENTA = ('codigo', 'producto', 'valor', 'cantidad', 'timestamp')
+# Con catálogo, código y nombre se reemplazan por el id entero del producto ('pid')
+CAMPOS_VENTA_ID = ('valor', 'cantidad', 'timestamp')
+
+
+def usar_decodificador(nombre):
+    """Cambia el decodificador JSON usado por los lectores ("json" u "orjson")"""
+    global decodificador, _loads
+    if nombre not in DECODIFICADORES:
+        raise ValueError(f"Decodificador no disponible: {nombre} (hay: {', '.join(DECODIFICADORES)})")
+    decodificador = nombre
+    _loads = DECODIFICADORES[nombre]
+
+
+def leer_json(ruta):
+    """Lee un reporte en binario y lo decodifica con el decodificador activo"""
+    with open(ruta, 'rb') as f:
+        return _loads(f.read())
+
+
+def reducir_reporte(datos, catalogo=None):
+    """Deja solo fecha, totales, dispositivo, recibido y los campos de venta que usan las estadísticas
+
+    Con un catalogo.Catalogo cada venta guarda el id del producto en vez de sus textos.
+    """
+    if catalogo is None:
+        ventas = [{c: v[c] for c in CAMPOS_VENTA if c in v} for v in datos.get('ventas', [])]
+    else:
+        id_de = catalogo.id_de
+        ventas = []
+        for v in datos.get('ventas', []):
+            venta = {c: v[c] for c in CAMPOS_VENTA_ID if c in v}
+            venta['pid'] = id_de(v.get('codigo'), v.get('producto'))
+            ventas.append(venta)
+    reducido = {
+        'fecha': datos.get('fecha', '0000-00-00'),
+        'total_dia': datos.get('total_dia', 0),
+        'total_ventas': datos.get('total_ventas', 0),
+        'ventas': ventas
+    }
+    for campo in ('dispositivo', 'recibido'):  # los usa nucleo_analitico.ultimos_reportes()
+        if campo in datos:
+            reducido[campo] = datos[campo]
+    return reducido
+
+
+def marcar_recibido(datos, dispositivo=None):
+    """Anota en el reporte cuándo llegó ('recibido') y, si no lo trae, de qué caja es
+
+    El ESP32 manda el acumulado del día: de varias fotos del mismo día y caja
+    vale la más reciente (nucleo_analitico.ultimos_reportes).
+    """
+    datos.setdefault('recibido', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    if dispositivo and not datos.get('dispositivo'):
+        datos['dispositivo'] = dispositivo
+    return datos
+
+
+def escribir_atomico(ruta, contenido, durable=True):
+    """Escribe bytes en ruta sin dejar nunca un archivo a medias: temporal + fsync + rename
+
+    Con durable=False se omiten los fsync (datos que se pueden regenerar).
+    """
+    temporal = ruta + ".tmp"
+    try:
+        with open(temporal, 'wb') as f:
+            f.write(contenido)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    if durable:
+        sincronizar_carpeta(os.path.dirname(ruta))
+    return ruta
+
+
+def sincronizar_carpeta(carpeta):
+    """fsync de la carpeta para que el rename sobreviva a un corte de luz (solo POSIX)"""
+    if os.name != 'posix':
+        return
+    fd = os.open(carpeta or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def bloqueo(ruta, espera=ESPERA_BLOQUEO):
+    """Candado entre procesos sobre un archivo: ruta.lock existe mientras dura el bloque
+
+    Sirve igual entre hilos y entre procesos (la GUI con su servidor de ingesta y
+    la compactación lanzada desde el receptor) y no depende del sistema operativo.
+    """
+    candado = ruta + ".lock"
+    limite = time.monotonic() + espera
+    while True:
+        try:
+            os.close(os.open(candado, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(candado) > BLOQUEO_VENCIDO:
+                    os.remove(candado)
+                    continue
+            except OSError:
+                continue  # se liberó mientras se miraba
+            if time.monotonic() > limite:
+                raise TimeoutError(f"{ruta} sigue bloqueado por otro proceso ({candado})")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.remove(candado)
+
+
+def nombre_reporte(fecha, hora=None):
+    """Nombre del archivo JSON de un reporte"""
+    if hora is None:
+        hora = datetime.now().strftime('%H%M%S')
+    return f"reporte_{fecha}_{hora}.json"
+
+
+def guardar_json(datos, carpeta, hora=None, durable=True):
+    """Escribe el reporte como JSON indentado (para Drive y para leerlo a mano), de forma atómica"""
+    if not os.path.exists(carpeta):
+        os.makedirs(carpeta)
+
+    fecha = datos.get('fecha', datetime.now().strftime('%Y-%m-%d'))
+    ruta = os.path.join(carpeta, nombre_reporte(fecha, hora))
+    contenido = json.dumps(datos, indent=2, ensure_ascii=False).encode('utf-8')
+    return escribir_atomico(ruta, contenido, durable)
+
+
+def guardar_reporte(datos, carpeta, formato="json", hora=None):
+    """Guarda un reporte en el formato indicado y devuelve la ruta escrita"""
+    if formato == "ndjson":
+        return AlmacenNDJSON(carpeta).agregar(datos)
+    if formato == "json":
+        return guardar_json(datos, carpeta, hora)
+    raise ValueError(f"Formato de reportes desconocido: {formato} (use {', '.join(FORMATOS)})")
+
+
+def linea_ndjson(datos):
+    """Reporte compacto en una línea (bytes con salto de línea final)"""
+    return (json.dumps(datos, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+class AlmacenNDJSON:
+    """Reportes compactos, uno por línea, agrupados en un archivo por mes"""
+
+    def __init__(self, carpeta_reportes="reportes"):
+        self.carpeta = os.path.join(carpeta_reportes, CARPETA_SEGMENTOS)
+
+    def ruta_segmento(self, mes):
+        """Ruta del segmento de un mes (YYYY-MM)"""
+        return os.path.join(self.carpeta, f"{mes}.ndjson")
+
+    def bloquear(self, mes):
+        """Candado del segmento de un mes: la compactación no lo borra mientras se le añade"""
+        return bloqueo(self.ruta_segmento(mes))
+
+    def agregar(self, datos):
+        """Añade el reporte al final del segmento de su mes"""
+        if not os.path.exists(self.carpeta):
+            os.makedirs(self.carpeta)
+
+        fecha = datos.get('fecha', datetime.now().strftime('%Y-%m-%d'))
+        ruta = self.ruta_segmento(fecha[:7])
+        with self.bloquear(fecha[:7]), open(ruta, 'ab') as f:
+            # Una sola escritura por línea: un corte solo puede dejar la última a medias
+            f.write(linea_ndjson(datos))
+            f.flush()
+            os.fsync(f.fileno())
+        return ruta
+
+    def agregar_lote(self, reportes):
+        """Añade muchos reportes abriendo cada segmento una sola vez"""
+        if not os.path.exists(self.carpeta):
+            os.makedirs(self.carpeta)
+
+        por_mes = {}
+        for datos in reportes:
+            fecha = datos.get('fecha', datetime.now().strftime('%Y-%m-%d'))
+            por_mes.setdefault(fecha[:7], []).append(linea_ndjson(datos))
+
+        for mes, lineas in por_mes.items():
+            with self.bloquear(mes), open(self.ruta_segmento(mes), 'ab') as f:
+                f.write(b"".join(lineas))
+                f.flush()
+                os.fsync(f.fileno())
+        return sorted(por_mes)
+
+    def segmentos(self):
+        """Lista de meses (YYYY-MM) con segmento, en orden"""
+        if not os.path.exists(self.carpeta):
+            return []
+        return sorted(a[:-len(".ndjson")] for a in os.listdir(self.carpeta) if a.endswith(".ndjson"))
+
+    def leer(self, meses=None, al_fallar=None):
+        """Recorre los reportes de los segmentos sin cargarlos todos en memoria"""
+        for mes in self.segmentos():
+            if meses is not None and mes not in meses:
+                continue
+            ruta = self.ruta_segmento(mes)
+            with open(ruta, 'rb') as f:
+                for num, linea in enumerate(f, 1):
+                    if not linea.strip():
+                        continue
+                    try:
+                        yield _loads(linea)
+                    except ValueError as e:
+                        metricas.contar("reportes.errores")
+                        # Una línea cortada (p. ej. corte de luz) no invalida el resto del mes
+                        if al_fallar:
+                            al_fallar(f"{ruta}:{num}", e)
+
+    def exportar_json(self, carpeta_destino, meses=None):
+        """Vuelve a escribir los reportes como archivos JSON individuales"""
+        rutas = []
+        for i, datos in enumerate(self.leer(meses)):
+            rutas.append(guardar_json(datos, carpeta_destino, hora=f"{i:06d}", durable=False))
+        return rutas
+
+
+class ArchivoMensual:
+    """Meses cerrados: un NDJSON comprimido por mes en archivo/YYYY/MM/ y un índice
+
+    El índice guarda, por mes, el archivo vigente y el rango de fechas que
+    contiene; así los lectores saltan los meses fuera del rango pedido sin
+    abrirlos. Cada compactación escribe una versión nueva del archivo del mes y
+    solo después cambia el índice, de modo que un corte nunca deja el mes a medias.
+    """
+
+    def __init__(self, carpeta_reportes="reportes"):
+        self.carpeta_reportes = carpeta_reportes
+        self.carpeta = os.path.join(carpeta_reportes, CARPETA_ARCHIVO)
+        self.ruta_indice = os.path.join(self.carpeta, ARCHIVO_INDICE)
+
+    def indice(self):
+        """{"particiones": {mes: entrada}, "pendientes": [...]}; vacío si no se ha archivado nada"""
+        try:
+            with open(self.ruta_indice, 'rb') as f:
+                indice = _loads(f.read())
+        except FileNotFoundError:
+            indice = {}
+        indice.setdefault("particiones", {})
+        indice.setdefault("pendientes", [])
+        return indice
+
+    def guardar_indice(self, indice):
+        if not os.path.exists(self.carpeta):
+            os.makedirs(self.carpeta)
+        escribir_atomico(self.ruta_indice, json.dumps(indice, indent=2, ensure_ascii=False).encode('utf-8'))
+
+    def ruta_particion(self, mes, version):
+        """Ruta de una versión del archivo de un mes (YYYY-MM)"""
+        return os.path.join(self.carpeta, mes[:4], mes[5:7], f"reportes_{version:03d}.ndjson.gz")
+
+    def particiones(self, desde=None, hasta=None, indice=None):
+        """Meses archivados cuyo rango de fechas toca [desde, hasta] (YYYY-MM-DD, inclusive)"""
+        indice = indice or self.indice()
+        return sorted(mes for mes, p in indice["particiones"].items()
+                      if (not desde or p["hasta"] >= desde) and (not hasta or p["desde"] <= hasta))
+
+    def escribir(self, mes, reportes, version):
+        """Escribe una versión del mes y devuelve su entrada para el índice (aún sin guardarla)"""
+        ruta = self.ruta_particion(mes, version)
+        if not os.path.exists(os.path.dirname(ruta)):
+            os.makedirs(os.path.dirname(ruta))
+        contenido = gzip.compress(b"".join(linea_ndjson(r) for r in reportes), compresslevel=6, mtime=0)
+        escribir_atomico(ruta, contenido)
+        fechas = [r.get('fecha', '0000-00-00') for r in reportes]
+        return {
+            "ruta": os.path.relpath(ruta, self.carpeta_reportes).replace(os.sep, "/"),
+            "version": version,
+            "reportes": len(reportes),
+            "desde": min(fechas, default=f"{mes}-01"),
+            "hasta": max(fechas, default=f"{mes}-01"),
+            "total_dia": sum(r.get('total_dia', 0) for r in reportes),
+            "bytes": len(contenido),
+        }
+
+    def leer_particion(self, entrada, al_fallar=None):
+        """Reportes de un mes archivado"""
+        ruta = os.path.join(self.carpeta_reportes, entrada["ruta"])
+        try:
+            with open(ruta, 'rb') as f:
+                contenido = gzip.decompress(f.read())
+        except (OSError, EOFError) as e:
+            metricas.contar("reportes.errores")
+            if al_fallar:
+                al_fallar(ruta, e)
+            return
+        for num, linea in enumerate(contenido.split(b"\n"), 1):
+            if not linea.strip():
+                continue
+            try:
+                yield _loads(linea)
+            except ValueError as e:
+                metricas.contar("reportes.errores")
+                if al_fallar:
+                    al_fallar(f"{ruta}:{num}", e)
+
+    def leer(self, desde=None, hasta=None, al_fallar=None, indice=None):
+        indice = indice or self.indice()
+        for mes in self.particiones(desde, hasta, indice):
+            yield from self.leer_particion(indice["particiones"][mes], al_fallar)
+
+
+def _fecha_en_nombre(nombre):
+    """Fecha de 'reporte_YYYY-MM-DD_HHMMSS.json', o None si el nombre no sigue ese patrón"""
+    if nombre.startswith("reporte_") and len(nombre) >= 18 and nombre[12] == "-" and nombre[15] == "-":
+        return nombre[8:18]
+    return None
+
+
+def _recibido_en_nombre(nombre):
+    """'YYYY-MM-DD HH:MM:SS' de 'reporte_YYYY-MM-DD_HHMMSS....json' (reportes de antes de 'recibido')"""
+    hora = nombre[19:25]
+    if _fecha_en_nombre(nombre) and len(hora) == 6 and hora.isdigit():
+        return f"{nombre[8:18]} {hora[:2]}:{hora[2:4]}:{hora[4:]}"
+    return None
+
+
+def iterar_reportes(carpeta, al_fallar=None, ligero=False, catalogo=None, desde=None, hasta=None):
+    """Recorre todos los reportes de la carpeta: archivos JSON, segmentos NDJSON y meses archivados
+
+    Con ligero=True cada reporte pasa por reducir_reporte() (con el catálogo, si se da).
+    desde/hasta (YYYY-MM-DD, inclusive) limitan las fechas; lo que queda fuera por
+    nombre de archivo, mes del segmento o rango del índice ni se abre.
+    A los JSON sin 'recibido' se les pone la hora de su nombre de archivo.
+    """
+    if not os.path.exists(carpeta):
+        return
+
+    archivo = ArchivoMensual(carpeta)
+    indice = archivo.indice()
+    # Fuentes ya copiadas al archivo que una compactación interrumpida no alcanzó a borrar
+    omitir = set(indice["pendientes"])
+    filtrar = desde is not None or hasta is not None
+
+    def en_rango(fecha):
+        return (not desde or fecha >= desde) and (not hasta or fecha <= hasta)
+
+    def entregar(datos):
+        return reducir_reporte(datos, catalogo) if ligero else datos
+
+    for entrada in os.scandir(carpeta):
+        if not entrada.name.endswith('.json') or not entrada.is_file() or entrada.name in omitir:
+            continue
+        fecha = _fecha_en_nombre(entrada.name)
+        if filtrar and fecha and not en_rango(fecha):
+            continue
+        try:
+            datos = leer_json(entrada.path)
+        except Exception as e:
+            metricas.contar("reportes.errores")
+            if al_fallar:
+                al_fallar(entrada.path, e)
+            continue
+        if 'recibido' not in datos:
+            recibido = _recibido_en_nombre(entrada.name)
+            if recibido:
+                datos['recibido'] = recibido
+        if not filtrar or en_rango(datos.get('fecha', '')):
+            yield entregar(datos)
+
+    almacen = AlmacenNDJSON(carpeta)
+    meses = [m for m in almacen.segmentos()
+             if f"{CARPETA_SEGMENTOS}/{m}.ndjson" not in omitir
+             and (not desde or m >= desde[:7]) and (not hasta or m <= hasta[:7])]
+    for datos in almacen.leer(meses=meses, al_fallar=al_fallar):
+        if not filtrar or en_rango(datos.get('fecha', '')):
+            yield entregar(datos)
+
+    for datos in archivo.leer(desde, hasta, al_fallar, indice):
+        if not filtrar or en_rango(datos.get('fecha', '')):
+            yield entregar(datos)
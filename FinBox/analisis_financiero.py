@@ -1,85 +1,49 @@
-import matplotlib.pyplot as plt
-import json
-import os
-from datetime import datetime
-from collections import defaultdict, Counter
-import numpy as np
+import argparse
+import metricas
+import nucleo_analitico
+import perfilado
+
+# numpy y matplotlib se importan al primer uso: ver estadísticas o gráficas.
+
+
+def _pyplot():
+    """Importa pyplot y aplica el estilo oscuro del dashboard"""
+    import matplotlib.pyplot as plt
+    
+    plt.style.use('dark_background')
+    plt.rcParams['figure.facecolor'] = '#1e1e1e'
+    plt.rcParams['axes.facecolor'] = '#2b2b2b'
+    return plt
+
 
 class AnalizadorFinanciero:
     def __init__(self, carpeta_reportes="reportes"):
         self.carpeta_reportes = carpeta_reportes
         self.datos = []
+        self.analisis = None
         self.cargar_datos()
         
-        plt.style.use('dark_background')
-        plt.rcParams['figure.facecolor'] = '#1e1e1e'
-        plt.rcParams['axes.facecolor'] = '#2b2b2b'
-        
     def cargar_datos(self):
-        """Carga todos los reportes JSON"""
-        self.datos = []
-        if not os.path.exists(self.carpeta_reportes):
-            return
-        
-        archivos = [f for f in os.listdir(self.carpeta_reportes) if f.endswith('.json')]
-        for archivo in archivos:
-            try:
-                ruta = os.path.join(self.carpeta_reportes, archivo)
-                with open(ruta, 'r', encoding='utf-8') as f:
-                    self.datos.append(json.load(f))
-            except:
-                continue
-        
-        self.datos.sort(key=lambda x: x.get('fecha', '0000-00-00'))
+        """Carga todos los reportes y calcula sus métricas en una pasada"""
+        self.analisis = nucleo_analitico.cargar(self.carpeta_reportes)
+        self.datos = self.analisis.reportes
     
+    @metricas.medido("estadisticas.calcular")
     def calcular_estadisticas(self):
         """Calcula todas las estadísticas necesarias"""
-        if not self.datos:
+        if not self.analisis:
             return None
         
-        # Datos básicos
-        ingresos = [d.get('total_dia', 0) for d in self.datos]
-        ventas = [d.get('total_ventas', 0) for d in self.datos]
-        
-        # Productos
-        productos = []
-        for r in self.datos:
-            for v in r.get('ventas', []):
-                productos.append(v.get('producto', 'Desconocido'))
-        
-        # Datos mensuales
-        por_mes = defaultdict(lambda: {'ingresos': 0, 'ventas': 0})
-        for r in self.datos:
-            mes = r.get('fecha', '2000-01')[:7]  # YYYY-MM
-            por_mes[mes]['ingresos'] += r.get('total_dia', 0)
-            por_mes[mes]['ventas'] += r.get('total_ventas', 0)
-        
-        return {
-            # Promedios
-            'promedio_dia': np.mean(ingresos),
-            'promedio_mes': np.mean([m['ingresos'] for m in por_mes.values()]),
-            
-            # Media (igual que promedio)
-            'media': np.mean(ingresos),
-            
-            # Mediana
-            'mediana': np.median(ingresos),
-            
-            # Moda (producto más vendido)
-            'moda_producto': Counter(productos).most_common(1)[0] if productos else ('N/A', 0),
-            
-            # Percentiles
-            'percentil_25': np.percentile(ingresos, 25),
-            'percentil_50': np.percentile(ingresos, 50),
-            'percentil_75': np.percentile(ingresos, 75),
-            
-            # Otros
-            'total': sum(ingresos),
-            'mejor_dia': max(ingresos) if ingresos else 0,
-            'peor_dia': min(ingresos) if ingresos else 0,
-            'desviacion': np.std(ingresos),
-            'datos_mes': por_mes
-        }
+        a = self.analisis
+        stats = dict(a.distribucion())
+        stats.update({
+            'promedio_dia': a.promedio_dia,
+            'moda_producto': a.moda(),
+            'top_productos': a.top_productos(5),
+            'total': a.total_dinero,
+            'datos_mes': a.por_mes
+        })
+        return stats
     
     def mostrar_estadisticas(self):
         """Muestra estadísticas en texto"""
@@ -124,26 +88,27 @@ class AnalizadorFinanciero:
 ╚══════════════════════════════════════════════════════════╝
 """)
     
+    @metricas.medido("graficas.dashboard")
     def graficar_todo(self):
         """Genera todas las gráficas en un dashboard compacto"""
         if not self.datos:
             print("No hay datos")
             return
         
+        plt = _pyplot()
         stats = self.calcular_estadisticas()
-        fig = plt.figure(figsize=(14, 8))
+        fig = plt.figure(figsize=(14, 11))
         fig.suptitle('📊 DASHBOARD FINANCIERO', fontsize=16, fontweight='bold')
         
         # 1. Ventas diarias
-        ax1 = plt.subplot(2, 3, 1)
-        fechas = [d.get('fecha', '') for d in self.datos]
-        ingresos = [d.get('total_dia', 0) for d in self.datos]
+        ax1 = plt.subplot(3, 3, 1)
+        ingresos = self.analisis.ingresos
         ax1.plot(ingresos, marker='o', color='#4CAF50')
         ax1.set_title('💰 Ingresos Diarios')
         ax1.grid(True, alpha=0.3)
         
         # 2. Ingresos mensuales
-        ax2 = plt.subplot(2, 3, 2)
+        ax2 = plt.subplot(3, 3, 2)
         meses = sorted(stats['datos_mes'].keys())
         ingresos_mes = [stats['datos_mes'][m]['ingresos'] for m in meses]
         ax2.bar(range(len(meses)), ingresos_mes, color='#2196F3')
@@ -153,7 +118,7 @@ class AnalizadorFinanciero:
         ax2.grid(True, alpha=0.3, axis='y')
         
         # 3. Box plot
-        ax3 = plt.subplot(2, 3, 3)
+        ax3 = plt.subplot(3, 3, 3)
         ax3.boxplot(ingresos, patch_artist=True,
                    boxprops=dict(facecolor='#FF9800', alpha=0.7))
         ax3.set_title('📦 Distribución (Percentiles)')
@@ -161,13 +126,8 @@ class AnalizadorFinanciero:
         ax3.grid(True, alpha=0.3, axis='y')
         
         # 4. Producto más vendido
-        ax4 = plt.subplot(2, 3, 4)
-        todos_productos = []
-        for r in self.datos:
-            for v in r.get('ventas', []):
-                todos_productos.append(v.get('producto', 'N/A'))
-        
-        top5 = Counter(todos_productos).most_common(5)
+        ax4 = plt.subplot(3, 3, 4)
+        top5 = stats['top_productos']
         productos = [p[0][:15] for p in top5]
         cantidades = [p[1] for p in top5]
         ax4.barh(productos, cantidades, color='#9C27B0')
@@ -175,7 +135,7 @@ class AnalizadorFinanciero:
         ax4.invert_yaxis()
         
         # 5. Estadísticas clave
-        ax5 = plt.subplot(2, 3, 5)
+        ax5 = plt.subplot(3, 3, 5)
         ax5.axis('off')
         texto = f"""
 Estadísticas Clave
@@ -195,7 +155,7 @@ Desv. Est: ${stats['desviacion']:,.0f}
                 fontsize=9, verticalalignment='top', fontfamily='monospace')
         
         # 6. Producto más vendido
-        ax6 = plt.subplot(2, 3, 6)
+        ax6 = plt.subplot(3, 3, 6)
         ax6.axis('off')
         moda_texto = f"""
 Moda (Más Frecuente)
@@ -214,6 +174,20 @@ ventas en el periodo
                 fontsize=10, verticalalignment='top', fontfamily='monospace',
                 color='#4CAF50', fontweight='bold')
         
+        # 7. Pronóstico: últimos 90 días y el mes siguiente
+        import pronostico
+        p = pronostico.pronosticar(self.analisis)
+        ax7 = plt.subplot(3, 1, 3)
+        if p:
+            ax7.plot(p['dias'][-90:], p['historia'][-90:], color='#4CAF50', label='Ingresos')
+            ax7.plot(p['dias'][-90:][6:], pronostico.medias_moviles(p['historia'][-90:], 7),
+                    color='#FF9800', alpha=0.8, label='Media móvil 7 días')
+            ax7.plot(p['fechas'], p['pronostico'], color='#2196F3', linestyle='--',
+                    label=f"Pronóstico {p['mes']}: ${p['proximo_mes']:,.0f}")
+            ax7.legend(fontsize=8, loc='upper left')
+        ax7.set_title('🔮 Pronóstico de Ingresos')
+        ax7.grid(True, alpha=0.3)
+        
         plt.tight_layout()
         return fig
     
@@ -222,7 +196,7 @@ ventas en el periodo
         fig = self.graficar_todo()
         if fig:
             fig.savefig(nombre, dpi=200, bbox_inches='tight', facecolor='#1e1e1e')
-            plt.close(fig)
+            _pyplot().close(fig)
             print(f"✓ Exportado: {nombre}")
 
 
@@ -255,7 +229,7 @@ def main():
         
         elif opcion == "2":
             analizador.graficar_todo()
-            plt.show()
+            _pyplot().show()
         
         elif opcion == "3":
             nombre = input("Nombre (Enter=dashboard.png): ").strip()
@@ -272,5 +246,17 @@ def main():
             break
 
 
+# Acciones que se pueden perfilar sin menú (--profile-accion)
+ACCIONES_PERFIL = {
+    "cargar": lambda a: a.cargar_datos(),
+    "estadisticas": lambda a: a.calcular_estadisticas(),
+    "mostrar": lambda a: a.mostrar_estadisticas(),
+    "graficas": lambda a: _pyplot().close(a.graficar_todo()),
+}
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Análisis financiero")
+    perfilado.agregar_opciones(parser, ACCIONES_PERFIL)
+    args = parser.parse_args()
+    perfilado.ejecutar(args, main, ACCIONES_PERFIL, AnalizadorFinanciero)
\ No newline at end of file
@@ -0,0 +1,240 @@
+import os
+import json
+import threading
+from collections import deque
+from datetime import datetime
+import almacenamiento
+import metricas
+import nucleo_analitico
+
+# Detección de anomalías al recibir cada reporte del ESP32.
+#
+#   detector = DetectorAnomalias("reportes")
+#   alertas = detector.revisar(datos)   # revisa y actualiza las líneas base
+#
+# Por cada venta se compara el valor contra la ventana reciente de su producto
+# con un z-score robusto (mediana y MAD). La ventana tiene tamaño fijo, así que
+# cada revisión cuesta lo mismo sin importar cuántos reportes haya. También se
+# revisa que total_dia y total_ventas cuadren con el detalle y que la hora de
+# la venta sea habitual. Las líneas base se guardan en reportes/estado/.
+#
+# /reporte trae todo el día hasta ahora, así que de cada caja y fecha se
+# recuerda el número de la última venta revisada: volver a descargar el día
+# solo revisa (y suma a las líneas base) las ventas posteriores. Un código de
+# producto sin nombre se avisa una sola vez por producto.
+
+CARPETA_ESTADO = "estado"
+ARCHIVO_ESTADO = "anomalias.json"
+ARCHIVO_ALERTAS = "alertas.ndjson"
+
+VENTANA = 64          # valores recientes guardados por producto
+MIN_MUESTRAS = 8      # no se juzga un producto con menos historia
+UMBRAL_Z = 3.5        # z-score robusto (Iglewicz y Hoaglin)
+MIN_HORAS = 200       # ventas totales antes de juzgar la hora
+PROPORCION_HORA = 0.002
+MAX_VISTAS = 256      # cajas × días cuya última venta revisada se recuerda
+
+
+def z_robusto(valor, ventana):
+    """(z, mediana) del valor frente a la ventana, con 0.6745·(x - mediana) / MAD
+
+    Si MAD es 0 (precio fijo) se usa la desviación absoluta media, como en el
+    z-score modificado; si también es 0, cualquier valor distinto es atípico.
+    """
+    ordenados = sorted(ventana)
+    n = len(ordenados)
+    mediana = (ordenados[(n - 1) // 2] + ordenados[n // 2]) / 2
+    desvios = sorted(abs(v - mediana) for v in ordenados)
+    mad = (desvios[(n - 1) // 2] + desvios[n // 2]) / 2
+
+    if mad:
+        return 0.6745 * (valor - mediana) / mad, mediana
+    media_abs = sum(desvios) / n
+    if media_abs:
+        return (valor - mediana) / (1.253314 * media_abs), mediana
+    return (0.0 if valor == mediana else float('inf')), mediana
+
+
+class DetectorAnomalias:
+    """Líneas base móviles por producto y por hora, persistidas en disco"""
+
+    def __init__(self, carpeta_reportes="reportes", sembrar=True):
+        self.carpeta = os.path.join(carpeta_reportes, CARPETA_ESTADO)
+        self.ruta_estado = os.path.join(self.carpeta, ARCHIVO_ESTADO)
+        self.ruta_alertas = os.path.join(self.carpeta, ARCHIVO_ALERTAS)
+        self.productos = {}
+        self.horas = [0] * 24
+        self.reportes = 0
+        self.vistas = {}         # "dispositivo|fecha" -> número de la última venta revisada
+        self.sin_nombre = set()  # códigos ya avisados como producto_sin_nombre
+        self._lock = threading.Lock()  # la GUI revisa desde su hilo y desde el servidor de ingesta
+
+        if os.path.exists(self.ruta_estado):
+            self.cargar()
+        elif sembrar:
+            # Primera vez: las líneas base salen del historial ya guardado (una foto por caja y día)
+            historial = almacenamiento.iterar_reportes(carpeta_reportes, ligero=True)
+            for datos in nucleo_analitico.ultimos_reportes(historial):
+                clave, nuevas, ultima = self._nuevas(datos)
+                self.actualizar(datos, nuevas)
+                self.vistas[clave] = ultima
+            self._podar_vistas()
+            if self.reportes:
+                self.guardar()
+
+    def cargar(self):
+        try:
+            with open(self.ruta_estado, 'r', encoding='utf-8') as f:
+                estado = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Estado de anomalías ilegible, se empieza de cero: {e}")
+            return
+        self.productos = {p: deque(v, maxlen=VENTANA) for p, v in estado.get('productos', {}).items()}
+        self.horas = estado.get('horas', self.horas)
+        self.reportes = estado.get('reportes', 0)
+        self.vistas = estado.get('vistas', {})
+        self.sin_nombre = set(estado.get('sin_nombre', []))
+
+    def guardar(self):
+        if not os.path.exists(self.carpeta):
+            os.makedirs(self.carpeta)
+        estado = {
+            'actualizado': datetime.now().isoformat(timespec='seconds'),
+            'reportes': self.reportes,
+            'horas': self.horas,
+            'productos': {p: list(v) for p, v in self.productos.items()},
+            'vistas': self.vistas,
+            'sin_nombre': sorted(self.sin_nombre),
+        }
+        # Se puede rearmar desde los reportes: sin fsync, que se guarda en cada revisión
+        almacenamiento.escribir_atomico(self.ruta_estado, json.dumps(estado, ensure_ascii=False).encode('utf-8'),
+                                        durable=False)
+
+    def _nuevas(self, datos):
+        """(clave de caja y fecha, ventas posteriores a la última revisada, número de la última venta)
+
+        Sin 'numero' (reportes reducidos) vale la posición, que es como numera el ESP32.
+        """
+        clave = f"{datos.get('dispositivo') or ''}|{datos.get('fecha', '')}"
+        vista = self.vistas.get(clave, 0)
+        numeros = [v.get('numero', i) for i, v in enumerate(datos.get('ventas', []), 1)]
+        nuevas = [v for v, n in zip(datos.get('ventas', []), numeros) if n > vista]
+        # Si se borró una venta en la caja la última baja y se toma esa
+        return clave, nuevas, max(numeros, default=0)
+
+    def _podar_vistas(self):
+        if len(self.vistas) > MAX_VISTAS:
+            for clave in sorted(self.vistas, key=lambda c: c.rsplit('|', 1)[1])[:-MAX_VISTAS]:
+                del self.vistas[clave]
+
+    def actualizar(self, datos, ventas=None):
+        """Suma las ventas del reporte (o solo `ventas`) a las líneas base"""
+        for v in (datos.get('ventas', []) if ventas is None else ventas):
+            valor = v.get('valor', 0)
+            if valor > 0:
+                producto = v.get('producto', 'Desconocido')
+                ventana = self.productos.get(producto)
+                if ventana is None:
+                    ventana = self.productos[producto] = deque(maxlen=VENTANA)
+                ventana.append(valor)
+            hora = _hora(v.get('timestamp'))
+            if hora is not None:
+                self.horas[hora] += 1
+        self.reportes += 1
+
+    def evaluar(self, datos, ventas=None):
+        """Lista de alertas del reporte (o solo de `ventas`) sin modificar las líneas base"""
+        alertas = []
+        todas = datos.get('ventas', [])
+        ventas = todas if ventas is None else ventas
+
+        suma = sum(v.get('valor', 0) for v in todas)
+        if suma != datos.get('total_dia', suma):
+            alertas.append(_alerta("total_no_cuadra",
+                                   f"total_dia ${datos.get('total_dia', 0):,} ≠ suma de ventas ${suma:,}"))
+        if len(todas) != datos.get('total_ventas', len(todas)):
+            alertas.append(_alerta("conteo_no_cuadra",
+                                   f"total_ventas {datos.get('total_ventas')} ≠ {len(todas)} ventas en el detalle"))
+
+        total_horas = sum(self.horas)
+        sin_nombre = set(self.sin_nombre)
+        for v in ventas:
+            producto = str(v.get('producto', 'Desconocido'))
+            valor = v.get('valor', 0)
+            numero = v.get('numero', '?')
+
+            if valor <= 0:
+                alertas.append(_alerta("valor_invalido", f"Venta {numero} ({producto}): valor ${valor:,}", v))
+                continue
+            if producto.isdigit() and producto not in sin_nombre:
+                sin_nombre.add(producto)
+                alertas.append(_alerta("producto_sin_nombre",
+                                       f"Venta {numero}: código '{producto}' sin nombre de producto", v))
+
+            ventana = self.productos.get(producto)
+            if ventana is not None and len(ventana) >= MIN_MUESTRAS:
+                z, mediana = z_robusto(valor, ventana)
+                if abs(z) > UMBRAL_Z:
+                    desvio = f"z={z:+.1f}" if abs(z) != float('inf') else "precio fijo"
+                    alertas.append(_alerta("valor_atipico",
+                                           f"Venta {numero} ({producto}): ${valor:,} vs mediana "
+                                           f"${mediana:,.0f} ({desvio})", v))
+
+            hora = _hora(v.get('timestamp'))
+            if hora is not None and total_horas >= MIN_HORAS and self.horas[hora] < PROPORCION_HORA * total_horas:
+                alertas.append(_alerta("hora_inusual",
+                                       f"Venta {numero} ({producto}) a las {hora:02d}h, hora casi sin ventas", v))
+        return alertas
+
+    @metricas.medido("anomalias.revisar")
+    def revisar(self, datos):
+        """Evalúa las ventas nuevas del reporte, registra las alertas y actualiza y guarda las líneas base
+
+        Un reporte sin ventas nuevas (la misma foto del día otra vez) no genera alertas.
+        """
+        with self._lock:
+            clave, nuevas, ultima = self._nuevas(datos)
+            alertas = self.evaluar(datos, nuevas) if nuevas else []
+            for alerta in alertas:
+                metricas.contar(f"anomalias.{alerta['tipo']}")
+            if alertas:
+                self.registrar(datos, alertas)
+            self.sin_nombre.update(p for p in (str(v.get('producto', '')) for v in nuevas) if p.isdigit())
+            self.actualizar(datos, nuevas)
+            self.vistas[clave] = ultima
+            self._podar_vistas()
+            self.guardar()
+        return alertas
+
+    def registrar(self, datos, alertas):
+        """Añade las alertas al historial (una línea JSON por alerta)"""
+        if not os.path.exists(self.carpeta):
+            os.makedirs(self.carpeta)
+        ahora = datetime.now().isoformat(timespec='seconds')
+        with open(self.ruta_alertas, 'a', encoding='utf-8') as f:
+            for alerta in alertas:
+                f.write(json.dumps({'registrado': ahora, 'fecha': datos.get('fecha'), **alerta},
+                                   ensure_ascii=False) + "\n")
+
+
+def _hora(timestamp):
+    if timestamp and len(timestamp) >= 13 and timestamp[11:13].isdigit() and int(timestamp[11:13]) < 24:
+        return int(timestamp[11:13])
+    return None
+
+
+def _alerta(tipo, detalle, venta=None):
+    alerta = {'tipo': tipo, 'detalle': detalle}
+    if venta is not None:
+        alerta['venta'] = venta.get('numero')
+    return alerta
+
+
+def mostrar_alertas(alertas):
+    """Imprime las alertas de un reporte"""
+    if not alertas:
+        print("✓ Sin anomalías en el reporte")
+        return
+    print(f"\n⚠ {len(alertas)} posible(s) anomalía(s):")
+    for alerta in alertas:
+        print(f"  - [{alerta['tipo']}] {alerta['detalle']}")
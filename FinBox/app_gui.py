@@ -1,20 +1,22 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import requests
 import json
 import os
-from datetime import datetime
-from collections import Counter, defaultdict
-import numpy as np
+import importlib.util
 import threading
+import argparse
+from datetime import datetime
+import almacenamiento
+import anomalias
+import catalogo
+import diario
+import eventos
+import metricas
+import nucleo_analitico
 
-try:
-    from openai import OpenAI
-    OPENAI_OK = True
-except:
-    OPENAI_OK = False
+# matplotlib, numpy, requests, openai y descubrimiento (asyncio) se importan al
+# primer uso (pestaña de estadísticas, chat, ESP32) para que la ventana aparezca rápido.
+OPENAI_OK = importlib.util.find_spec("openai") is not None
 
 class AppFinanciera:
     def __init__(self, root):
@@ -27,17 +29,39 @@ class AppFinanciera:
         self.cargar_credenciales()
         
         self.openai_client = None
-        if OPENAI_OK and self.openai_key and len(self.openai_key) > 10:
-            try:
-                self.openai_client = OpenAI(api_key=self.openai_key)
-                print("✓ OpenAI conectado")
-            except Exception as e:
-                print(f"⚠ Error OpenAI: {e}")
+        self._analisis = None
+        self._detector = None
+        self._vistas = None
+        self._lock_vistas = threading.Lock()
+        self.version_datos = 0
+        self._en_vivo = {}  # (dispositivo, fecha) -> [ventas, total] aún sin reporte guardado
+        self._sondeo = None
+        self._detener_ingesta = None
+        self._grafica = None
+        self._dispositivos = None
+        self.openai_listo = bool(OPENAI_OK and self.openai_key and len(self.openai_key) > 10)
         
         if not os.path.exists(self.carpeta):
             os.makedirs(self.carpeta)
+        self.catalogo = catalogo.Catalogo(self.carpeta)
+        self.diario = diario.Diario(self.carpeta)
+        recuperados = self.diario.recuperar()
+        if recuperados:
+            print(f"✓ {len(recuperados)} reporte(s) recuperado(s) del diario")
+        
+        # Preguntas hechas sin internet: se responden solas cuando vuelve la conexión
+        import bandeja
+        self.bandeja = bandeja.Bandeja(self.carpeta)
+        if self.openai_listo:
+            self.bandeja.registrar("llm.pregunta", self._responder_pendiente, limite=2)
+        self.bandeja.iniciar()
         
         self.setup_ui()
+        
+        # Los reportes y ventas nuevos llegan por el bus; se aplican una vez por cuadro
+        eventos.suscribir("reporte", eventos.Agrupador(self.root.after, self.aplicar_reportes))
+        eventos.suscribir("venta", eventos.Agrupador(self.root.after, self.aplicar_ventas))
+        eventos.suscribir("bandeja", lambda tarea: self.root.after(0, self._mostrar_diferida, tarea))
     
     def cargar_credenciales(self):
         try:
@@ -45,13 +69,23 @@ class AppFinanciera:
                 creds = json.load(f)
             self.openai_key = creds.get('openai', {}).get('api_key', '')
             self.esp32_ip = creds.get('esp32', {}).get('ip', '192.168.1.100')
+            self.formato = creds.get('reportes', {}).get('formato', 'json')
             self.carpeta = "reportes"
             print(f"✓ Credenciales cargadas")
         except:
             self.openai_key = ""
             self.esp32_ip = "192.168.1.100"
+            self.formato = "json"
             self.carpeta = "reportes"
     
+    def obtener_cliente_openai(self):
+        """Crea el cliente de OpenAI la primera vez que se necesita"""
+        if self.openai_client is None:
+            from openai import OpenAI
+            self.openai_client = OpenAI(api_key=self.openai_key)
+            print("✓ OpenAI conectado")
+        return self.openai_client
+    
     def guardar_credenciales(self):
         try:
             with open(self.credentials_path, 'r', encoding='utf-8') as f:
@@ -83,6 +117,7 @@ class AppFinanciera:
         self.tab_esp32(notebook)
         self.tab_chat(notebook)
         self.tab_estadisticas(notebook)
+        self.tab_diagnostico(notebook)
         
     def tab_esp32(self, notebook):
         tab = tk.Frame(notebook, bg="#2b2b2b")
@@ -102,10 +137,19 @@ class AppFinanciera:
                  bg="#4CAF50", fg="white", font=("Arial", 9, "bold"), 
                  cursor="hand2", padx=15, pady=5).pack(side=tk.LEFT, padx=5)
         
+        tk.Button(frame_ip, text="🔍 Buscar en la red", command=self.buscar_dispositivos,
+                 bg="#607D8B", fg="white", font=("Arial", 9, "bold"),
+                 cursor="hand2", padx=15, pady=5).pack(side=tk.LEFT, padx=5)
+        
         tk.Button(tab, text="📥 OBTENER REPORTE DEL ESP32", 
                  command=self.obtener_reporte, bg="#2196F3", fg="white",
                  font=("Arial", 12, "bold"), cursor="hand2",
-                 padx=30, pady=20).pack(pady=30)
+                 padx=30, pady=20).pack(pady=(30, 5))
+        
+        self.btn_vivo = tk.Button(tab, text="📡 En vivo: apagado", command=self.alternar_en_vivo,
+                                  bg="#555555", fg="white", font=("Arial", 9, "bold"),
+                                  cursor="hand2", padx=20, pady=5)
+        self.btn_vivo.pack(pady=5)
         
         tk.Label(tab, text="📁 Reportes Guardados", bg="#2b2b2b", fg="white",
                 font=("Arial", 11, "bold")).pack(pady=10)
@@ -121,7 +165,7 @@ class AppFinanciera:
         self.lista_reportes.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scroll.config(command=self.lista_reportes.yview)
         
-        tk.Button(tab, text="🔄 Actualizar", command=self.actualizar_lista,
+        tk.Button(tab, text="🔄 Actualizar", command=self.recargar_datos,
                  bg="#FF9800", fg="white", font=("Arial", 9, "bold"),
                  cursor="hand2", padx=20, pady=5).pack(pady=10)
         
@@ -131,7 +175,7 @@ class AppFinanciera:
         tab = tk.Frame(notebook, bg="#2b2b2b")
         notebook.add(tab, text="💬 Chat IA")
         
-        if not OPENAI_OK or not self.openai_client:
+        if not self.openai_listo:
             mensaje = "⚠ OpenAI no configurado\n\n"
             if not OPENAI_OK:
                 mensaje += "Instala: pip install openai"
@@ -234,10 +278,53 @@ class AppFinanciera:
                  font=("Arial", 10, "bold"), cursor="hand2",
                  padx=20, pady=10).pack(side=tk.LEFT, padx=5)
         
+        tk.Button(frame_btn, text="🔥 Horas y Productos", 
+                 command=self.mostrar_cubo, bg="#FF5722", fg="white",
+                 font=("Arial", 10, "bold"), cursor="hand2",
+                 padx=20, pady=10).pack(side=tk.LEFT, padx=5)
+        
         self.text_stats = scrolledtext.ScrolledText(tab, bg="#0d0d0d", fg="white",
                                                     font=("Consolas", 9), wrap=tk.WORD)
         self.text_stats.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
     
+    def tab_diagnostico(self, notebook):
+        tab = tk.Frame(notebook, bg="#2b2b2b")
+        notebook.add(tab, text="🩺 Diagnóstico")
+        
+        frame_btn = tk.Frame(tab, bg="#1e1e1e")
+        frame_btn.pack(fill=tk.X, padx=20, pady=20)
+        
+        tk.Button(frame_btn, text="🔄 Actualizar", command=self.mostrar_metricas,
+                 bg="#4CAF50", fg="white", font=("Arial", 10, "bold"), cursor="hand2",
+                 padx=20, pady=10).pack(side=tk.LEFT, padx=5)
+        
+        tk.Button(frame_btn, text="💾 Exportar JSON", command=self.exportar_metricas,
+                 bg="#2196F3", fg="white", font=("Arial", 10, "bold"), cursor="hand2",
+                 padx=20, pady=10).pack(side=tk.LEFT, padx=5)
+        
+        tk.Button(frame_btn, text="🧹 Reiniciar", command=self.reiniciar_metricas,
+                 bg="#FF9800", fg="white", font=("Arial", 10, "bold"), cursor="hand2",
+                 padx=20, pady=10).pack(side=tk.LEFT, padx=5)
+        
+        tk.Button(frame_btn, text="🔎 Verificar reportes", command=self.verificar_reportes,
+                 bg="#9C27B0", fg="white", font=("Arial", 10, "bold"), cursor="hand2",
+                 padx=20, pady=10).pack(side=tk.LEFT, padx=5)
+        
+        tk.Button(frame_btn, text="📤 Enviar pendientes", command=self.vaciar_bandeja,
+                 bg="#607D8B", fg="white", font=("Arial", 10, "bold"), cursor="hand2",
+                 padx=20, pady=10).pack(side=tk.LEFT, padx=5)
+        
+        self.metricas_activas = tk.BooleanVar(value=metricas.activo)
+        tk.Checkbutton(frame_btn, text="Medir", variable=self.metricas_activas,
+                      command=lambda: metricas.activar(self.metricas_activas.get()),
+                      bg="#1e1e1e", fg="white", selectcolor="#0d0d0d",
+                      font=("Arial", 10)).pack(side=tk.LEFT, padx=15)
+        
+        self.text_metricas = scrolledtext.ScrolledText(tab, bg="#0d0d0d", fg="white",
+                                                       font=("Consolas", 9), wrap=tk.NONE)
+        self.text_metricas.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        self.mostrar_metricas()
+    
     # ========== FUNCIONES ESP32 ==========
     
     def guardar_ip(self):
@@ -247,27 +334,86 @@ class AppFinanciera:
         else:
             messagebox.showwarning("⚠", f"IP guardada en memoria\n{self.esp32_ip}")
     
+    def tabla_dispositivos(self):
+        """Tabla de dispositivos vistos en la red; se abre al primer uso"""
+        if self._dispositivos is None:
+            import descubrimiento
+            self._dispositivos = descubrimiento.TablaDispositivos(self.carpeta)
+        return self._dispositivos
+    
+    def buscar_esp32(self, completo=False):
+        """Busca el ESP32 en la red; si la misma caja está en otra IP la adopta y la guarda. True si cambió"""
+        import descubrimiento
+        tabla = self.tabla_dispositivos()
+        esperado = tabla.id_de(self.esp32_ip)  # la caja en uso, antes de actualizar la tabla
+        elegido, _ = descubrimiento.localizar(tabla, esperado, completo=completo)
+        if elegido is None or elegido['direccion'] == self.esp32_ip:
+            return False
+        self.esp32_ip = elegido['direccion']
+        self.guardar_credenciales()
+        self.root.after(0, self._mostrar_ip)
+        return True
+    
+    def _mostrar_ip(self):
+        self.entry_ip.delete(0, tk.END)
+        self.entry_ip.insert(0, self.esp32_ip)
+    
+    def buscar_dispositivos(self):
+        """Botón Buscar: recorre la red y muestra la tabla de dispositivos"""
+        def buscar():
+            try:
+                self.buscar_esp32(completo=True)
+            except Exception as e:
+                messagebox.showerror("Error", f"No se pudo buscar en la red:\n{e}")
+                return
+            dispositivos = self.tabla_dispositivos().recientes()
+            if not dispositivos:
+                messagebox.showwarning("🔍", "No se encontró ningún ESP32 en la red")
+                return
+            lineas = [f"{d['direccion']}  {d.get('id') or ''} ({d.get('ventas', '?')} ventas, visto {d.get('visto', '?')})"
+                      for d in dispositivos[:10]]
+            messagebox.showinfo("🔍 Dispositivos", f"En uso: {self.esp32_ip}\n\n" + "\n".join(lineas))
+        
+        threading.Thread(target=buscar, daemon=True).start()
+    
     def obtener_reporte(self):
         def obtener():
+            import requests
+            import descubrimiento
             try:
-                url = f"http://{self.esp32_ip}/reporte"
-                resp = requests.get(url, timeout=10)
+                try:
+                    with metricas.medir("esp32.reporte"):
+                        resp = requests.get(f"http://{self.esp32_ip}/reporte", timeout=(3, 10))
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    # La IP pudo cambiar (DHCP): se busca el ESP32 y se intenta una vez más
+                    if not self.buscar_esp32():
+                        raise
+                    with metricas.medir("esp32.reporte"):
+                        resp = requests.get(f"http://{self.esp32_ip}/reporte", timeout=(3, 10))
                 
                 if resp.status_code == 200:
-                    datos = resp.json()
-                    fecha = datos.get('fecha', datetime.now().strftime('%Y-%m-%d'))
-                    hora = datetime.now().strftime('%H%M%S')
-                    nombre = f"reporte_{fecha}_{hora}.json"
-                    
-                    with open(os.path.join(self.carpeta, nombre), 'w', encoding='utf-8') as f:
-                        json.dump(datos, f, indent=2, ensure_ascii=False)
-                    
-                    self.actualizar_lista()
-                    self.actualizar_stats_basicas()
-                    messagebox.showinfo("✓", f"Reporte guardado\nVentas: {datos.get('total_ventas', 0)}\nTotal: ${datos.get('total_dia', 0):,}")
+                    # Con el id de la caja y la hora, varias descargas del mismo día no se suman
+                    datos = almacenamiento.marcar_recibido(
+                        resp.json(), descubrimiento.identificar(self.esp32_ip, self.tabla_dispositivos()))
+                    entrada = self.diario.anotar(datos, self.formato)
+                    try:
+                        self.catalogo.sincronizar(self.esp32_ip)
+                    except Exception:
+                        metricas.contar("catalogo.errores")
+                    alertas = self.detector_anomalias().revisar(datos)
+                    ruta = self.diario.confirmar(entrada)
+                    eventos.publicar("reporte", {"datos": datos, "ruta": ruta})
+                    mensaje = f"Reporte guardado\nVentas: {datos.get('total_ventas', 0)}\nTotal: ${datos.get('total_dia', 0):,}"
+                    if alertas:
+                        detalle = "\n".join(f"• {a['detalle']}" for a in alertas[:8])
+                        messagebox.showwarning("⚠ Posibles anomalías", f"{mensaje}\n\n{detalle}")
+                    else:
+                        messagebox.showinfo("✓", mensaje)
                 else:
+                    metricas.contar("esp32.errores")
                     messagebox.showerror("Error", f"HTTP {resp.status_code}")
             except Exception as e:
+                metricas.contar("esp32.errores")
                 messagebox.showerror("Error", f"No se pudo conectar:\n{str(e)}")
         
         threading.Thread(target=obtener, daemon=True).start()
@@ -279,98 +425,205 @@ class AppFinanciera:
             for a in archivos:
                 self.lista_reportes.insert(tk.END, a)
     
+    def recargar_datos(self):
+        """Botón Actualizar: vuelve a leer la carpeta de reportes"""
+        self.actualizar_lista()
+        self.refrescar_vistas()
+    
+    # ========== MODO EN VIVO ==========
+    
+    def alternar_en_vivo(self):
+        """Enciende o apaga el sondeo de /status y el servidor de ingesta"""
+        if self._sondeo:
+            self._sondeo.detener()
+            self._sondeo = None
+            if self._detener_ingesta:
+                self._detener_ingesta()
+                self._detener_ingesta = None
+            self._en_vivo.clear()
+            self.btn_vivo.config(text="📡 En vivo: apagado", bg="#555555")
+            self.aplicar_ventas([])
+            return
+        
+        import servidor_ingesta
+        try:
+            self._detener_ingesta = servidor_ingesta.en_hilo(self.carpeta, self.formato,
+                                                             al_guardar=self.revisar_recibidos)
+            detalle = f"recibiendo en el puerto {servidor_ingesta.PUERTO}"
+        except OSError as e:
+            detalle = "sin servidor de ingesta"
+            messagebox.showwarning("⚠", f"No se pudo abrir el puerto {servidor_ingesta.PUERTO}:\n{e}\n\n"
+                                         f"Solo se consultará {self.esp32_ip}")
+        self._sondeo = eventos.SondeoESP32(self.esp32_ip)
+        self._sondeo.iniciar()
+        self.btn_vivo.config(text=f"🟢 En vivo ({detalle})", bg="#4CAF50")
+    
+    def detector_anomalias(self):
+        if self._detector is None:
+            self._detector = anomalias.DetectorAnomalias(self.carpeta)
+        return self._detector
+    
+    def revisar_recibidos(self, reportes):
+        """Reportes que llegaron al servidor de ingesta: las alertas quedan en alertas.ndjson"""
+        detector = self.detector_anomalias()
+        for datos in reportes:
+            detector.revisar(datos)
+    
+    def aplicar_ventas(self, lote):
+        """Ventas sueltas del día: solo se suman al resumen hasta que llegue el reporte"""
+        for evento in lote:
+            acumulado = self._en_vivo.setdefault((evento['dispositivo'], evento['fecha']), [0, 0])
+            acumulado[0] += 1
+            acumulado[1] += evento['venta'].get('valor', 0)
+        if hasattr(self, 'label_stats') and self._vistas is not None:
+            self.label_stats.config(text=self._resumen_en_vivo(self._vistas['resumen']))
+    
+    def aplicar_reportes(self, lote):
+        """Reportes ya guardados: un solo refresco incremental por lote"""
+        nuevos = []
+        for evento in lote:
+            datos = evento['datos']
+            dispositivo = datos.get('dispositivo')
+            for clave in [c for c in self._en_vivo if c[1] == datos.get('fecha')
+                          and (dispositivo is None or c[0] == dispositivo)]:
+                del self._en_vivo[clave]
+            nuevos.append(almacenamiento.reducir_reporte(datos, self.catalogo))
+            ruta = evento.get('ruta')
+            if ruta and ruta.endswith('.json'):
+                self.lista_reportes.insert(0, os.path.basename(ruta))
+        if self.formato == "json" and any(e.get('ruta') is None for e in lote):
+            self.actualizar_lista()
+        threading.Thread(target=self.refrescar_vistas, args=(nuevos,), daemon=True).start()
+    
+    def _resumen_en_vivo(self, resumen):
+        if not self._en_vivo:
+            return resumen
+        ventas = sum(v[0] for v in self._en_vivo.values())
+        total = sum(v[1] for v in self._en_vivo.values())
+        return f"{resumen}\n🟢 En vivo (sin reporte aún): {ventas} ventas, ${total:,.0f} COP"
+    
+    # ========== VISTAS DERIVADAS ==========
+    
+    def refrescar_vistas(self, nuevos=None, ruta=None):
+        """Recalcula todas las vistas tras un cambio de datos y las publica
+        
+        Con `nuevos` solo se recorren esos reportes; sin ellos se relee la carpeta.
+        """
+        with self._lock_vistas:
+            if nuevos is not None and self._analisis is not None:
+                self._analisis.agregar(nuevos)
+            else:
+                self._analisis = nucleo_analitico.cargar(self.carpeta, catalogo_productos=self.catalogo)
+            self.version_datos += 1
+            vistas = self._vistas = self.calcular_vistas(self._analisis, self.version_datos)
+        self.root.after(0, self.publicar_vistas, vistas, ruta)
+        return vistas
+    
+    @metricas.medido("vistas.calcular")
+    def calcular_vistas(self, a, version):
+        """Resumen, texto de estadísticas, series de gráficas y contexto del chat"""
+        stats = self._stats_de(a)
+        return {
+            'version': version,
+            'resumen': self._resumen_de(a),
+            'stats': stats,
+            'texto_stats': self._texto_stats(stats) if stats else "⚠ No hay datos",
+            'contexto': self._contexto_de(a),
+        }
+    
+    def publicar_vistas(self, vistas, ruta=None):
+        """Lleva las vistas a los widgets; descarta versiones ya reemplazadas"""
+        if vistas['version'] != self.version_datos:
+            return
+        if ruta and ruta.endswith('.json'):
+            self.lista_reportes.insert(0, os.path.basename(ruta))
+        if hasattr(self, 'label_stats'):
+            self.label_stats.config(text=self._resumen_en_vivo(vistas['resumen']))
+        # El panel de estadísticas y las gráficas solo se rehacen si ya se estaban mostrando
+        if hasattr(self, 'text_stats') and self.text_stats.get(1.0, 'end-1c').strip():
+            self.text_stats.delete(1.0, tk.END)
+            self.text_stats.insert(tk.END, vistas['texto_stats'])
+        if self._grafica and vistas['stats'] and self._grafica[0].winfo_exists():
+            ventana, fig, canvas = self._grafica
+            fig.clf()
+            self._dibujar_graficas(fig, vistas['stats'])
+            canvas.draw_idle()
+    
+    def obtener_vistas(self):
+        """Vistas de la versión actual; se calculan si los datos se invalidaron"""
+        with self._lock_vistas:
+            if self._vistas is None:
+                self._vistas = self.calcular_vistas(self.obtener_analisis(), self.version_datos)
+            return self._vistas
+    
     # ========== FUNCIONES ESTADÍSTICAS ==========
     
+    def obtener_analisis(self):
+        """Análisis compartido por todas las pestañas; se recalcula solo si cambian los datos"""
+        if self._analisis is None:
+            self._analisis = nucleo_analitico.cargar(self.carpeta, catalogo_productos=self.catalogo)
+        return self._analisis
+    
+    def invalidar_analisis(self):
+        self._analisis = None
+        self._vistas = None
+        self.version_datos += 1
+    
     def cargar_datos(self):
-        datos = []
-        if not os.path.exists(self.carpeta):
-            return datos
-        
-        for archivo in os.listdir(self.carpeta):
-            if archivo.endswith('.json'):
-                try:
-                    with open(os.path.join(self.carpeta, archivo), 'r', encoding='utf-8') as f:
-                        datos.append(json.load(f))
-                except:
-                    continue
-        return datos
+        return self.obtener_analisis().reportes
     
     def calcular_stats(self):
-        datos = self.cargar_datos()
-        if not datos:
+        return self.obtener_vistas()['stats']
+    
+    def _stats_de(self, a):
+        if not a:
             return None
         
-        ingresos = [d.get('total_dia', 0) for d in datos]
-        productos = []
-        for r in datos:
-            for v in r.get('ventas', []):
-                productos.append(v.get('producto', 'N/A'))
-        
-        por_mes = defaultdict(lambda: {'ingresos': 0})
-        for r in datos:
-            mes = r.get('fecha', '2000-01')[:7]
-            por_mes[mes]['ingresos'] += r.get('total_dia', 0)
-        
-        moda = Counter(productos).most_common(1)[0] if productos else ('N/A', 0)
-        
+        d = a.distribucion()
+        meses = a.meses()
         return {
-            'media': np.mean(ingresos),
-            'mediana': np.median(ingresos),
-            'moda': moda,
-            'p25': np.percentile(ingresos, 25),
-            'p50': np.percentile(ingresos, 50),
-            'p75': np.percentile(ingresos, 75),
-            'prom_dia': np.mean(ingresos),
-            'prom_mes': np.mean([m['ingresos'] for m in por_mes.values()]),
-            'desv': np.std(ingresos),
-            'total': sum(ingresos),
-            'datos': datos,
-            'ingresos': ingresos,
-            'por_mes': por_mes,
-            'productos': productos
+            'media': d['media'],
+            'mediana': d['mediana'],
+            'moda': a.moda(),
+            'p25': d['percentil_25'],
+            'p50': d['percentil_50'],
+            'p75': d['percentil_75'],
+            'prom_dia': a.promedio_dia,
+            'prom_mes': d['promedio_mes'],
+            'desv': d['desviacion'],
+            'total': a.total_dinero,
+            'datos': a.reportes,
+            'ingresos': a.ingresos,
+            'por_mes': a.por_mes,
+            'meses': meses,
+            'ingresos_mes': [a.por_mes[m]['ingresos'] for m in meses],
+            'top_productos': a.top_productos(5)
         }
     
     def actualizar_stats_basicas(self):
         """Actualiza las estadísticas básicas en el panel del chat"""
-        datos = self.cargar_datos()
-        if not datos:
-            texto = "No hay datos aún. Obtén un reporte del ESP32."
-            self.label_stats.config(text=texto)
-            return
-        
-        # Calcular estadísticas mejoradas
-        total_ingresos = sum(d.get('total_dia', 0) for d in datos)
-        total_dias = len(datos)
-        promedio_dia = total_ingresos / total_dias if total_dias > 0 else 0
-        
-        # Contar productos
-        productos_counter = Counter()
-        for reporte in datos:
-            for venta in reporte.get('ventas', []):
-                producto = venta.get('producto', 'Desconocido')
-                cantidad = venta.get('cantidad', 1)
-                productos_counter[producto] += cantidad
+        self.label_stats.config(text=self._resumen_en_vivo(self.obtener_vistas()['resumen']))
+    
+    def _resumen_de(self, a):
+        if not a:
+            return "No hay datos aún. Obtén un reporte del ESP32."
         
-        producto_top = productos_counter.most_common(1)[0] if productos_counter else ('N/A', 0)
+        producto_top = a.moda(por="unidades")
         
-        texto = f"""
-Total acumulado: ${total_ingresos:,.0f} COP
-Promedio por día: ${promedio_dia:,.0f} COP
-Días registrados: {total_dias}
+        return f"""
+Total acumulado: ${a.total_dinero:,.0f} COP
+Promedio por día: ${a.promedio_dia:,.0f} COP
+Días registrados: {a.dias}
 Producto estrella: {producto_top[0]}
 Unidades vendidas: {producto_top[1]}
         """.strip()
-        
-        self.label_stats.config(text=texto)
     
     def mostrar_stats(self):
-        stats = self.calcular_stats()
-        if not stats:
-            self.text_stats.delete(1.0, tk.END)
-            self.text_stats.insert(tk.END, "⚠ No hay datos")
-            return
-        
-        texto = f"""
+        self.text_stats.delete(1.0, tk.END)
+        self.text_stats.insert(tk.END, self.obtener_vistas()['texto_stats'])
+    
+    def _texto_stats(self, stats):
+        return f"""
 ╔════════════════════════════════════════════════════╗
 ║          ESTADÍSTICAS FINANCIERAS                  ║
 ╚════════════════════════════════════════════════════╝
@@ -404,10 +657,12 @@ Unidades vendidas: {producto_top[1]}
 
 ╚════════════════════════════════════════════════════╝
 """
-        self.text_stats.delete(1.0, tk.END)
-        self.text_stats.insert(tk.END, texto)
     
+    @metricas.medido("graficas.dashboard")
     def mostrar_graficas(self):
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        
         stats = self.calcular_stats()
         if not stats:
             messagebox.showwarning("⚠", "No hay datos")
@@ -419,7 +674,15 @@ Unidades vendidas: {producto_top[1]}
         ventana.configure(bg="#2b2b2b")
         
         fig = plt.Figure(figsize=(10, 7), facecolor='#1e1e1e')
+        self._dibujar_graficas(fig, stats)
         
+        canvas = FigureCanvasTkAgg(fig, ventana)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Queda registrada para redibujarse cuando lleguen datos nuevos
+        self._grafica = (ventana, fig, canvas)
+    
+    def _dibujar_graficas(self, fig, stats):
         ax1 = fig.add_subplot(2, 3, 1, facecolor='#2b2b2b')
         ax1.plot(stats['ingresos'], marker='o', color='#4CAF50', linewidth=2)
         ax1.set_title('💰 Ingresos Diarios', color='white')
@@ -427,9 +690,7 @@ Unidades vendidas: {producto_top[1]}
         ax1.tick_params(colors='white')
         
         ax2 = fig.add_subplot(2, 3, 2, facecolor='#2b2b2b')
-        meses = sorted(stats['por_mes'].keys())
-        ing_mes = [stats['por_mes'][m]['ingresos'] for m in meses]
-        ax2.bar(range(len(meses)), ing_mes, color='#2196F3')
+        ax2.bar(range(len(stats['meses'])), stats['ingresos_mes'], color='#2196F3')
         ax2.set_title('📅 Por Mes', color='white')
         ax2.tick_params(colors='white')
         
@@ -440,7 +701,7 @@ Unidades vendidas: {producto_top[1]}
         ax3.tick_params(colors='white')
         
         ax4 = fig.add_subplot(2, 3, 4, facecolor='#2b2b2b')
-        top5 = Counter(stats['productos']).most_common(5)
+        top5 = stats['top_productos']
         prods = [p[0][:12] for p in top5]
         vals = [p[1] for p in top5]
         ax4.barh(prods, vals, color='#9C27B0')
@@ -475,50 +736,136 @@ MODA
         """
         ax6.text(0.5, 0.5, moda_txt, transform=ax6.transAxes, fontsize=11,
                 ha='center', va='center', color='#4CAF50', fontweight='bold')
+    
+    @metricas.medido("graficas.cubo")
+    def mostrar_cubo(self):
+        """Mapa de calor día × hora y tendencia semanal de los productos principales"""
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from cubo_ventas import DIAS_SEMANA
+        
+        a = self.obtener_analisis()
+        cubo = a.cubo() if a else None
+        if not cubo:
+            messagebox.showwarning("⚠", "No hay datos")
+            return
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title("🔥 Ventas por Hora y Producto")
+        ventana.geometry("1000x700")
+        ventana.configure(bg="#2b2b2b")
         
+        fig = plt.Figure(figsize=(10, 7), facecolor='#1e1e1e')
+        
+        ax1 = fig.add_subplot(2, 1, 1, facecolor='#2b2b2b')
+        imagen = ax1.imshow(cubo.mapa_calor(), aspect='auto', cmap='inferno')
+        ax1.set_title('🔥 Ventas por Día y Hora', color='white')
+        ax1.set_yticks(range(7))
+        ax1.set_yticklabels(DIAS_SEMANA)
+        ax1.set_xticks(range(0, 24, 2))
+        ax1.set_xlabel('Hora', color='white')
+        ax1.tick_params(colors='white')
+        fig.colorbar(imagen, ax=ax1).ax.tick_params(colors='white')
+        
+        ax2 = fig.add_subplot(2, 1, 2, facecolor='#2b2b2b')
+        semanas, series = cubo.tendencia_productos(5, "semana", "ingresos")
+        for producto, serie in series.items():
+            ax2.plot(serie, linewidth=1.5, label=producto[:18])
+        paso = max(1, len(semanas) // 8)
+        ax2.set_xticks(range(0, len(semanas), paso))
+        ax2.set_xticklabels(semanas[::paso], rotation=30, fontsize=7)
+        ax2.set_title('📈 Ingresos Semanales - Top 5 Productos', color='white')
+        ax2.legend(fontsize=8, facecolor='#2b2b2b', labelcolor='white')
+        ax2.grid(True, alpha=0.3)
+        ax2.tick_params(colors='white')
+        
+        fig.tight_layout()
         canvas = FigureCanvasTkAgg(fig, ventana)
         canvas.draw()
         canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
     
+    # ========== FUNCIONES DIAGNÓSTICO ==========
+    
+    def mostrar_metricas(self):
+        import bandeja
+        self.text_metricas.delete(1.0, tk.END)
+        self.text_metricas.insert(tk.END, bandeja.texto_estado(self.bandeja.estado()) + "\n\n")
+        self.text_metricas.insert(tk.END, metricas.texto_resumen())
+    
+    def vaciar_bandeja(self):
+        """Intenta enviar ya todo lo que espera en la bandeja de salida"""
+        def vaciar():
+            import bandeja
+            enviadas, fallidas = self.bandeja.vaciar(forzar=True)
+            if bandeja.conectado():
+                texto = f"📤 {enviadas} enviada(s), {fallidas} con error\n\n"
+            else:
+                texto = "✗ Sigue sin haber conexión\n\n"
+            texto += bandeja.texto_estado(self.bandeja.estado())
+            self.root.after(0, self._mostrar_texto_diagnostico, texto)
+        
+        self.text_metricas.delete(1.0, tk.END)
+        self.text_metricas.insert(tk.END, "📤 Enviando pendientes...")
+        threading.Thread(target=vaciar, daemon=True).start()
+    
+    def exportar_metricas(self):
+        ruta = metricas.exportar()
+        messagebox.showinfo("✓", f"Métricas exportadas\n{ruta}")
+    
+    def reiniciar_metricas(self):
+        metricas.reiniciar()
+        self.mostrar_metricas()
+    
+    def verificar_reportes(self):
+        """Lista en el panel los reportes que no se pueden leer"""
+        def verificar():
+            try:
+                problemas = diario.verificar(self.carpeta)
+            except Exception as e:
+                metricas.contar("diario.errores")
+                self.root.after(0, self._mostrar_texto_diagnostico, f"✗ No se pudo revisar los reportes:\n{e}")
+                return
+            if problemas:
+                texto = f"⚠ {len(problemas)} reporte(s) ilegible(s):\n\n" + "\n".join(
+                    f"  {os.path.relpath(u, self.carpeta)}: {p}" for u, p in problemas)
+            else:
+                texto = "✓ Todos los reportes se pueden leer"
+            self.root.after(0, self._mostrar_texto_diagnostico, texto)
+        
+        self.text_metricas.delete(1.0, tk.END)
+        self.text_metricas.insert(tk.END, "🔎 Revisando reportes...")
+        threading.Thread(target=verificar, daemon=True).start()
+    
+    def _mostrar_texto_diagnostico(self, texto):
+        self.text_metricas.delete(1.0, tk.END)
+        self.text_metricas.insert(tk.END, texto)
+    
     # ========== FUNCIONES CHAT ==========
     
     def generar_contexto_ia(self):
         """Genera un contexto detallado para la IA con información de productos"""
-        datos = self.cargar_datos()
-        if not datos:
+        return self.obtener_vistas()['contexto']
+    
+    def _contexto_de(self, a):
+        if not a:
             return "No hay datos de ventas disponibles."
         
         contexto = "=== DATOS DETALLADOS DE VENTAS ===\n\n"
         
         # Estadísticas generales
-        total_ventas = sum(d.get('total_ventas', 0) for d in datos)
-        total_ingresos = sum(d.get('total_dia', 0) for d in datos)
-        
         contexto += f"ESTADÍSTICAS GENERALES:\n"
-        contexto += f"- Total de días con ventas: {len(datos)}\n"
-        contexto += f"- Total de transacciones: {total_ventas}\n"
-        contexto += f"- Ingresos totales: ${total_ingresos:,} COP\n"
-        contexto += f"- Promedio diario: ${total_ingresos/len(datos):,.0f} COP\n\n"
+        contexto += f"- Total de días con ventas: {a.dias}\n"
+        contexto += f"- Total de transacciones: {a.total_ventas}\n"
+        contexto += f"- Ingresos totales: ${a.total_dinero:,} COP\n"
+        contexto += f"- Promedio diario: ${a.promedio_dia:,.0f} COP\n\n"
         
         # Análisis de productos
-        productos_counter = Counter()
-        ingresos_por_producto = defaultdict(int)
-        
-        for reporte in datos:
-            for venta in reporte.get('ventas', []):
-                producto = venta.get('producto', 'Desconocido')
-                cantidad = venta.get('cantidad', 1)
-                valor = venta.get('valor', 0)
-                
-                productos_counter[producto] += cantidad
-                ingresos_por_producto[producto] += valor
-        
         contexto += "PRODUCTOS MÁS VENDIDOS (por unidades):\n"
-        for producto, unidades in productos_counter.most_common(10):
-            contexto += f"- {producto}: {unidades} unidades (${ingresos_por_producto[producto]:,} COP)\n"
+        for producto, unidades in a.top_productos(10, por="unidades"):
+            contexto += f"- {producto}: {unidades} unidades (${a.ingresos_producto[producto]:,} COP)\n"
         
         contexto += "\nDETALLE POR DÍA:\n"
-        for reporte in datos[-10:]:  # Últimos 10 días
+        for reporte in a.reportes[-10:]:  # Últimos 10 días
             fecha = reporte.get('fecha', 'N/A')
             total_dia = reporte.get('total_dia', 0)
             ventas_dia = reporte.get('total_ventas', 0)
@@ -526,11 +873,15 @@ MODA
             contexto += f"\n📅 {fecha}: {ventas_dia} ventas, Total: ${total_dia:,} COP\n"
             
             for venta in reporte.get('ventas', []):
-                producto = venta.get('producto', 'N/A')
+                producto = a.producto(venta)
                 cantidad = venta.get('cantidad', 1)
                 valor = venta.get('valor', 0)
                 contexto += f"   - {producto}: {cantidad} und × ${valor//cantidad:,} = ${valor:,}\n"
         
+        import pronostico
+        contexto += pronostico.texto_contexto(pronostico.pronosticar(a),
+                                              pronostico.pronosticar_productos(a.cubo()))
+        
         return contexto
     
     def agregar_chat(self, usuario, msg, tag):
@@ -553,15 +904,22 @@ MODA
         
         self.chat_entry.delete(0, tk.END)
         self.agregar_chat("Tú", msg, "user")
+        self._preguntar_en_hilo(msg, "chat")
+    
+    def _llamar_ia(self, pregunta, modo="chat"):
+        """Pregunta a OpenAI con el contexto actual; modo "chat" o "especifica". Lanza si falla"""
+        contexto = self.generar_contexto_ia()
         
-        def procesar():
-            try:
-                contexto = self.generar_contexto_ia()
-                
-                resp = self.openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": f"""Eres un asistente financiero experto en análisis de ventas de papelería. 
+        if modo == "especifica":
+            sistema = f"""Eres un analista financiero especializado. Responde de forma CONCISA y DIRECTA.
+
+DATOS:
+{contexto}
+
+Responde máximo 3 párrafos enfocándote solo en lo esencial."""
+            max_tokens, temperatura = 400, 0.5
+        else:
+            sistema = f"""Eres un asistente financiero experto en análisis de ventas de papelería. 
                         
                         DATOS DISPONIBLES:
                         {contexto}
@@ -571,20 +929,51 @@ MODA
                         2. Sé específico con nombres de productos y cantidades
                         3. Da recomendaciones prácticas basadas en los datos
                         4. Usa emojis para hacerlo amigable
-                        5. Menciona valores en pesos colombianos (COP)"""},
-                        {"role": "user", "content": msg}
-                    ],
-                    max_tokens=800,
-                    temperature=0.7
-                )
-                
-                respuesta = resp.choices[0].message.content
-                self.agregar_chat("IA", respuesta, "ia")
+                        5. Menciona valores en pesos colombianos (COP)"""
+            max_tokens, temperatura = 800, 0.7
+        
+        with metricas.medir("llm.chat"):
+            resp = self.obtener_cliente_openai().chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": sistema},
+                    {"role": "user", "content": pregunta}
+                ],
+                max_tokens=max_tokens,
+                temperature=temperatura
+            )
+        return resp.choices[0].message.content
+    
+    def _preguntar_en_hilo(self, pregunta, modo):
+        def procesar():
+            try:
+                self.agregar_chat("IA", self._llamar_ia(pregunta, modo), "ia")
             except Exception as e:
-                self.agregar_chat("Sistema", f"Error: {str(e)}", "ia")
+                import bandeja
+                if bandeja.conectado(forzar=True):
+                    self.agregar_chat("Sistema", f"Error: {str(e)}", "ia")
+                    return
+                self.bandeja.encolar("llm.pregunta", {
+                    "pregunta": pregunta,
+                    "modo": modo,
+                    "preguntada": datetime.now().isoformat(timespec='seconds'),
+                })
+                self.agregar_chat("Sistema", "📥 Sin conexión a internet: la pregunta quedó en la bandeja "
+                                  "de salida y la respuesta aparecerá aquí cuando vuelva la conexión", "ia")
         
         threading.Thread(target=procesar, daemon=True).start()
     
+    def _responder_pendiente(self, datos):
+        """Pregunta que quedó en la bandeja de salida; la respuesta también queda en estado/"""
+        import bandeja
+        respuesta = self._llamar_ia(datos["pregunta"], datos.get("modo", "chat"))
+        bandeja.guardar_respuesta(self.carpeta, datos["pregunta"], respuesta, datos.get("preguntada"))
+        return respuesta
+    
+    def _mostrar_diferida(self, tarea):
+        if tarea["tipo"] == "llm.pregunta" and hasattr(self, "chat_text"):
+            self.agregar_chat("IA (diferida)", f"«{tarea['datos']['pregunta']}»\n{tarea['resultado']}", "ia")
+    
     # ========== FUNCIONES BARRA DE PREGUNTAS ESPECÍFICAS ==========
     
     def hacer_pregunta_especifica(self):
@@ -594,38 +983,42 @@ MODA
         
         self.pregunta_entry.delete(0, tk.END)
         self.agregar_chat("Tú", f"[Específica] {pregunta}", "user")
-        
-        def procesar():
-            try:
-                contexto = self.generar_contexto_ia()
-                
-                resp = self.openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": f"""Eres un analista financiero especializado. Responde de forma CONCISA y DIRECTA.
-
-DATOS:
-{contexto}
-
-Responde máximo 3 párrafos enfocándote solo en lo esencial."""},
-                        {"role": "user", "content": pregunta}
-                    ],
-                    max_tokens=400,
-                    temperature=0.5
-                )
-                
-                respuesta = resp.choices[0].message.content
-                self.agregar_chat("IA", respuesta, "ia")
-            except Exception as e:
-                self.agregar_chat("Sistema", f"Error: {str(e)}", "ia")
-        
-        threading.Thread(target=procesar, daemon=True).start()
+        self._preguntar_en_hilo(pregunta, "especifica")
 
 
 def main():
     root = tk.Tk()
     app = AppFinanciera(root)
+    if os.environ.get("FINBOX_MEDIR_INICIO"):
+        # Usado por medir_build.py: cerrar apenas la ventana está lista
+        root.after_idle(root.destroy)
     root.mainloop()
 
+def crear_app_oculta():
+    """App sin mostrar la ventana, para perfilar acciones sueltas"""
+    root = tk.Tk()
+    root.withdraw()
+    return AppFinanciera(root)
+
+
+# Acciones que se pueden perfilar sin interacción (--profile-accion)
+ACCIONES_PERFIL = {
+    "lista": lambda app: app.actualizar_lista(),
+    # Las vistas se guardan en caché: se invalida para medir el cálculo completo
+    "estadisticas": lambda app: (app.invalidar_analisis(), app.calcular_stats()),
+    "contexto": lambda app: (app.invalidar_analisis(), app.generar_contexto_ia()),
+    "refresco": lambda app: app.refrescar_vistas(),
+    "cubo": lambda app: (app.invalidar_analisis(), app.obtener_analisis().cubo()),
+}
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # En el ejecutable de PyInstaller los procesos de diario.verificar() vuelven a
+    # arrancar este archivo; freeze_support() los desvía antes de abrir la GUI
+    import multiprocessing
+    multiprocessing.freeze_support()
+    import perfilado
+    parser = argparse.ArgumentParser(description="Sistema de Gestión Financiera (GUI)")
+    perfilado.agregar_opciones(parser, ACCIONES_PERFIL)
+    args = parser.parse_args()
+    perfilado.ejecutar(args, main, ACCIONES_PERFIL, crear_app_oculta)
\ No newline at end of file
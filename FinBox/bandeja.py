@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import itertools
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import almacenamiento
+import eventos
+import metricas
+
+# Bandeja de salida: lo que necesita internet (subidas a Drive, preguntas a la
+# IA) se guarda en disco y se envía cuando hay conexión.
+#
+#   bandeja = Bandeja("reportes")                          # reportes/estado/bandeja/
+#   bandeja.registrar("drive.archivo", subir, limite=1)    # subir(datos) lanza si falla
+#   bandeja.encolar("drive.archivo", {"ruta": ruta}, clave=ruta)
+#   bandeja.iniciar()                                      # la vacía sola cada 30 s
+#   print(texto_estado(bandeja.estado()))
+#
+# Cada tarea es un archivo JSON, así sobrevive a cierres del programa y cortes
+# de luz. Antes de intentar nada se abre una conexión TCP corta a Google o a
+# OpenAI (el resultado se recuerda unos segundos), y sin conexión no se gasta
+# ningún intento. Las tareas que fallan se reintentan con espera creciente;
+# las que no tienen arreglo (archivo borrado, 4xx de la API, ErrorPermanente)
+# o agotan MAX_INTENTOS pasan a bandeja/fallidas/, de donde reintentar_fallidas()
+# las devuelve. Al terminar una tarea se publica el evento "bandeja" con su resultado.
+
+CARPETA_ESTADO = "estado"
+CARPETA_BANDEJA = "bandeja"
+CARPETA_FALLIDAS = "fallidas"
+ARCHIVO_RESPUESTAS = "respuestas.ndjson"
+CONCURRENCIA = 4
+INTERVALO = 30  # segundos entre revisiones del hilo de fondo
+ESPERA_MINIMA = 30  # segundos antes del primer reintento; se duplica en cada fallo
+ESPERA_MAXIMA = 3600
+MAX_INTENTOS = 10  # con la espera creciente son unas 6 horas de reintentos
+RECLAMO_VENCIDO = 600  # una tarea tomada hace más que esto se da por abandonada
+PRUEBAS_CONEXION = (("www.googleapis.com", 443), ("api.openai.com", 443))
+VIGENCIA_CONEXION = 15  # segundos que se recuerda el resultado de conectado()
+
+_conexion = {"cuando": float('-inf'), "valor": False}
+
+
+class ErrorPermanente(Exception):
+    """Lo lanza un manejador cuando reintentar la tarea no serviría de nada"""
+
+
+def es_permanente(e):
+    """True si el error no se arregla reintentando: datos o archivos que faltan, o un 4xx"""
+    if isinstance(e, (ErrorPermanente, FileNotFoundError, IsADirectoryError, KeyError, TypeError, ValueError)):
+        return True
+    # openai pone status_code; googleapiclient, resp.status
+    estado = getattr(e, "status_code", None) or getattr(getattr(e, "resp", None), "status", None)
+    try:
+        estado = int(estado)
+    except (TypeError, ValueError):
+        return False
+    return 400 <= estado < 500 and estado not in (408, 409, 429)
+
+
+def conectado(timeout=1.0, forzar=False):
+    """True si se puede abrir una conexión TCP a Google o a OpenAI"""
+    ahora = time.monotonic()
+    if not forzar and ahora - _conexion["cuando"] < VIGENCIA_CONEXION:
+        return _conexion["valor"]
+    valor = False
+    for host, puerto in PRUEBAS_CONEXION:
+        try:
+            socket.create_connection((host, puerto), timeout).close()
+            valor = True
+            break
+        except OSError:
+            continue
+    _conexion.update(cuando=ahora, valor=valor)
+    metricas.contar("bandeja.sondeos")
+    return valor
+
+
+def guardar_respuesta(carpeta_reportes, pregunta, respuesta, preguntada=None):
+    """Añade una respuesta diferida de la IA a reportes/estado/respuestas.ndjson; devuelve la ruta"""
+    ruta = os.path.join(carpeta_reportes, CARPETA_ESTADO, ARCHIVO_RESPUESTAS)
+    if not os.path.exists(os.path.dirname(ruta)):
+        os.makedirs(os.path.dirname(ruta))
+    linea = almacenamiento.linea_ndjson({
+        "pregunta": pregunta,
+        "respuesta": respuesta,
+        "preguntada": preguntada,
+        "respondida": datetime.now().isoformat(timespec='seconds'),
+    })
+    with open(ruta, 'ab') as f:
+        f.write(linea)
+    return ruta
+
+
+class Bandeja:
+    """Cola en disco de tareas pendientes por falta de conexión"""
+
+    def __init__(self, carpeta_reportes="reportes", concurrencia=CONCURRENCIA):
+        self.carpeta_reportes = carpeta_reportes
+        self.carpeta = os.path.join(carpeta_reportes, CARPETA_ESTADO, CARPETA_BANDEJA)
+        self.carpeta_fallidas = os.path.join(self.carpeta, CARPETA_FALLIDAS)
+        self.concurrencia = concurrencia
+        self._manejadores = {}  # tipo -> (funcion, semáforo)
+        self._contador = itertools.count()
+        self._vaciando = threading.Lock()
+        self._parar = threading.Event()
+        self._hilo = None
+        self._devolver_abandonadas()
+
+    def registrar(self, tipo, funcion, limite=None):
+        """funcion(datos) hace la tarea y lanza si falla; limite acota cuántas corren a la vez"""
+        self._manejadores[tipo] = (funcion, threading.BoundedSemaphore(limite or self.concurrencia))
+
+    def encolar(self, tipo, datos, clave=None):
+        """Guarda la tarea; con la misma clave reemplaza a la anterior en vez de duplicarla"""
+        if not os.path.exists(self.carpeta):
+            os.makedirs(self.carpeta)
+        if clave is None:
+            nombre = f"{time.time_ns()}_{os.getpid()}_{next(self._contador)}.json"
+        else:
+            nombre = hashlib.sha1(f"{tipo}:{clave}".encode('utf-8')).hexdigest()[:20] + ".json"
+        ruta = os.path.join(self.carpeta, nombre)
+
+        creada = time.time()
+        if os.path.exists(ruta):
+            try:
+                creada = almacenamiento.leer_json(ruta).get("creada", creada)
+            except (OSError, ValueError):
+                pass
+        tarea = {"tipo": tipo, "datos": datos, "creada": creada, "intentos": 0, "proxima": 0, "error": None}
+        self._escribir(ruta, tarea)
+        metricas.contar("bandeja.encoladas")
+        return nombre
+
+    def _escribir(self, ruta, tarea):
+        almacenamiento.escribir_atomico(ruta, json.dumps(tarea, ensure_ascii=False).encode('utf-8'))
+
+    def tareas(self):
+        """[(nombre, tarea)] pendientes, de la más antigua a la más nueva"""
+        if not os.path.exists(self.carpeta):
+            return []
+        tareas = []
+        for nombre in os.listdir(self.carpeta):
+            if not nombre.endswith(".json"):
+                continue
+            try:
+                tareas.append((nombre, almacenamiento.leer_json(os.path.join(self.carpeta, nombre))))
+            except FileNotFoundError:
+                continue  # la tomó otro hilo o proceso mientras se listaba
+            except ValueError as e:
+                metricas.contar("bandeja.errores")
+                print(f"⚠ Tarea ilegible en la bandeja, se omite: {nombre}: {e}")
+        return sorted(tareas, key=lambda t: t[1].get("creada", 0))
+
+    def estado(self):
+        """Profundidad y antigüedad de la cola, para el diagnóstico"""
+        ahora = time.time()
+        tareas = [t for _, t in self.tareas()]
+        por_tipo = {}
+        for t in tareas:
+            por_tipo[t["tipo"]] = por_tipo.get(t["tipo"], 0) + 1
+        return {
+            "pendientes": len(tareas),
+            "por_tipo": por_tipo,
+            "mas_antigua_s": round(ahora - min(t["creada"] for t in tareas)) if tareas else 0,
+            "proxima_s": max(0, round(min(t["proxima"] for t in tareas) - ahora)) if tareas else 0,
+            "con_errores": sum(1 for t in tareas if t.get("error")),
+            "fallidas": len(self.fallidas()),
+            "conectado": _conexion["valor"],
+        }
+
+    def fallidas(self):
+        """Nombres de las tareas que se dejaron de reintentar"""
+        if not os.path.exists(self.carpeta_fallidas):
+            return []
+        return sorted(n for n in os.listdir(self.carpeta_fallidas) if n.endswith(".json"))
+
+    def reintentar_fallidas(self):
+        """Devuelve a la cola las tareas fallidas, con los intentos a cero; devuelve cuántas"""
+        devueltas = 0
+        for nombre in self.fallidas():
+            ruta = os.path.join(self.carpeta_fallidas, nombre)
+            try:
+                tarea = almacenamiento.leer_json(ruta)
+            except (OSError, ValueError):
+                continue
+            tarea.update(intentos=0, proxima=0, error=None)
+            tarea.pop("fallida", None)
+            destino = os.path.join(self.carpeta, nombre)
+            if not os.path.exists(destino):  # con la misma clave, la tarea nueva manda
+                self._escribir(destino, tarea)
+                devueltas += 1
+            os.remove(ruta)
+        return devueltas
+
+    def _reclamar(self, nombre):
+        """Toma la tarea renombrándola; None si otro hilo o proceso ya la tomó"""
+        ruta = os.path.join(self.carpeta, nombre)
+        tomada = ruta + ".en_curso"
+        try:
+            os.rename(ruta, tomada)
+        except OSError:  # ya no está, o en Windows la tiene abierta otro proceso
+            return None
+        os.utime(tomada)
+        return tomada
+
+    def _devolver(self, tomada):
+        """Devuelve una tarea tomada a la cola, salvo que entretanto se encolara otra con su clave"""
+        ruta = tomada[:-len(".en_curso")]
+        try:
+            os.link(tomada, ruta)  # a diferencia de os.replace, no pisa la tarea nueva
+        except FileExistsError:
+            pass
+        except OSError:  # sistema de archivos sin enlaces duros
+            if not os.path.exists(ruta):
+                os.replace(tomada, ruta)
+                return
+        os.remove(tomada)
+
+    def _devolver_abandonadas(self):
+        """Vuelve a poner en la cola las tareas que tomó un proceso que se cerró a mitad"""
+        if not os.path.exists(self.carpeta):
+            return
+        for nombre in os.listdir(self.carpeta):
+            ruta = os.path.join(self.carpeta, nombre)
+            if nombre.endswith(".en_curso") and time.time() - os.path.getmtime(ruta) > RECLAMO_VENCIDO:
+                self._devolver(ruta)
+
+    def _descartar(self, tomada, tarea):
+        """Pasa la tarea a fallidas/ (para revisarla o reintentar_fallidas())"""
+        if not os.path.exists(self.carpeta_fallidas):
+            os.makedirs(self.carpeta_fallidas)
+        tarea["fallida"] = time.time()
+        nombre = os.path.basename(tomada)[:-len(".en_curso")]
+        self._escribir(os.path.join(self.carpeta_fallidas, nombre), tarea)
+        os.remove(tomada)
+        metricas.contar("bandeja.descartadas")
+        print(f"⚠ Tarea {tarea['tipo']} descartada tras {tarea['intentos']} intento(s): {tarea['error']}")
+
+    def _ejecutar(self, nombre, tarea):
+        funcion, limite = self._manejadores[tarea["tipo"]]
+        tomada = self._reclamar(nombre)
+        if tomada is None:
+            return None
+        try:
+            with limite, metricas.medir(f"bandeja.{tarea['tipo']}"):
+                resultado = funcion(tarea["datos"])
+        except Exception as e:
+            tarea["intentos"] += 1
+            tarea["error"] = f"{type(e).__name__}: {e}"[:300]
+            metricas.contar("bandeja.fallos")
+            if es_permanente(e) or tarea["intentos"] >= MAX_INTENTOS:
+                self._descartar(tomada, tarea)
+                return False
+            tarea["proxima"] = time.time() + min(ESPERA_MINIMA * 2 ** (tarea["intentos"] - 1), ESPERA_MAXIMA)
+            self._escribir(tomada, tarea)
+            self._devolver(tomada)
+            return False
+        os.remove(tomada)
+        metricas.contar("bandeja.enviadas")
+        eventos.publicar("bandeja", {**tarea, "resultado": resultado})
+        return True
+
+    @metricas.medido("bandeja.vaciar")
+    def vaciar(self, forzar=False):
+        """Envía las tareas que ya tocan (todas con forzar=True) si hay conexión; devuelve (enviadas, fallidas)"""
+        if not self._vaciando.acquire(blocking=False):
+            return 0, 0  # ya se está vaciando en otro hilo
+        try:
+            ahora = time.time()
+            listas = [(n, t) for n, t in self.tareas()
+                      if t["tipo"] in self._manejadores and (forzar or t["proxima"] <= ahora)]
+            if not listas or not conectado(forzar=forzar):
+                return 0, 0
+            with ThreadPoolExecutor(max_workers=self.concurrencia) as ejecutor:
+                resultados = list(ejecutor.map(lambda t: self._ejecutar(*t), listas))
+            return resultados.count(True), resultados.count(False)
+        finally:
+            self._vaciando.release()
+
+    def iniciar(self, intervalo=INTERVALO):
+        """Hilo de fondo que vacía la bandeja cada `intervalo` segundos"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._ciclo, args=(intervalo,), daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+
+    def _ciclo(self, intervalo):
+        while not self._parar.is_set():
+            try:
+                self.vaciar()
+            except Exception as e:
+                metricas.contar("bandeja.errores")
+                print(f"⚠ Error al vaciar la bandeja: {e}")
+            self._parar.wait(intervalo)
+
+
+def _duracion(segundos):
+    if segundos < 60:
+        return f"{segundos} s"
+    if segundos < 3600:
+        return f"{segundos // 60} min"
+    if segundos < 86400:
+        return f"{segundos // 3600} h"
+    return f"{segundos // 86400} d"
+
+
+def texto_estado(estado):
+    """Resumen de la bandeja para la consola o la pestaña de diagnóstico"""
+    conexion = "✓ con conexión" if estado["conectado"] else "✗ sin conexión (o sin revisar)"
+    fallidas = (f"\n   ⚠ {estado['fallidas']} tarea(s) descartada(s) en "
+                f"{CARPETA_ESTADO}/{CARPETA_BANDEJA}/{CARPETA_FALLIDAS}/" if estado.get("fallidas") else "")
+    if not estado["pendientes"]:
+        return f"📤 Bandeja de salida: vacía ({conexion}){fallidas}"
+    tipos = ", ".join(f"{tipo}: {n}" for tipo, n in sorted(estado["por_tipo"].items()))
+    return (f"📤 Bandeja de salida: {estado['pendientes']} pendiente(s) ({tipos})\n"
+            f"   La más antigua espera hace {_duracion(estado['mas_antigua_s'])}; "
+            f"próximo intento en {_duracion(estado['proxima_s'])}; "
+            f"{estado['con_errores']} con errores; {conexion}{fallidas}")
@@ -0,0 +1,171 @@
+import sqlite3
+import hashlib
+import json
+import os
+import argparse
+import almacenamiento
+
+# Base de datos SQLite opcional con los reportes. Los archivos JSON/NDJSON
+# siguen siendo la fuente original; aquí se indexan para consultas agregadas.
+
+RUTA_BD = os.path.join("reportes", "finbox.db")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    huella TEXT NOT NULL UNIQUE,
+    fecha TEXT NOT NULL,
+    total_ventas INTEGER NOT NULL,
+    total_dia INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    fecha TEXT NOT NULL,
+    numero INTEGER,
+    codigo TEXT,
+    producto TEXT NOT NULL,
+    descripcion TEXT,
+    valor INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 1,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reports_fecha ON reports(fecha);
+CREATE INDEX IF NOT EXISTS idx_sales_fecha ON sales(fecha);
+CREATE INDEX IF NOT EXISTS idx_sales_producto ON sales(producto);
+"""
+
+
+def huella_reporte(datos):
+    """Identificador estable del contenido de un reporte (evita duplicados al reimportar)"""
+    canonico = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(canonico.encode('utf-8')).hexdigest()
+
+
+class BaseDatosReportes:
+    def __init__(self, ruta=RUTA_BD):
+        carpeta = os.path.dirname(ruta)
+        if carpeta and not os.path.exists(carpeta):
+            os.makedirs(carpeta)
+
+        self.ruta = ruta
+        self.conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.execute("PRAGMA foreign_keys=ON")
+        self.conexion.executescript(ESQUEMA)
+
+    def _insertar(self, datos):
+        """Inserta un reporte sin confirmar la transacción; devuelve su id o None si ya existía"""
+        cursor = self.conexion.execute(
+            "INSERT OR IGNORE INTO reports (huella, fecha, total_ventas, total_dia) VALUES (?, ?, ?, ?)",
+            (huella_reporte(datos), datos.get('fecha', '0000-00-00'),
+             datos.get('total_ventas', 0), datos.get('total_dia', 0))
+        )
+        if cursor.rowcount == 0:
+            return None
+
+        report_id = cursor.lastrowid
+        fecha = datos.get('fecha', '0000-00-00')
+        self.conexion.executemany(
+            "INSERT INTO sales (report_id, fecha, numero, codigo, producto, descripcion, valor, cantidad, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(report_id, fecha, v.get('numero'), v.get('codigo'), v.get('producto', 'Desconocido'),
+              v.get('descripcion'), v.get('valor', 0), v.get('cantidad', 1), v.get('timestamp'))
+             for v in datos.get('ventas', [])]
+        )
+        return report_id
+
+    def insertar_reporte(self, datos):
+        """Guarda un reporte y sus ventas; devuelve su id o None si ya estaba"""
+        with self.conexion:
+            return self._insertar(datos)
+
+    def importar_carpeta(self, carpeta="reportes"):
+        """Importa de una vez todos los reportes de la carpeta (JSON y NDJSON)"""
+        nuevos = repetidos = 0
+        with self.conexion:
+            for datos in almacenamiento.iterar_reportes(carpeta):
+                if self._insertar(datos) is None:
+                    repetidos += 1
+                else:
+                    nuevos += 1
+        return nuevos, repetidos
+
+    # ========== CONSULTAS ==========
+
+    def resumen(self):
+        """Totales generales del periodo"""
+        fila = self.conexion.execute(
+            "SELECT COUNT(*), COALESCE(SUM(total_ventas), 0), COALESCE(SUM(total_dia), 0), "
+            "MIN(fecha), MAX(fecha) FROM reports"
+        ).fetchone()
+        return {
+            'dias': fila[0],
+            'total_ventas': fila[1],
+            'total_dinero': fila[2],
+            'promedio_dia': fila[2] / fila[0] if fila[0] else 0,
+            'rango_fechas': f"{fila[3]} a {fila[4]}" if fila[0] else 'N/A'
+        }
+
+    def totales_mensuales(self, desde=None, hasta=None):
+        """Ingresos y ventas por mes: [(YYYY-MM, ingresos, ventas)]"""
+        consulta = "SELECT substr(fecha, 1, 7) AS mes, SUM(total_dia), SUM(total_ventas) FROM reports"
+        condiciones, parametros = [], []
+        if desde:
+            condiciones.append("fecha >= ?")
+            parametros.append(desde)
+        if hasta:
+            condiciones.append("fecha <= ?")
+            parametros.append(hasta)
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += " GROUP BY mes ORDER BY mes"
+        return self.conexion.execute(consulta, parametros).fetchall()
+
+    def top_productos(self, n=5, por="cantidad"):
+        """Productos más vendidos: [(producto, unidades, ingresos)]"""
+        orden = "ingresos" if por == "ingresos" else "unidades"
+        return self.conexion.execute(
+            f"SELECT producto, SUM(cantidad) AS unidades, SUM(valor) AS ingresos FROM sales "
+            f"GROUP BY producto ORDER BY {orden} DESC LIMIT ?", (n,)
+        ).fetchall()
+
+    def ingresos_diarios(self):
+        """[(fecha, total_dia)] ordenado por fecha"""
+        return self.conexion.execute("SELECT fecha, total_dia FROM reports ORDER BY fecha").fetchall()
+
+    def cerrar(self):
+        self.conexion.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Base de datos SQLite de reportes")
+    parser.add_argument("accion", choices=["importar", "resumen"])
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--bd", default=RUTA_BD)
+    args = parser.parse_args()
+
+    bd = BaseDatosReportes(args.bd)
+
+    if args.accion == "importar":
+        nuevos, repetidos = bd.importar_carpeta(args.carpeta)
+        print(f"✓ {nuevos} reportes importados ({repetidos} ya estaban) en {args.bd}")
+    else:
+        r = bd.resumen()
+        print("\n" + "="*60)
+        print(f"📅 Periodo: {r['rango_fechas']} ({r['dias']} reportes)")
+        print(f"📊 Ventas: {r['total_ventas']}   💰 Total: ${r['total_dinero']:,} COP")
+        print("-"*60)
+        for mes, ingresos, ventas in bd.totales_mensuales():
+            print(f"  {mes}   ${ingresos:>12,} COP   {ventas:>5} ventas")
+        print("-"*60)
+        for producto, unidades, ingresos in bd.top_productos():
+            print(f"  🏆 {producto:20s} {unidades:>5} und   ${ingresos:>10,} COP")
+        print("="*60 + "\n")
+
+    bd.cerrar()
+
+
+if __name__ == "__main__":
+    main()
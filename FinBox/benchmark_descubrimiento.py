@@ -0,0 +1,110 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import argparse
+import threading
+import descubrimiento
+
+# Prueba de descubrimiento contra ESP32 simulados en direcciones de loopback
+# (127.0.0.x), que en Linux responden sin configurar nada.
+#
+#   python benchmark_descubrimiento.py                  -> 3 cajas en 127.0.0.0/24
+#   python benchmark_descubrimiento.py --cajas 10 --puerto 8090
+#
+# Mide la búsqueda en frío (toda la subred), la búsqueda con la tabla ya
+# llena y qué pasa cuando una caja cambia de IP (como con DHCP). En una red
+# real las direcciones vacías no responden y cada una agota el timeout; aquí
+# responden con "conexión rechazada" al instante, así que el recorrido en
+# frío es más rápido que en la tienda. Cada caja simulada tiene su propio id
+# (MAC), y la caja movida debe encontrarse aunque haya otras en la red.
+
+
+async def _atender(reader, writer, mac):
+    await reader.readuntil(b"\r\n\r\n")
+    cuerpo = f'{{"ventas":7,"status":"ok","id":"{mac}"}}'.encode()
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: "
+                 + str(len(cuerpo)).encode() + b"\r\nConnection: close\r\n\r\n" + cuerpo)
+    await writer.drain()
+    writer.close()
+
+
+class Simulador:
+    """ESP32 de mentira que solo contestan /status, en un hilo aparte"""
+
+    def __init__(self, puerto):
+        self.puerto = puerto
+        self.servidores = {}
+        self.bucle = asyncio.new_event_loop()
+        threading.Thread(target=self.bucle.run_forever, daemon=True).start()
+
+    def _correr(self, corrutina):
+        return asyncio.run_coroutine_threadsafe(corrutina, self.bucle).result()
+
+    def encender(self, ip, mac):
+        async def abrir():
+            return await asyncio.start_server(lambda r, w: _atender(r, w, mac), ip, self.puerto)
+        self.servidores[ip] = self._correr(abrir())
+
+    def apagar(self, ip):
+        async def cerrar(servidor):
+            servidor.close()
+            await servidor.wait_closed()
+        self._correr(cerrar(self.servidores.pop(ip)))
+
+
+def medir(titulo, funcion):
+    inicio = time.perf_counter()
+    encontrados = funcion()
+    segundos = time.perf_counter() - inicio
+    print(f"  {titulo:<34} {segundos * 1000:8.1f} ms  {len(encontrados)} encontrado(s): "
+          f"{', '.join(d['direccion'] + ' (' + d.get('origen', '') + ')' for d in encontrados)}")
+    return encontrados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de descubrimiento con ESP32 simulados")
+    parser.add_argument("--cajas", type=int, default=3)
+    parser.add_argument("--puerto", type=int, default=8090)
+    parser.add_argument("--red", default="127.0.0.0/24")
+    parser.add_argument("--timeout", type=float, default=descubrimiento.TIMEOUT)
+    args = parser.parse_args()
+
+    simulador = Simulador(args.puerto)
+    ips = [f"127.0.0.{10 + i * 7}" for i in range(args.cajas)]
+    macs = [f"24:6F:28:00:00:{i:02X}" for i in range(args.cajas)]
+    for ip, mac in zip(ips, macs):
+        simulador.encender(ip, mac)
+
+    carpeta = tempfile.mkdtemp(prefix="finbox_descubrimiento_")
+    try:
+        tabla = descubrimiento.TablaDispositivos(carpeta)
+        opciones = dict(red=args.red, puerto=args.puerto, timeout=args.timeout, mdns=False)
+
+        print("\n" + "="*96)
+        print(f" Descubrimiento: {args.cajas} ESP32 simulados en {args.red}, puerto {args.puerto}")
+        print("="*96)
+        frio = medir("en frío (toda la subred)", lambda: descubrimiento.descubrir(tabla, **opciones))
+        medir("con tabla (solo conocidos)", lambda: descubrimiento.descubrir(tabla, **opciones))
+
+        # La primera caja "cambia de IP"
+        anterior, nueva = ips[0], "127.0.0.200"
+        simulador.apagar(anterior)
+        simulador.encender(nueva, macs[0])
+        actual = descubrimiento.direccion(anterior, args.puerto)
+        resuelta = descubrimiento.resolver(actual, tabla, **opciones)
+        print(f"  {'resolver tras cambio de IP':<34} {actual} -> {resuelta}")
+        if args.cajas > 1:
+            medir("con tabla y una caja movida", lambda: descubrimiento.descubrir(tabla, completo=True, **opciones))
+
+        correcto = len(frio) == args.cajas and resuelta == descubrimiento.direccion(nueva, args.puerto)
+        print(f"  Tabla guardada: {len(tabla)} dirección(es) en {os.path.relpath(tabla.ruta, carpeta)} "
+              f"{'✓' if correcto else '✗'}")
+        print("="*96 + "\n")
+    finally:
+        shutil.rmtree(carpeta)
+
+
+if __name__ == "__main__":
+    main()
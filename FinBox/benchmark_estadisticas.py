@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import math
+import time
+import threading
+import tempfile
+import tracemalloc
+import argparse
+import shutil
+import warnings
+from datetime import datetime
+
+import almacenamiento
+import nucleo_analitico
+import pronostico
+from generar_reportes import GeneradorReportes
+from analisis_financiero import AnalizadorFinanciero
+from chat_financiero import ChatFinanciero
+from app_gui import AppFinanciera
+
+# Benchmark de las rutas calientes (carga, estadísticas, contexto de IA y
+# gráficas) sobre corpus sintéticos de distintos tamaños.
+#
+#   python benchmark_estadisticas.py                       -> 1k, 10k y 100k días
+#   python benchmark_estadisticas.py --dias 1000 --salida r.json
+#   python benchmark_estadisticas.py --comparar r_anterior.json
+#
+# Al final comprueba que el pronóstico no cambie si cada día llega además
+# como fotos parciales anteriores (el ESP32 manda el acumulado del día).
+
+TAMAÑOS = [1000, 10000, 100000]
+
+
+def preparar_corpus(dias, semilla, carpeta_base):
+    """Genera (o reutiliza) un corpus con aproximadamente `dias` reportes"""
+    carpeta = os.path.join(carpeta_base, f"finbox_corpus_{dias}_{semilla}")
+    if os.path.exists(carpeta):
+        return carpeta
+
+    dispositivos = math.ceil(dias / 1000)
+    meses = math.ceil(dias / dispositivos / 30.44)
+    GeneradorReportes().generar_corpus("2000-01", meses, dispositivos, carpeta,
+                                       formato="ndjson", semilla=semilla)
+    return carpeta
+
+
+def crear_frontends(carpeta):
+    """Instancias de cada front-end sin UI ni cliente de OpenAI"""
+    analizador = AnalizadorFinanciero(carpeta)
+
+    # Solo se usan los métodos de lectura/contexto, que no tocan la API ni Tk
+    chat = ChatFinanciero.__new__(ChatFinanciero)
+    chat.carpeta_reportes = carpeta
+    chat.historial_conversacion = []
+
+    app = AppFinanciera.__new__(AppFinanciera)
+    app.carpeta = carpeta
+    app._analisis = None
+    app.catalogo = None
+    app._vistas = None
+    app._lock_vistas = threading.Lock()
+    app.version_datos = 0
+
+    return analizador, chat, app
+
+
+def etapas(analizador, chat, app):
+    lista = [
+        ("cargar_datos", analizador.cargar_datos),
+        ("calcular_estadisticas", analizador.calcular_estadisticas),
+        ("generar_contexto_rag", chat.generar_contexto_rag),
+        # La GUI reutiliza su análisis en caché; aquí se mide la recarga completa
+        ("generar_contexto_ia", lambda: (app.invalidar_analisis(), app.generar_contexto_ia())),
+    ]
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+        def graficar():
+            fig = analizador.graficar_todo()
+            plt.close(fig)
+        lista.append(("graficar_todo", graficar))
+    except ImportError:
+        print("⚠ matplotlib no instalado: se omite graficar_todo")
+    return lista
+
+
+def medir_etapa(funcion, repeticiones):
+    """Mejor tiempo de varias repeticiones y pico de memoria en una corrida aparte"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    # tracemalloc ralentiza la ejecución, por eso no se mezcla con el cronómetro
+    tracemalloc.start()
+    funcion()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(tiempos), pico
+
+
+def ejecutar(tamaños, repeticiones, semilla, carpeta_base):
+    resultados = []
+    for dias in tamaños:
+        carpeta = preparar_corpus(dias, semilla, carpeta_base)
+        analizador, chat, app = crear_frontends(carpeta)
+        n_reportes = len(analizador.datos)
+        n_ventas = sum(len(r.get('ventas', [])) for r in analizador.datos)
+
+        print("\n" + "="*72)
+        print(f" {n_reportes:,} reportes / {n_ventas:,} ventas")
+        print("="*72)
+        print(f"  {'Etapa':26s} {'Tiempo':>10s} {'Pico mem':>12s} {'Reportes/s':>14s}")
+
+        for nombre, funcion in etapas(analizador, chat, app):
+            segundos, pico = medir_etapa(funcion, repeticiones)
+            resultados.append({
+                "dias": dias,
+                "reportes": n_reportes,
+                "ventas": n_ventas,
+                "etapa": nombre,
+                "segundos": segundos,
+                "pico_bytes": pico,
+                "reportes_por_segundo": n_reportes / segundos if segundos else None
+            })
+            print(f"  {nombre:26s} {segundos*1000:>8.1f}ms {pico/1e6:>10.1f}MB {n_reportes/segundos:>14,.0f}")
+
+    return resultados
+
+
+def probar_fotos(carpeta):
+    """Pronóstico del corpus y del mismo corpus con dos fotos parciales previas de cada día"""
+    fotos = []
+    for r in almacenamiento.iterar_reportes(carpeta):
+        for hora, parte in (("08:00:00", 3), ("12:00:00", 2), ("23:59:59", 1)):
+            ventas = r['ventas'][:len(r['ventas']) // parte]
+            fotos.append({**r, 'ventas': ventas, 'total_ventas': len(ventas),
+                          'total_dia': sum(v['valor'] for v in ventas), 'recibido': f"{r['fecha']} {hora}"})
+    copia = tempfile.mkdtemp(prefix="finbox_fotos_")
+    try:
+        almacenamiento.AlmacenNDJSON(copia).agregar_lote(fotos)
+        resultados = []
+        for analisis in (nucleo_analitico.cargar(carpeta), nucleo_analitico.cargar(copia)):
+            p = pronostico.pronosticar(analisis)
+            resultados.append((round(p['manana'], 2), round(p['proximo_mes'], 2),
+                               {k: round(v, 2) for k, v in pronostico.pronosticar_productos(analisis.cubo()).items()}))
+    finally:
+        shutil.rmtree(copia)
+    correcto = resultados[0] == resultados[1]
+    print(f"\n  Pronóstico con 3 fotos por día: mañana ${resultados[1][0]:,.0f} "
+          f"(una foto: ${resultados[0][0]:,.0f}) {'✓' if correcto else '✗'}")
+    return correcto
+
+
+def comparar(resultados, ruta_anterior):
+    """Muestra la variación de tiempo respecto a una corrida guardada"""
+    with open(ruta_anterior, 'r', encoding='utf-8') as f:
+        anterior = json.load(f)
+    previos = {(r["dias"], r["etapa"]): r for r in anterior["resultados"]}
+
+    print("\n" + "="*72)
+    print(f" Comparación con {ruta_anterior} ({anterior.get('fecha', 'N/A')})")
+    print("="*72)
+    for r in resultados:
+        previo = previos.get((r["dias"], r["etapa"]))
+        if not previo:
+            continue
+        cambio = r["segundos"] / previo["segundos"] if previo["segundos"] else float('inf')
+        marca = "⚠" if cambio > 1.10 else "✓"
+        print(f"  {marca} {r['dias']:>7,} días  {r['etapa']:26s} x{cambio:>6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga y estadísticas")
+    parser.add_argument("--dias", type=int, nargs="+", default=TAMAÑOS)
+    parser.add_argument("-n", "--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=2025)
+    parser.add_argument("--carpeta-corpus", default=tempfile.gettempdir(),
+                        help="Dónde generar/reutilizar los corpus")
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    resultados = ejecutar(args.dias, args.repeticiones, args.semilla, args.carpeta_corpus)
+    probar_fotos(preparar_corpus(min(args.dias), args.semilla, args.carpeta_corpus))
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump({"fecha": datetime.now().isoformat(), "python": sys.version,
+                       "semilla": args.semilla, "resultados": resultados},
+                      f, indent=2, ensure_ascii=False)
+        print(f"\n✓ Resultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import random
+import shutil
+import asyncio
+import tempfile
+import argparse
+import threading
+import almacenamiento
+import informes_ia
+from generar_reportes import GeneradorReportes
+
+# Prueba de informes_ia.py contra un servidor de completions simulado
+# (POST /v1/chat/completions con la forma de la API de OpenAI).
+#
+#   python benchmark_informes.py                          -> 2 meses, 2 cajas, 200 ms por respuesta
+#   python benchmark_informes.py --latencia 500 --fallos 0.2 --concurrencia 16
+#   python benchmark_informes.py --solo-servidor --puerto 8099
+#       y en otra consola: python informes_ia.py --base-url http://127.0.0.1:8099/v1 ...
+#
+# Compara la generación en serie con la concurrente, comprueba que una
+# segunda pasada no envía nada (caché por huella) y que al cambiar un día
+# solo se regenera ese día. Con --fallos una parte de las respuestas es 429.
+
+
+class SimuladorCompletions:
+    """Servidor HTTP/1.1 mínimo que contesta chat.completions tras `latencia_ms`"""
+
+    def __init__(self, puerto=8099, latencia_ms=200, fallos=0.0, host="127.0.0.1"):
+        self.host = host
+        self.puerto = puerto
+        self.latencia = latencia_ms / 1000
+        self.fallos = fallos
+        self.peticiones = 0
+        self.rechazadas = 0
+        self.bucle = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.puerto}/v1"
+
+    async def _atender(self, reader, writer):
+        try:
+            while True:
+                cabecera = await reader.readuntil(b"\r\n\r\n")
+                largo = 0
+                for linea in cabecera.split(b"\r\n")[1:]:
+                    nombre, _, valor = linea.partition(b":")
+                    if nombre.strip().lower() == b"content-length":
+                        largo = int(valor)
+                cuerpo = json.loads(await reader.readexactly(largo)) if largo else {}
+                writer.write(await self._responder(cuerpo))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _responder(self, cuerpo):
+        self.peticiones += 1
+        await asyncio.sleep(self.latencia)
+        if random.random() < self.fallos:
+            self.rechazadas += 1
+            datos = json.dumps({"error": {"message": "Rate limit (simulado)", "type": "rate_limit"}}).encode()
+            return (b"HTTP/1.1 429 Too Many Requests\r\nContent-Type: application/json\r\nretry-after: 0.1\r\n"
+                    b"Content-Length: " + str(len(datos)).encode() + b"\r\n\r\n" + datos)
+
+        periodo = "?"
+        try:
+            periodo = json.loads(cuerpo["messages"][-1]["content"]).get("periodo", "?")
+        except (KeyError, IndexError, TypeError, ValueError):
+            pass
+        datos = json.dumps({
+            "id": f"chatcmpl-sim{self.peticiones}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": cuerpo.get("model", "simulado"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"Análisis simulado de {periodo}."}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode()
+        return (b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: "
+                + str(len(datos)).encode() + b"\r\n\r\n" + datos)
+
+    async def servir(self):
+        servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        async with servidor:
+            await servidor.serve_forever()
+
+    def iniciar(self):
+        """Arranca el servidor en un hilo aparte"""
+        listo = threading.Event()
+
+        def correr():
+            self.bucle = asyncio.new_event_loop()
+            self.bucle.call_soon(listo.set)
+            self.bucle.run_until_complete(self.servir())
+
+        threading.Thread(target=correr, daemon=True).start()
+        listo.wait()
+        time.sleep(0.1)
+
+
+def pasada(titulo, simulador, carpeta, **opciones):
+    antes = simulador.peticiones
+    inicio = time.perf_counter()
+    resultado = informes_ia.generar(carpeta, por_minuto=0, base_url=simulador.url, **opciones)
+    segundos = time.perf_counter() - inicio
+    print(f"  {titulo:<32} {segundos:7.2f}s  {simulador.peticiones - antes:>5} petición(es)  "
+          f"{len(resultado['generados']):>4} generado(s)  {resultado['en_cache']:>4} en caché  "
+          f"{len(resultado['errores'])} error(es)")
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Informes de IA en lote contra un servidor simulado")
+    parser.add_argument("--meses", type=int, default=2)
+    parser.add_argument("--cajas", type=int, default=2)
+    parser.add_argument("--latencia", type=float, default=200, help="ms por respuesta")
+    parser.add_argument("--fallos", type=float, default=0.0, help="Fracción de respuestas 429")
+    parser.add_argument("--concurrencia", type=int, default=informes_ia.CONCURRENCIA)
+    parser.add_argument("--puerto", type=int, default=8099)
+    parser.add_argument("--solo-servidor", action="store_true", help="Solo levantar el simulador")
+    args = parser.parse_args()
+
+    simulador = SimuladorCompletions(args.puerto, args.latencia, args.fallos)
+    if args.solo_servidor:
+        print(f"🤖 Simulador de completions en {simulador.url} (Ctrl+C para salir)")
+        asyncio.run(simulador.servir())
+        return
+    simulador.iniciar()
+
+    carpeta = tempfile.mkdtemp(prefix="finbox_informes_")
+    try:
+        GeneradorReportes().generar_corpus("2024-01", args.meses, args.cajas, carpeta, "ndjson", semilla=1)
+        informes_ia.ESPERA_BASE = 0.1
+
+        print("\n" + "="*100)
+        print(f" Informes por día: {args.meses} mes(es), {args.cajas} caja(s), "
+              f"{args.latencia:.0f} ms por respuesta, {args.fallos:.0%} de 429")
+        print("="*100)
+        pasada("en serie (concurrencia 1)", simulador, carpeta, concurrencia=1)
+        shutil.rmtree(os.path.join(carpeta, informes_ia.CARPETA_ANALISIS))
+        pasada(f"concurrente ({args.concurrencia})", simulador, carpeta, concurrencia=args.concurrencia)
+        pasada("segunda pasada (sin cambios)", simulador, carpeta, concurrencia=args.concurrencia)
+
+        # Llega un reporte tarde para un día ya analizado: solo ese día se regenera
+        almacenamiento.guardar_reporte({"fecha": "2024-01-15", "total_ventas": 1, "total_dia": 5000,
+                                        "ventas": [{"numero": 1, "codigo": "A1", "producto": "Cuaderno",
+                                                    "valor": 5000, "timestamp": "2024-01-15 10:00:00"}]},
+                                       carpeta, "json", "235959")
+        final = pasada("tras cambiar un día", simulador, carpeta, concurrencia=args.concurrencia)
+        correcto = final["generados"] == ["2024-01-15"] and not final["errores"]
+        print(f"  Respuestas 429 reintentadas: {simulador.rechazadas}   {'✓' if correcto else '✗'}")
+        print("="*100 + "\n")
+    finally:
+        shutil.rmtree(carpeta)
+
+
+if __name__ == "__main__":
+    main()
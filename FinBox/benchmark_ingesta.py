@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import socket
+import random
+import shutil
+import asyncio
+import tempfile
+import argparse
+import threading
+import subprocess
+from datetime import date, timedelta
+import almacenamiento
+import compactacion
+import servidor_ingesta
+from generar_reportes import GeneradorReportes
+
+# Generador de carga para servidor_ingesta.py: muchas "cajas" enviando
+# reportes a la vez por conexiones keep-alive.
+#
+#   python benchmark_ingesta.py                          -> levanta un servidor temporal
+#   python benchmark_ingesta.py --peticiones 20000 --cajas 200
+#   python benchmark_ingesta.py --url 127.0.0.1:8080     -> contra un servidor ya corriendo
+#
+# Al final se comprueba que lo guardado coincide con lo enviado y que los
+# reenvíos se confirmaron como duplicados. Con el servidor temporal también
+# se prueba una ráfaga de reportes de la misma fecha en formato JSON: varios
+# lotes caen en el mismo segundo y ninguno puede pisar los archivos de otro,
+# y un envío de meses cerrados mientras se compacta: no se pierde ningún reporte.
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def generar_reportes(n, cajas, semilla=1):
+    """n reportes sintéticos repartidos entre las cajas, cada uno con su id"""
+    random.seed(semilla)
+    generador = GeneradorReportes()
+    inicio = date(2020, 1, 1)
+    reportes = []
+    for i in range(n):
+        caja = i % cajas
+        datos = generador.generar_reporte_dia((inicio + timedelta(days=i // cajas)).isoformat())
+        datos['dispositivo'] = f"caja{caja:03d}"
+        datos['id'] = f"caja{caja:03d}-{i}"
+        reportes.append(json.dumps(datos).encode('utf-8'))
+    return reportes
+
+
+async def _post(reader, writer, host, ruta, cuerpo):
+    writer.write(f"POST {ruta} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(cuerpo)}\r\n\r\n".encode('latin-1') + cuerpo)
+    await writer.drain()
+    cabecera = await reader.readuntil(b"\r\n\r\n")
+    estado = int(cabecera.split(b" ", 2)[1])
+    largo = 0
+    for linea in cabecera.split(b"\r\n"):
+        if linea.lower().startswith(b"content-length:"):
+            largo = int(linea.split(b":", 1)[1])
+    return estado, json.loads(await reader.readexactly(largo))
+
+
+async def _caja(host, puerto, cola, latencias, resultados):
+    """Una caja: una conexión que envía reportes de la cola uno tras otro"""
+    reader, writer = await asyncio.open_connection(host, puerto)
+    try:
+        while not cola.empty():
+            cuerpo = cola.get_nowait()
+            inicio = time.perf_counter()
+            estado, respuesta = await _post(reader, writer, host, "/reporte", cuerpo)
+            latencias.append(time.perf_counter() - inicio)
+            if estado != 200:
+                resultados['errores'] += 1
+            elif respuesta.get('duplicado'):
+                resultados['duplicados'] += 1
+            else:
+                resultados['nuevos'] += 1
+    finally:
+        writer.close()
+
+
+async def cargar(host, puerto, reportes, cajas):
+    cola = asyncio.Queue()
+    for cuerpo in reportes:
+        cola.put_nowait(cuerpo)
+    latencias = []
+    resultados = {'nuevos': 0, 'duplicados': 0, 'errores': 0}
+    inicio = time.perf_counter()
+    await asyncio.gather(*(_caja(host, puerto, cola, latencias, resultados) for _ in range(cajas)))
+    resultados['segundos'] = time.perf_counter() - inicio
+    resultados['latencias'] = sorted(latencias)
+    return resultados
+
+
+def _esperar_servidor(host, puerto, proceso, limite=15):
+    fin = time.time() + limite
+    while time.time() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError("El servidor terminó al arrancar")
+        try:
+            socket.create_connection((host, puerto), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+async def _rafaga(carpeta, cajas, por_caja):
+    """Servidor JSON en el mismo proceso y `cajas` clientes enviando reportes de una sola fecha"""
+    generador = GeneradorReportes()
+    reportes = []
+    for i in range(cajas * por_caja):
+        datos = generador.generar_reporte_dia("2020-01-01")
+        datos['dispositivo'] = f"caja{i % cajas:03d}"
+        datos['id'] = f"rafaga-{i}"
+        reportes.append(json.dumps(datos).encode('utf-8'))
+
+    servidor = servidor_ingesta.ServidorIngesta(carpeta, "json")
+    tcp = await servidor.iniciar("127.0.0.1", 0)
+    try:
+        return await cargar("127.0.0.1", tcp.sockets[0].getsockname()[1], reportes, cajas)
+    finally:
+        await servidor.detener()
+
+
+def probar_mismo_segundo(cajas=20, por_caja=10):
+    """True si cada reporte confirmado de la ráfaga quedó en su propio archivo"""
+    carpeta = tempfile.mkdtemp(prefix="finbox_rafaga_")
+    try:
+        resultado = asyncio.run(_rafaga(carpeta, cajas, por_caja))
+        archivos = [n for n in os.listdir(carpeta) if n.endswith(".json")]
+        correcto = resultado['nuevos'] == len(archivos) == cajas * por_caja
+        print(f"  Ráfaga JSON de una fecha: {resultado['nuevos']} confirmados, {len(archivos)} archivos "
+              f"en {resultado['segundos']:.2f}s {'✓' if correcto else '✗ se pisaron archivos'}")
+        return correcto
+    finally:
+        shutil.rmtree(carpeta)
+
+
+async def _envio_compactando(carpeta, reportes, cajas):
+    """Servidor NDJSON en el mismo proceso recibiendo reportes de meses cerrados mientras se compacta"""
+    servidor = servidor_ingesta.ServidorIngesta(carpeta, "ndjson")
+    tcp = await servidor.iniciar("127.0.0.1", 0)
+    fin = threading.Event()
+
+    def compactar():
+        veces = 0
+        while not fin.is_set():
+            compactacion.compactar(carpeta)
+            veces += 1
+        return veces
+
+    compactando = asyncio.get_running_loop().run_in_executor(None, compactar)
+    try:
+        resultado = await cargar("127.0.0.1", tcp.sockets[0].getsockname()[1], reportes, cajas)
+    finally:
+        fin.set()
+        resultado_veces = await compactando
+        await servidor.detener()
+    resultado['compactaciones'] = resultado_veces
+    return resultado
+
+
+def probar_compactacion(n=1000, cajas=20):
+    """True si lo que llega durante las compactaciones queda guardado completo"""
+    carpeta = tempfile.mkdtemp(prefix="finbox_compactacion_")
+    try:
+        resultado = asyncio.run(_envio_compactando(carpeta, generar_reportes(n, cajas), cajas))
+        compactacion.compactar(carpeta)
+        guardados = sum(1 for _ in almacenamiento.iterar_reportes(carpeta, ligero=True))
+        correcto = resultado['nuevos'] == guardados == n
+        print(f"  Envío compactando: {resultado['nuevos']} confirmados, {guardados} guardados, "
+              f"{resultado['compactaciones']} compactaciones {'✓' if correcto else '✗ se perdieron reportes'}")
+        return correcto
+    finally:
+        shutil.rmtree(carpeta)
+
+
+def mostrar(titulo, r):
+    lat = r['latencias']
+    p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else 0
+    total = r['nuevos'] + r['duplicados'] + r['errores']
+    print(f"  {titulo:<12} {total:>7} pet. en {r['segundos']:6.2f}s  {total / r['segundos']:8.0f} pet/s  "
+          f"p50 {p(0.5):6.1f} ms  p95 {p(0.95):6.1f} ms  p99 {p(0.99):6.1f} ms")
+    print(f"  {'':<12} nuevos {r['nuevos']}, duplicados {r['duplicados']}, errores {r['errores']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga para el servidor de ingesta")
+    parser.add_argument("--url", default=None, help="host:puerto de un servidor ya corriendo")
+    parser.add_argument("-n", "--peticiones", type=int, default=5000)
+    parser.add_argument("--cajas", type=int, default=100, help="Conexiones concurrentes")
+    parser.add_argument("--reenvios", type=float, default=0.1,
+                        help="Fracción de reportes que se vuelve a enviar")
+    parser.add_argument("--formato", choices=almacenamiento.FORMATOS, default="ndjson")
+    args = parser.parse_args()
+
+    carpeta = proceso = None
+    if args.url:
+        host, puerto = args.url.replace("http://", "").rsplit(":", 1)
+        puerto = int(puerto)
+    else:
+        host, puerto = "127.0.0.1", _puerto_libre()
+        carpeta = tempfile.mkdtemp(prefix="finbox_ingesta_")
+        servidor = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor_ingesta.py")
+        proceso = subprocess.Popen([sys.executable, servidor, "--host", host, "--puerto", str(puerto),
+                                    "--carpeta", carpeta, "--formato", args.formato],
+                                   stdout=subprocess.DEVNULL)
+
+    try:
+        if proceso:
+            _esperar_servidor(host, puerto, proceso)
+        reportes = generar_reportes(args.peticiones, args.cajas)
+        reenvios = random.sample(reportes, int(len(reportes) * args.reenvios))
+
+        print("\n" + "="*96)
+        print(f" Ingesta: {len(reportes)} reportes desde {args.cajas} cajas concurrentes ({host}:{puerto})")
+        print("="*96)
+        envio = asyncio.run(cargar(host, puerto, reportes, args.cajas))
+        mostrar("envío", envio)
+        reenvio = asyncio.run(cargar(host, puerto, reenvios, args.cajas))
+        mostrar("reenvío", reenvio)
+
+        if carpeta:
+            guardados = sum(1 for _ in almacenamiento.iterar_reportes(carpeta, ligero=True))
+            correcto = (guardados == envio['nuevos'] == len(reportes)
+                        and reenvio['duplicados'] == len(reenvios))
+            print(f"  Guardados: {guardados} de {len(reportes)} "
+                  f"{'✓' if correcto else '✗ no coincide con lo enviado'}")
+            probar_mismo_segundo()
+            probar_compactacion()
+        print("="*96 + "\n")
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait()
+        if carpeta:
+            shutil.rmtree(carpeta)
+
+
+if __name__ == "__main__":
+    main()
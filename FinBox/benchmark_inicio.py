@@ -0,0 +1,97 @@
+import subprocess
+import sys
+import os
+import argparse
+
+# Mide el tiempo de arranque de los módulos con `python -X importtime`.
+# Cada medición corre en un proceso nuevo para que no haya caché de imports.
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+MODULOS = ["app_gui", "receptor", "analisis_financiero", "chat_financiero"]
+
+
+def medir_importtime(modulo):
+    """Importa un módulo con -X importtime y devuelve las filas (paquete, propio, acumulado, nivel)"""
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=CARPETA, capture_output=True, text=True
+    )
+
+    filas = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        partes = linea[len("import time:"):].split("|")
+        if len(partes) != 3:
+            continue
+        nombre = partes[2].rstrip()
+        nivel = (len(nombre) - len(nombre.lstrip())) // 2
+        filas.append((nombre.strip(), int(partes[0]), int(partes[1]), nivel))
+
+    return filas, proceso.returncode
+
+
+def medir_ventana():
+    """Tiempo hasta que la ventana principal de la GUI queda dibujada"""
+    codigo = (
+        "import time; t = time.perf_counter()\n"
+        "import tkinter as tk, app_gui\n"
+        "root = tk.Tk(); app_gui.AppFinanciera(root); root.update()\n"
+        "print(time.perf_counter() - t); root.destroy()\n"
+    )
+    proceso = subprocess.run([sys.executable, "-c", codigo], cwd=CARPETA,
+                             capture_output=True, text=True)
+    if proceso.returncode != 0:
+        return None
+    return float(proceso.stdout.strip().splitlines()[-1])
+
+
+def mostrar_desglose(modulo, top=10):
+    filas, codigo = medir_importtime(modulo)
+    if codigo != 0 or not filas:
+        print(f"✗ {modulo}: no se pudo importar (falta alguna dependencia)")
+        return None
+
+    # importtime lista los hijos antes que el padre: el subárbol del módulo son
+    # las filas anteriores a su línea hasta la previa de nivel 0 (arranque de Python)
+    fin = max(i for i, f in enumerate(filas) if f[0] == modulo and f[3] == 0)
+    inicio = fin
+    while inicio > 0 and filas[inicio - 1][3] > 0:
+        inicio -= 1
+    subarbol = filas[inicio:fin + 1]
+
+    total = filas[fin][2]
+    print("\n" + "="*60)
+    print(f" {modulo}: {total/1000:,.1f} ms en imports ({len(subarbol)} módulos)")
+    print("="*60)
+
+    # Paquetes importados directamente por el módulo
+    directos = [f for f in subarbol if f[3] == 1]
+    directos.sort(key=lambda f: f[2], reverse=True)
+    for nombre, propio, acumulado, _ in directos[:top]:
+        print(f"  {nombre:35s} {acumulado/1000:>10,.1f} ms")
+
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque (-X importtime)")
+    parser.add_argument("modulos", nargs="*", default=MODULOS)
+    parser.add_argument("--top", type=int, default=10, help="Paquetes a mostrar por módulo")
+    parser.add_argument("--ventana", action="store_true",
+                        help="Mide también el tiempo hasta mostrar la ventana (requiere pantalla)")
+    args = parser.parse_args()
+
+    for modulo in args.modulos:
+        mostrar_desglose(modulo, args.top)
+
+    if args.ventana:
+        segundos = medir_ventana()
+        if segundos is None:
+            print("\n✗ No se pudo abrir la ventana")
+        else:
+            print(f"\n🪟 Primera ventana: {segundos*1000:,.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import json
+import os
+import time
+import shutil
+import tempfile
+import tracemalloc
+import argparse
+import almacenamiento
+from generar_reportes import GeneradorReportes
+
+# Micro-benchmark de lectura de reportes: json.load en modo texto (como antes),
+# decodificadores en binario y la proyección ligera de reducir_reporte().
+
+
+def generar_corpus(carpeta, meses):
+    generador = GeneradorReportes()
+    for i in range(meses):
+        año, mes = 2020 + i // 12, i % 12 + 1
+        generador.generar_mes(año, mes, carpeta)
+        generador.generar_mes(año, mes, carpeta, formato="ndjson")
+
+
+def cargar_texto(carpeta):
+    """La forma original: open() en texto + json.load por archivo"""
+    datos = []
+    for archivo in os.listdir(carpeta):
+        if archivo.endswith('.json'):
+            with open(os.path.join(carpeta, archivo), 'r', encoding='utf-8') as f:
+                datos.append(json.load(f))
+    return datos
+
+
+def medir(nombre, funcion, repeticiones):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        n = len(funcion())
+        mejor = min(mejor, time.perf_counter() - inicio)
+
+    # Memoria que queda ocupada por los reportes cargados
+    tracemalloc.start()
+    resultado = funcion()
+    retenida = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del resultado
+
+    print(f"  {nombre:32s} {mejor*1000:>8.1f} ms {n/mejor:>10,.0f} rep/s {retenida/1024:>9,.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de decodificación de reportes")
+    parser.add_argument("--meses", type=int, default=24, help="Meses de reportes a generar")
+    parser.add_argument("-n", "--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    carpeta = tempfile.mkdtemp(prefix="finbox_bench_")
+    try:
+        generar_corpus(carpeta, args.meses)
+        segmentos = almacenamiento.AlmacenNDJSON(carpeta)
+
+        print("\n" + "="*72)
+        print(f" Decodificadores disponibles: {', '.join(almacenamiento.DECODIFICADORES)}")
+        print("="*72)
+        medir("json.load texto (original)", lambda: cargar_texto(carpeta), args.repeticiones)
+
+        for nombre in almacenamiento.DECODIFICADORES:
+            almacenamiento.usar_decodificador(nombre)
+            archivos = [os.path.join(carpeta, a) for a in os.listdir(carpeta) if a.endswith('.json')]
+            medir(f"{nombre} binario por archivo",
+                  lambda: [almacenamiento.leer_json(r) for r in archivos], args.repeticiones)
+            medir(f"{nombre} binario + ligero",
+                  lambda: [almacenamiento.reducir_reporte(almacenamiento.leer_json(r)) for r in archivos],
+                  args.repeticiones)
+            medir(f"{nombre} segmentos NDJSON",
+                  lambda: list(segmentos.leer()), args.repeticiones)
+        print("="*72 + "\n")
+    finally:
+        shutil.rmtree(carpeta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import hashlib
+from datetime import datetime
+import almacenamiento
+import metricas
+
+# Catálogo de productos: tabla código -> id entero con nombres internados.
+#
+#   catalogo = Catalogo("reportes")            # caché en reportes/estado/catalogo.json
+#   catalogo.sincronizar("192.168.1.100")      # GET /catalogo solo si cambió
+#   pid = catalogo.id_de("06", "Cuaderno")
+#   catalogo.nombre(pid)                       # -> "Cuaderno"
+#
+# Las estadísticas agrupan por id y resuelven el nombre solo al mostrarlo.
+# Los ids son estables: los productos se agregan al final y nunca se renumeran.
+
+CARPETA_ESTADO = "estado"
+ARCHIVO_CATALOGO = "catalogo.json"
+
+# Catálogo que trae el firmware (PAF.ino); se usa mientras no se haya sincronizado
+CATALOGO_BASE = [
+    {"codigo": "01", "nombre": "Lapicero", "descripcion": "Lapicero tinta azul/negra"},
+    {"codigo": "02", "nombre": "Lapiz", "descripcion": "Lapiz de grafito HB"},
+    {"codigo": "03", "nombre": "Borrador", "descripcion": "Borrador blanco o de nata"},
+    {"codigo": "04", "nombre": "Sacapuntas", "descripcion": "Sacapuntas metalico o plastico"},
+    {"codigo": "05", "nombre": "Marcador", "descripcion": "Marcador permanente o de pizarra"},
+    {"codigo": "06", "nombre": "Cuaderno", "descripcion": "Cuaderno universitario o pequeno"},
+    {"codigo": "07", "nombre": "Carpeta", "descripcion": "Carpeta plastica o de anillas"},
+    {"codigo": "08", "nombre": "Hojas sueltas", "descripcion": "Resma o paquete de hojas blancas"},
+    {"codigo": "09", "nombre": "Papel cuadriculado", "descripcion": "Hojas cuadriculadas o rayadas"},
+    {"codigo": "10", "nombre": "Cartulina", "descripcion": "Cartulina blanca o de color"},
+    {"codigo": "11", "nombre": "Impresion B/N", "descripcion": "Impresion laser o inyeccion B/N"},
+    {"codigo": "12", "nombre": "Impresion color", "descripcion": "Impresion a color"},
+    {"codigo": "13", "nombre": "Fotocopia", "descripcion": "Copia en blanco y negro"},
+    {"codigo": "14", "nombre": "Escaneo", "descripcion": "Escaneo de documentos o fotos"},
+    {"codigo": "15", "nombre": "Plastificado", "descripcion": "Plastificado de hojas o carnets"},
+    {"codigo": "16", "nombre": "Tijeras", "descripcion": "Tijeras escolares o de oficina"},
+    {"codigo": "17", "nombre": "Regla", "descripcion": "Regla de 30 cm o flexible"},
+    {"codigo": "18", "nombre": "Pegante", "descripcion": "Pegante en barra o liquido"},
+    {"codigo": "19", "nombre": "Cinta adhesiva", "descripcion": "Cinta transparente o masking tape"},
+    {"codigo": "20", "nombre": "Grapadora", "descripcion": "Grapadora mediana o mini"},
+]
+
+
+def _normalizar(codigo):
+    # El firmware busca los códigos en mayúsculas
+    return sys.intern(str(codigo).strip().upper())
+
+
+class Catalogo:
+    """Tabla de productos del ESP32 con ids enteros estables"""
+
+    def __init__(self, carpeta_reportes=None):
+        self.ruta = (os.path.join(carpeta_reportes, CARPETA_ESTADO, ARCHIVO_CATALOGO)
+                     if carpeta_reportes else None)
+        self.codigos = []
+        self.nombres = []
+        self.descripciones = []
+        self._por_codigo = {}
+        self._por_nombre = {}
+        self.etag = None
+        self.version = None
+        self.actualizado = None
+
+        if self.ruta and os.path.exists(self.ruta):
+            self.cargar()
+        else:
+            for p in CATALOGO_BASE:
+                self.registrar(p['codigo'], p['nombre'], p['descripcion'])
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def registrar(self, codigo, nombre=None, descripcion="", actualizar=False):
+        """Id del código; lo agrega si es nuevo y, con actualizar=True, renueva nombre y descripción"""
+        codigo = _normalizar(codigo)
+        pid = self._por_codigo.get(codigo)
+        if pid is None:
+            pid = len(self.codigos)
+            self.codigos.append(codigo)
+            self.nombres.append(sys.intern(nombre or codigo))
+            self.descripciones.append(descripcion or "")
+            self._por_codigo[codigo] = pid
+            self._por_nombre.setdefault(self.nombres[pid], pid)
+        elif actualizar and nombre:
+            self.nombres[pid] = sys.intern(nombre)
+            self.descripciones[pid] = descripcion or ""
+            self._por_nombre[self.nombres[pid]] = pid
+        return pid
+
+    def id_de(self, codigo=None, nombre=None):
+        """Id de una venta por su código o, si no trae código (firmware viejo), por su nombre"""
+        if codigo:
+            pid = self._por_codigo.get(codigo)
+            if pid is None:
+                pid = self._por_codigo.get(_normalizar(codigo))
+            return pid if pid is not None else self.registrar(codigo, nombre)
+        nombre = nombre or "Desconocido"
+        pid = self._por_nombre.get(nombre)
+        return pid if pid is not None else self.registrar(nombre, nombre)
+
+    def nombre(self, pid):
+        return self.nombres[pid]
+
+    def codigo(self, pid):
+        return self.codigos[pid]
+
+    def descripcion(self, pid):
+        return self.descripciones[pid]
+
+    def productos(self):
+        """Lista [{codigo, nombre, descripcion}] en orden de id"""
+        return [{"codigo": c, "nombre": n, "descripcion": d}
+                for c, n, d in zip(self.codigos, self.nombres, self.descripciones)]
+
+    # ========== CACHÉ Y SINCRONIZACIÓN ==========
+
+    def cargar(self):
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Caché del catálogo ilegible, se usa el catálogo base: {e}")
+            cache = {"productos": CATALOGO_BASE}
+        for p in cache.get("productos", []):
+            self.registrar(p['codigo'], p.get('nombre'), p.get('descripcion', ""))
+        self.etag = cache.get("etag")
+        self.version = cache.get("version")
+        self.actualizado = cache.get("actualizado")
+
+    def guardar(self):
+        if not self.ruta:
+            return
+        carpeta = os.path.dirname(self.ruta)
+        if not os.path.exists(carpeta):
+            os.makedirs(carpeta)
+        contenido = json.dumps({"etag": self.etag, "version": self.version, "actualizado": self.actualizado,
+                                "productos": self.productos()}, indent=2, ensure_ascii=False)
+        almacenamiento.escribir_atomico(self.ruta, contenido.encode('utf-8'), durable=False)  # caché del firmware
+
+    @metricas.medido("catalogo.sincronizar")
+    def sincronizar(self, ip, timeout=5):
+        """Descarga /catalogo si cambió; devuelve True si hubo cambios
+
+        Se envía If-None-Match con el ETag guardado. El firmware actual no
+        manda ETag, así que además se compara un hash del contenido.
+        """
+        import requests
+
+        encabezados = {"If-None-Match": self.etag} if self.etag else {}
+        resp = requests.get(f"http://{ip}/catalogo", headers=encabezados, timeout=timeout)
+        if resp.status_code == 304:
+            metricas.contar("catalogo.sin_cambios")
+            return False
+        resp.raise_for_status()
+
+        version = hashlib.sha1(resp.content).hexdigest()[:16]
+        if version == self.version:
+            metricas.contar("catalogo.sin_cambios")
+            return False
+
+        for p in resp.json().get("productos", []):
+            self.registrar(p['codigo'], p.get('nombre'), p.get('descripcion', ""), actualizar=True)
+        self.etag = resp.headers.get("ETag")
+        self.version = version
+        self.actualizado = datetime.now().isoformat(timespec='seconds')
+        self.guardar()
+        metricas.contar("catalogo.actualizado")
+        return True
@@ -1,63 +1,74 @@
 import os
 import json
 from datetime import datetime
-from openai import OpenAI
+import argparse
+import indice_semantico
+import metricas
+import nucleo_analitico
+
+
+def _crear_cliente(api_key):
+    """Importa openai solo cuando se abre el chat"""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
 
 class ChatFinanciero:
-    def __init__(self, api_key=None, carpeta_reportes="reportes"):
+    def __init__(self, api_key=None, carpeta_reportes="reportes", bandeja_salida=None):
         """
         Inicializa el chat financiero con OpenAI
         
         Args:
             api_key: API key de OpenAI (si no se proporciona, busca en variable de entorno)
             carpeta_reportes: Carpeta donde están los reportes JSON
+            bandeja_salida: Bandeja donde dejar las preguntas hechas sin conexión
         """
         self.carpeta_reportes = carpeta_reportes
+        self.bandeja = bandeja_salida
         
         # Configurar API key
         if api_key:
-            self.client = OpenAI(api_key=api_key)
+            self.client = _crear_cliente(api_key)
+            _recordar_clave(carpeta_reportes, api_key)
         else:
             # Buscar en variable de entorno
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise ValueError("No se encontró API key de OpenAI. Configúrala con set_api_key() o variable de entorno OPENAI_API_KEY")
-            self.client = OpenAI(api_key=api_key)
+            self.client = _crear_cliente(api_key)
         
         self.historial_conversacion = []
+        self.indice = None  # índice semántico; se abre con la primera pregunta
         print("✓ Chat con OpenAI inicializado")
     
     def set_api_key(self, api_key):
         """Configura la API key de OpenAI"""
-        self.client = OpenAI(api_key=api_key)
+        self.client = _crear_cliente(api_key)
+        _recordar_clave(self.carpeta_reportes, api_key)
         print("✓ API key configurada")
     
+    def cargar_analisis(self):
+        """Carga los reportes y calcula sus métricas en una sola pasada"""
+        def avisar(ruta, e):
+            print(f"⚠ Error al cargar {os.path.basename(ruta)}: {e}")
+        
+        return nucleo_analitico.cargar(self.carpeta_reportes, avisar)
+    
     def cargar_reportes(self):
-        """Carga todos los reportes JSON disponibles"""
-        if not os.path.exists(self.carpeta_reportes):
-            return []
-        
-        reportes = []
-        archivos = [f for f in os.listdir(self.carpeta_reportes) if f.endswith('.json')]
-        
-        for archivo in archivos:
-            try:
-                ruta = os.path.join(self.carpeta_reportes, archivo)
-                with open(ruta, 'r', encoding='utf-8') as f:
-                    datos = json.load(f)
-                    reportes.append(datos)
-            except Exception as e:
-                print(f"⚠ Error al cargar {archivo}: {e}")
-        
-        return reportes
+        """Carga todos los reportes disponibles (JSON y segmentos NDJSON)"""
+        return self.cargar_analisis().reportes
     
-    def generar_contexto_rag(self):
-        """Genera el contexto RAG con todos los reportes disponibles"""
-        reportes = self.cargar_reportes()
+    def generar_contexto_rag(self, analisis=None, consulta=None, k=indice_semantico.K):
+        """Genera el contexto RAG; con una consulta, solo lo relevante y los últimos días"""
+        if analisis is None:
+            analisis = self.cargar_analisis()
+        reportes = analisis.reportes
         
         if not reportes:
             return "No hay reportes de ventas disponibles actualmente."
         
+        if consulta:
+            return self.generar_contexto_relevante(analisis, consulta, k)
+        
         contexto = "=== DATOS DE VENTAS DISPONIBLES ===\n\n"
         
         for i, reporte in enumerate(reportes, 1):
@@ -71,9 +82,7 @@ class ChatFinanciero:
             contexto += f"   Detalle de ventas:\n"
             
             for venta in reporte.get('ventas', []):
-                codigo = venta.get('codigo', 'N/A')
-                producto = venta.get('producto', 'N/A')
-                descripcion = venta.get('descripcion', '')
+                codigo, producto, descripcion = analisis.info_producto(venta)
                 valor = venta.get('valor', 0)
                 timestamp = venta.get('timestamp', 'N/A')
                 
@@ -83,53 +92,59 @@ class ChatFinanciero:
         
         return contexto
     
-    def calcular_estadisticas(self):
+    @metricas.medido("contexto.relevante")
+    def generar_contexto_relevante(self, analisis, consulta, k=indice_semantico.K, dias_recientes=7):
+        """Los k documentos del índice más parecidos a la consulta y el resumen de los últimos días"""
+        if self.indice is None:
+            self.indice = indice_semantico.IndiceSemantico(self.carpeta_reportes)
+        self.indice.sincronizar(analisis)
+        
+        contexto = "=== DATOS RELACIONADOS CON LA PREGUNTA ===\n\n"
+        encontrados = self.indice.buscar(consulta, k)
+        for puntaje, documento in encontrados:
+            contexto += f"[{documento['tipo']}] {documento['texto']}\n\n"
+        if not encontrados:
+            contexto += "(Nada en los reportes se parece a la pregunta)\n\n"
+        
+        vistos = {d["id"] for _, d in encontrados}
+        recientes = [f for f in sorted({r.get('fecha', '') for r in analisis.reportes})[-dias_recientes:]
+                     if f"dia:{f}" not in vistos]
+        if recientes:
+            contexto += "=== ÚLTIMOS DÍAS ===\n\n"
+            for fecha in recientes:
+                documento = self.indice.documento(f"dia:{fecha}")
+                if documento:
+                    contexto += documento["texto"] + "\n\n"
+        return contexto
+    
+    @metricas.medido("estadisticas.calcular")
+    def calcular_estadisticas(self, analisis=None):
         """Calcula estadísticas generales de todos los reportes"""
-        reportes = self.cargar_reportes()
+        a = analisis if analisis is not None else self.cargar_analisis()
         
-        if not reportes:
+        if not a:
             return None
         
-        total_ventas = 0
-        total_dinero = 0
-        productos_vendidos = {}
-        fechas = []
-        
-        for reporte in reportes:
-            total_ventas += reporte.get('total_ventas', 0)
-            total_dinero += reporte.get('total_dia', 0)
-            fechas.append(reporte.get('fecha', 'N/A'))
-            
-            for venta in reporte.get('ventas', []):
-                producto = venta.get('producto', 'Desconocido')
-                valor = venta.get('valor', 0)
-                
-                if producto not in productos_vendidos:
-                    productos_vendidos[producto] = {'cantidad': 0, 'total': 0}
-                
-                productos_vendidos[producto]['cantidad'] += 1
-                productos_vendidos[producto]['total'] += valor
-        
-        # Producto más vendido
-        producto_top = max(productos_vendidos.items(), 
-                          key=lambda x: x[1]['cantidad']) if productos_vendidos else None
+        producto_top = a.moda()
         
         estadisticas = {
-            'total_ventas': total_ventas,
-            'total_dinero': total_dinero,
-            'promedio_por_venta': total_dinero / total_ventas if total_ventas > 0 else 0,
-            'productos_diferentes': len(productos_vendidos),
-            'producto_mas_vendido': producto_top[0] if producto_top else 'N/A',
-            'cantidad_producto_top': producto_top[1]['cantidad'] if producto_top else 0,
-            'fechas_registradas': len(fechas),
-            'rango_fechas': f"{min(fechas)} a {max(fechas)}" if fechas else 'N/A'
+            'total_ventas': a.total_ventas,
+            'total_dinero': a.total_dinero,
+            'promedio_por_venta': a.promedio_por_venta,
+            'productos_diferentes': len(a.ventas_producto),
+            'producto_mas_vendido': producto_top[0],
+            'cantidad_producto_top': producto_top[1],
+            'fechas_registradas': a.dias,
+            'rango_fechas': a.rango_fechas
         }
         
         return estadisticas
     
-    def generar_contexto_estadisticas(self):
-        """Genera contexto con estadísticas resumidas"""
-        stats = self.calcular_estadisticas()
+    def generar_contexto_estadisticas(self, analisis=None):
+        """Genera contexto con estadísticas resumidas y el pronóstico"""
+        if analisis is None:
+            analisis = self.cargar_analisis()
+        stats = self.calcular_estadisticas(analisis)
         
         if not stats:
             return ""
@@ -142,6 +157,10 @@ class ChatFinanciero:
         contexto += f"📦 Productos diferentes: {stats['productos_diferentes']}\n"
         contexto += f"📅 Periodo: {stats['rango_fechas']}\n"
         
+        import pronostico
+        contexto += pronostico.texto_contexto(pronostico.pronosticar(analisis),
+                                              pronostico.pronosticar_productos(analisis.cubo()))
+        
         return contexto
     
     def chat(self, pregunta_usuario, incluir_estadisticas=True):
@@ -155,9 +174,42 @@ class ChatFinanciero:
         Returns:
             Respuesta del modelo
         """
+        # Agregar mensaje del usuario al historial
+        self.historial_conversacion.append({
+            "role": "user",
+            "content": pregunta_usuario
+        })
+        
+        try:
+            respuesta = self.preguntar(self.historial_conversacion, incluir_estadisticas)
+        except Exception as e:
+            self.historial_conversacion.pop()
+            import bandeja
+            if self.bandeja is not None and not bandeja.conectado(forzar=True):
+                self.bandeja.encolar("llm.pregunta", {
+                    "pregunta": pregunta_usuario,
+                    "estadisticas": incluir_estadisticas,
+                    "preguntada": datetime.now().isoformat(timespec='seconds'),
+                })
+                return ("📥 Sin conexión a internet: la pregunta quedó en la bandeja de salida y la "
+                        f"respuesta se guardará en {self.carpeta_reportes}/estado/{bandeja.ARCHIVO_RESPUESTAS}")
+            return f"❌ Error al comunicarse con OpenAI: {str(e)}"
+        
+        # Agregar respuesta al historial
+        self.historial_conversacion.append({
+            "role": "assistant",
+            "content": respuesta
+        })
+        
+        return respuesta
+    
+    def preguntar(self, mensajes, incluir_estadisticas=True):
+        """Llama a OpenAI con el contexto RAG actual y los mensajes dados; lanza si falla"""
         # Generar contexto RAG
-        contexto_reportes = self.generar_contexto_rag()
-        contexto_stats = self.generar_contexto_estadisticas() if incluir_estadisticas else ""
+        analisis = self.cargar_analisis()
+        consulta = next((m["content"] for m in reversed(mensajes) if m["role"] == "user"), None)
+        contexto_reportes = self.generar_contexto_rag(analisis, consulta)
+        contexto_stats = self.generar_contexto_estadisticas(analisis) if incluir_estadisticas else ""
         
         # Sistema prompt con contexto
         system_prompt = f"""Eres un asistente financiero experto especializado en análisis de ventas de papelerías.
@@ -178,35 +230,18 @@ Si te preguntan algo que no esté en los datos, indícalo claramente.
 Siempre menciona los valores en pesos colombianos (COP).
 """
         
-        # Agregar mensaje del usuario al historial
-        self.historial_conversacion.append({
-            "role": "user",
-            "content": pregunta_usuario
-        })
-        
-        try:
-            # Llamar a OpenAI API
+        # Llamar a OpenAI API
+        with metricas.medir("llm.chat"):
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",  # Puedes cambiar a "gpt-4" si tienes acceso
                 messages=[
                     {"role": "system", "content": system_prompt}
-                ] + self.historial_conversacion,
+                ] + mensajes,
                 temperature=0.7,
                 max_tokens=1500
             )
-            
-            respuesta = response.choices[0].message.content
-            
-            # Agregar respuesta al historial
-            self.historial_conversacion.append({
-                "role": "assistant",
-                "content": respuesta
-            })
-            
-            return respuesta
         
-        except Exception as e:
-            return f"❌ Error al comunicarse con OpenAI: {str(e)}"
+        return response.choices[0].message.content
     
     def limpiar_historial(self):
         """Limpia el historial de conversación"""
@@ -214,10 +249,13 @@ Siempre menciona los valores en pesos colombianos (COP).
         print("✓ Historial de conversación limpiado")
     
     def exportar_conversacion(self, nombre_archivo=None):
-        """Exporta la conversación a un archivo JSON"""
+        """Exporta la conversación a un archivo JSON (por defecto en reportes/conversaciones/)"""
         if not nombre_archivo:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            nombre_archivo = f"conversacion_{timestamp}.json"
+            carpeta = os.path.join(self.carpeta_reportes, indice_semantico.CARPETA_CONVERSACIONES)
+            if not os.path.exists(carpeta):
+                os.makedirs(carpeta)
+            nombre_archivo = os.path.join(carpeta, f"conversacion_{timestamp}.json")
         
         with open(nombre_archivo, 'w', encoding='utf-8') as f:
             json.dump(self.historial_conversacion, f, indent=2, ensure_ascii=False)
@@ -225,7 +263,37 @@ Siempre menciona los valores en pesos colombianos (COP).
         print(f"✓ Conversación exportada a: {nombre_archivo}")
 
 
-def menu_chat():
+_chats_diferidos = {}
+_claves = {}  # API key escrita en el chat, solo en memoria (no se guarda con la pregunta)
+
+
+def _recordar_clave(carpeta_reportes, api_key):
+    """Guarda la clave para las respuestas diferidas de esta sesión"""
+    if _claves.get(carpeta_reportes) != api_key:
+        _claves[carpeta_reportes] = api_key
+        _chats_diferidos.pop(carpeta_reportes, None)
+
+
+def responder_diferida(datos, carpeta_reportes="reportes"):
+    """Responde una pregunta que quedó en la bandeja de salida; lanza si falla
+
+    Usa la API key con la que se abrió el chat en esta sesión, o OPENAI_API_KEY.
+    """
+    chat = _chats_diferidos.get(carpeta_reportes)
+    if chat is None:
+        api_key = _claves.get(carpeta_reportes) or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            # No es permanente: se responde cuando se abra el chat con la clave
+            raise RuntimeError("Sin API key de OpenAI; se responderá al abrir el chat con la clave")
+        chat = _chats_diferidos[carpeta_reportes] = ChatFinanciero(api_key, carpeta_reportes)
+    respuesta = chat.preguntar([{"role": "user", "content": datos["pregunta"]}], datos.get("estadisticas", True))
+    import bandeja
+    ruta = bandeja.guardar_respuesta(carpeta_reportes, datos["pregunta"], respuesta, datos.get("preguntada"))
+    print(f"\n📬 Respuesta diferida a «{datos['pregunta'][:40]}» guardada en {ruta}")
+    return respuesta
+
+
+def menu_chat(bandeja_salida=None):
     """Menú interactivo para el chat financiero"""
     
     # Verificar si existe API key
@@ -258,7 +326,8 @@ def menu_chat():
             return
     
     try:
-        chat = ChatFinanciero(api_key=api_key)
+        carpeta = bandeja_salida.carpeta_reportes if bandeja_salida is not None else "reportes"
+        chat = ChatFinanciero(api_key=api_key, carpeta_reportes=carpeta, bandeja_salida=bandeja_salida)
     except Exception as e:
         print(f"\n❌ Error al inicializar chat: {e}")
         return
@@ -296,10 +365,10 @@ def menu_chat():
             continue
         
         if pregunta.lower() in ['stats', 'estadisticas', 'resumen']:
-            stats = chat.calcular_estadisticas()
-            if stats:
+            analisis = chat.cargar_analisis()
+            if analisis:
                 print("\n" + "📊 "*20)
-                print(chat.generar_contexto_estadisticas())
+                print(chat.generar_contexto_estadisticas(analisis))
                 print("📊 "*20 + "\n")
             else:
                 print("\n⚠ No hay datos disponibles\n")
@@ -310,5 +379,19 @@ def menu_chat():
         print(respuesta + "\n")
 
 
+# Acciones que se pueden perfilar sin menú (--profile-accion); "pregunta" llama a la API
+ACCIONES_PERFIL = {
+    "cargar": lambda c: c.cargar_reportes(),
+    "contexto": lambda c: c.generar_contexto_rag(),
+    "estadisticas": lambda c: c.generar_contexto_estadisticas(),
+    "pregunta": lambda c: c.chat("¿Cuál fue el producto más vendido?"),
+}
+
+
 if __name__ == "__main__":
-    menu_chat()
\ No newline at end of file
+    import perfilado
+    parser = argparse.ArgumentParser(description="Chat financiero con IA")
+    perfilado.agregar_opciones(parser, ACCIONES_PERFIL)
+    args = parser.parse_args()
+    perfilado.ejecutar(args, menu_chat, ACCIONES_PERFIL,
+                       lambda: ChatFinanciero(api_key=os.getenv("OPENAI_API_KEY") or "sin-api-key"))
\ No newline at end of file
@@ -0,0 +1,155 @@
+import os
+import time
+import argparse
+from contextlib import nullcontext
+from datetime import datetime
+import almacenamiento
+import metricas
+
+# Archivo de los meses cerrados: junta todos los reportes de cada mes anterior
+# al actual en un solo NDJSON comprimido (reportes/archivo/YYYY/MM/).
+#
+#   compactar("reportes")                      # todos los meses cerrados
+#   compactar("reportes", hasta_mes="2024-06") # solo los anteriores a junio de 2024
+#   iterar_reportes("reportes", desde="2024-05-01", hasta="2024-05-31")
+#
+#   python compactacion.py --carpeta reportes
+#
+# Para cada mes se escribe una versión nueva del archivo, luego el índice (con
+# las fuentes anotadas como "pendientes") y recién entonces se borran los
+# reportes sueltos y el segmento del mes. Si el proceso se corta, los lectores
+# ya ignoran las fuentes pendientes y la siguiente compactación termina de
+# borrarlas, así que ningún reporte se cuenta dos veces ni se pierde.
+# El segmento del mes se bloquea (almacenamiento.bloqueo) desde que se lee hasta
+# que se borra: un reporte atrasado que llega mientras tanto espera y va a un
+# segmento nuevo, en vez de añadirse a uno que está por borrarse.
+
+
+def _terminar_pendientes(carpeta, archivo, indice):
+    """Borra las fuentes que una compactación interrumpida dejó anotadas"""
+    for relativa in indice["pendientes"]:
+        ruta = os.path.join(carpeta, relativa)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    if indice["pendientes"]:
+        indice["pendientes"] = []
+        archivo.guardar_indice(indice)
+
+
+def fuentes_por_mes(carpeta):
+    """{mes: [rutas relativas]} de los reportes JSON y segmentos NDJSON aún sin archivar"""
+    fuentes = {}
+    for entrada in os.scandir(carpeta):
+        if not entrada.name.endswith('.json') or not entrada.is_file():
+            continue
+        fecha = almacenamiento._fecha_en_nombre(entrada.name)
+        if fecha is None:
+            try:
+                fecha = almacenamiento.leer_json(entrada.path).get('fecha', '')
+            except Exception:
+                continue  # ilegible: se queda donde está (lo muestra diario.py --verificar)
+        if len(fecha) >= 7:
+            fuentes.setdefault(fecha[:7], []).append(entrada.name)
+    for mes in almacenamiento.AlmacenNDJSON(carpeta).segmentos():
+        fuentes.setdefault(mes, []).append(f"{almacenamiento.CARPETA_SEGMENTOS}/{mes}.ndjson")
+    return fuentes
+
+
+def _leer_fuentes(carpeta, relativas, ilegibles):
+    """Reportes de las fuentes de un mes; las que no se pueden leer quedan en ilegibles"""
+    reportes = []
+    for relativa in relativas:
+        ruta = os.path.join(carpeta, relativa)
+        if relativa.endswith(".ndjson"):
+            with open(ruta, 'rb') as f:
+                for linea in f:
+                    if not linea.strip():
+                        continue
+                    try:
+                        reportes.append(almacenamiento._loads(linea))
+                    except ValueError:
+                        # Se guarda aparte dentro del archivo del mes para revisarla a mano
+                        ilegibles.append(linea if linea.endswith(b"\n") else linea + b"\n")
+            continue
+        try:
+            reportes.append(almacenamiento.leer_json(ruta))
+        except Exception:
+            ilegibles.append(relativa)
+    return reportes
+
+
+def _compactar_mes(carpeta, archivo, indice, mes, fuentes):
+    """Escribe la versión nueva del mes, anota sus fuentes y las borra; devuelve cuántos reportes tiene"""
+    anterior = indice["particiones"].get(mes)
+    reportes = list(archivo.leer_particion(anterior)) if anterior else []
+    ilegibles = []
+    reportes += _leer_fuentes(carpeta, fuentes, ilegibles)
+    reportes.sort(key=lambda r: r.get('fecha', ''))
+
+    version = anterior["version"] + 1 if anterior else 1
+    indice["particiones"][mes] = archivo.escribir(mes, reportes, version)
+    lineas_rotas = [l for l in ilegibles if isinstance(l, bytes)]
+    if lineas_rotas:
+        ruta = os.path.join(os.path.dirname(archivo.ruta_particion(mes, version)), "ilegibles.ndjson")
+        with open(ruta, 'ab') as f:
+            f.write(b"".join(lineas_rotas))
+        print(f"⚠ {mes}: {len(lineas_rotas)} línea(s) ilegible(s) apartada(s) en {ruta}")
+
+    # Punto de no retorno: desde aquí el índice manda y las fuentes sobran
+    borrar = [r for r in fuentes if r not in ilegibles]
+    if anterior:
+        borrar.append(anterior["ruta"])
+    indice["pendientes"] = borrar
+    archivo.guardar_indice(indice)
+    _terminar_pendientes(carpeta, archivo, indice)
+    return len(reportes)
+
+
+@metricas.medido("archivo.compactar")
+def compactar(carpeta="reportes", hasta_mes=None):
+    """Archiva los meses anteriores a hasta_mes (por defecto el actual); devuelve {mes: reportes}"""
+    if not os.path.exists(carpeta):
+        return {}
+    hasta_mes = hasta_mes or datetime.now().strftime('%Y-%m')
+    archivo = almacenamiento.ArchivoMensual(carpeta)
+    indice = archivo.indice()
+    _terminar_pendientes(carpeta, archivo, indice)
+
+    fuentes = fuentes_por_mes(carpeta)
+    almacen = almacenamiento.AlmacenNDJSON(carpeta)
+    archivados = {}
+    for mes in sorted(m for m in fuentes if m < hasta_mes):
+        segmento = f"{almacenamiento.CARPETA_SEGMENTOS}/{mes}.ndjson"
+        with almacen.bloquear(mes) if segmento in fuentes[mes] else nullcontext():
+            archivados[mes] = _compactar_mes(carpeta, archivo, indice, mes, fuentes[mes])
+        metricas.contar("archivo.meses")
+        metricas.contar("archivo.reportes", archivados[mes])
+    return archivados
+
+
+def mostrar_indice(carpeta="reportes"):
+    particiones = almacenamiento.ArchivoMensual(carpeta).indice()["particiones"]
+    if not particiones:
+        print("⚠ No hay meses archivados")
+        return
+    print(f"\n{'Mes':<8} {'Reportes':>8} {'Desde':<11} {'Hasta':<11} {'Total':>14} {'KB':>8}")
+    for mes, p in sorted(particiones.items()):
+        print(f"{mes:<8} {p['reportes']:>8} {p['desde']:<11} {p['hasta']:<11} "
+              f"${p['total_dia']:>13,.0f} {p['bytes'] / 1024:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiva los meses cerrados en un archivo comprimido por mes")
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--hasta-mes", default=None, help="Archivar los meses anteriores a este (YYYY-MM)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    archivados = compactar(args.carpeta, args.hasta_mes)
+    print(f"✓ {len(archivados)} mes(es) archivado(s), {sum(archivados.values())} reporte(s) "
+          f"en {time.perf_counter() - inicio:.2f}s")
+    mostrar_indice(args.carpeta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import numpy as np
+import metricas
+
+# Cubo de ventas fecha × producto × hora en arreglos densos de NumPy.
+#
+#   cubo = CuboVentas(reportes)
+#   cubo.por_hora()                              -> ventas por hora del día
+#   cubo.por_periodo("semana", medida="ingresos") -> ingresos por semana y producto
+#   cubo.mapa_calor()                            -> día de la semana × hora
+#
+# Se llena una sola vez y luego solo con los reportes nuevos (agregar; quitar
+# descuenta la foto anterior de un día que llegó actualizada), así las
+# preguntas por hora, semana o producto no vuelven a recorrer cada venta.
+
+MEDIDAS = ("ventas", "ingresos")
+HORAS = 24
+SIN_HORA = HORAS  # casilla extra para ventas sin timestamp válido ("N/A")
+DIAS_SEMANA = ("Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom")
+
+# Holgura al crecer, para no copiar el cubo en cada reporte nuevo
+HOLGURA_DIAS = 64
+HOLGURA_PRODUCTOS = 8
+
+
+def _hora(timestamp):
+    """Hora de 'YYYY-MM-DD HH:MM:SS', o SIN_HORA si no se puede leer"""
+    if timestamp and len(timestamp) >= 13 and timestamp[11:13].isdigit():
+        hora = int(timestamp[11:13])
+        if hora < HORAS:
+            return hora
+    return SIN_HORA
+
+
+class CuboVentas:
+    """Conteo de ventas e ingresos por día, producto y hora"""
+
+    def __init__(self, reportes=(), catalogo=None):
+        self.inicio = None       # día 0 del cubo, en días desde 1970-01-01
+        self.dias = 0
+        self.catalogo = catalogo
+        self.productos = []
+        self._indice = {}        # id de producto (o nombre, sin catálogo) -> columna
+        self._columna = {}       # nombre -> columna
+        self.ventas = np.zeros((0, 0, HORAS + 1), dtype=np.int32)
+        self.ingresos = np.zeros((0, 0, HORAS + 1), dtype=np.int64)
+        self.agregar(reportes)
+
+    def __bool__(self):
+        return self.dias > 0
+
+    def agregar(self, reportes):
+        """Suma las ventas de los reportes al cubo"""
+        self._sumar(reportes, 1)
+
+    def quitar(self, reportes):
+        """Resta las ventas de reportes ya sumados (reemplazados por otra foto del día)"""
+        self._sumar(reportes, -1)
+
+    def _sumar(self, reportes, signo):
+        dias, productos, horas, valores = [], [], [], []
+        with metricas.medir("cubo.agregar"):
+            for r in reportes:
+                ventas = r.get('ventas', [])
+                if not ventas:
+                    continue
+                try:
+                    dia = np.datetime64(r.get('fecha', ''), 'D')
+                except ValueError:
+                    dia = np.datetime64('NaT')
+                if np.isnat(dia):
+                    metricas.contar("cubo.fechas_invalidas")
+                    continue
+                dia = int(dia.astype(np.int64))
+
+                for v in ventas:
+                    clave = v.get('pid')
+                    if clave is None:
+                        clave = (self.catalogo.id_de(v.get('codigo'), v.get('producto')) if self.catalogo
+                                 else v.get('producto', 'Desconocido'))
+                    i = self._indice.get(clave)
+                    if i is None:
+                        i = self._indice[clave] = len(self.productos)
+                        nombre = self.catalogo.nombre(clave) if self.catalogo else clave
+                        self.productos.append(nombre)
+                        self._columna.setdefault(nombre, i)
+                    dias.append(dia)
+                    productos.append(i)
+                    horas.append(_hora(v.get('timestamp')))
+                    valores.append(v.get('valor', 0))
+
+            if not dias:
+                return
+            dias = np.asarray(dias, dtype=np.int64)
+            self._asegurar(int(dias.min()), int(dias.max()))
+
+            indices = (dias - self.inicio, np.asarray(productos), np.asarray(horas))
+            np.add.at(self.ventas, indices, signo)
+            np.add.at(self.ingresos, indices, signo * np.asarray(valores, dtype=np.int64))
+
+    def _asegurar(self, primero, ultimo):
+        """Amplía los arreglos para cubrir los días [primero, ultimo] y todos los productos"""
+        if self.inicio is None:
+            self.inicio = primero
+        corrimiento = max(0, self.inicio - primero)
+        dias = max(self.dias + corrimiento, ultimo - min(self.inicio, primero) + 1)
+
+        cap_dias, cap_productos = self.ventas.shape[:2]
+        if not corrimiento and dias <= cap_dias and len(self.productos) <= cap_productos:
+            self.dias = dias
+            return
+
+        forma = (max(dias + HOLGURA_DIAS, cap_dias + corrimiento),
+                 max(len(self.productos) + HOLGURA_PRODUCTOS, cap_productos), HORAS + 1)
+        for nombre in MEDIDAS:
+            viejo = getattr(self, nombre)
+            nuevo = np.zeros(forma, dtype=viejo.dtype)
+            nuevo[corrimiento:corrimiento + self.dias, :viejo.shape[1]] = viejo[:self.dias]
+            setattr(self, nombre, nuevo)
+        self.inicio -= corrimiento
+        self.dias = dias
+
+    # ========== CONSULTAS ==========
+
+    def datos(self, medida="ventas"):
+        """Vista (días × productos × horas+1) de la medida, sin la holgura"""
+        if medida not in MEDIDAS:
+            raise ValueError(f"Medida desconocida: {medida} (use {', '.join(MEDIDAS)})")
+        return getattr(self, medida)[:self.dias, :len(self.productos)]
+
+    def fechas(self):
+        """Fechas (datetime64[D]) de cada fila del cubo"""
+        return (np.arange(self.dias) + (self.inicio or 0)).astype('datetime64[D]')
+
+    def _producto(self, datos, producto):
+        """Suma sobre productos, o la columna de uno solo"""
+        if producto is None:
+            return datos.sum(axis=1)
+        i = self._columna.get(producto)
+        return datos[:, i] if i is not None else np.zeros((datos.shape[0], datos.shape[2]), datos.dtype)
+
+    def rebanar(self, desde=None, hasta=None, productos=None, medida="ventas"):
+        """Sub-cubo entre dos fechas (YYYY-MM-DD, inclusive) y para ciertos productos
+
+        Devuelve (fechas, productos, arreglo días × productos × horas+1).
+        """
+        fechas = self.fechas()
+        mascara = np.ones(self.dias, dtype=bool)
+        if desde:
+            mascara &= fechas >= np.datetime64(desde, 'D')
+        if hasta:
+            mascara &= fechas <= np.datetime64(hasta, 'D')
+        nombres = list(productos) if productos is not None else list(self.productos)
+        columnas = [self._columna[p] for p in nombres if p in self._columna]
+        nombres = [p for p in nombres if p in self._columna]
+        return fechas[mascara], nombres, self.datos(medida)[mascara][:, columnas]
+
+    def por_hora(self, producto=None, medida="ventas"):
+        """Total por hora del día (24 valores); las ventas sin hora quedan fuera"""
+        return self._producto(self.datos(medida), producto)[:, :HORAS].sum(axis=0)
+
+    def por_dia(self, producto=None, medida="ventas"):
+        """(fechas, total por día)"""
+        return self.fechas(), self._producto(self.datos(medida), producto).sum(axis=1)
+
+    def por_producto(self, medida="ventas"):
+        """{producto: total}"""
+        totales = self.datos(medida).sum(axis=(0, 2))
+        return dict(zip(self.productos, totales.tolist()))
+
+    def por_periodo(self, periodo="semana", medida="ventas"):
+        """(etiquetas, matriz periodos × productos) agrupando días por 'semana' o 'mes'"""
+        if not self.dias:
+            return [], np.zeros((0, len(self.productos)))
+        fechas = self.fechas()
+        if periodo == "semana":
+            # Semanas de lunes a domingo; 1970-01-01 fue jueves
+            grupos = fechas - ((fechas.astype(np.int64) + 3) % 7)
+        elif periodo == "mes":
+            grupos = fechas.astype('datetime64[M]')
+        else:
+            raise ValueError(f"Periodo desconocido: {periodo} (use semana o mes)")
+
+        # Las filas están en orden de fecha: cada grupo es un tramo contiguo
+        inicios = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]])
+        matriz = np.add.reduceat(self.datos(medida).sum(axis=2), inicios, axis=0)
+        return [str(g) for g in grupos[inicios]], matriz
+
+    def mapa_calor(self, medida="ventas"):
+        """Matriz 7 × 24: día de la semana (lunes=0) × hora del día"""
+        mapa = np.zeros((7, HORAS), dtype=self.datos(medida).dtype)
+        if self.dias:
+            dia_semana = (self.fechas().astype(np.int64) + 3) % 7
+            np.add.at(mapa, dia_semana, self.datos(medida).sum(axis=1)[:, :HORAS])
+        return mapa
+
+    def tendencia_productos(self, n=5, periodo="semana", medida="ingresos"):
+        """(etiquetas, {producto: serie}) de los n productos con mayor total"""
+        etiquetas, matriz = self.por_periodo(periodo, medida)
+        if not len(etiquetas):
+            return etiquetas, {}
+        top = np.argsort(matriz.sum(axis=0))[::-1][:n]
+        return etiquetas, {self.productos[i]: matriz[:, i] for i in top}
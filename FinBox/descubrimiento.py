@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import argparse
+import ipaddress
+from datetime import datetime
+import almacenamiento
+import metricas
+
+# Búsqueda del ESP32 en la red local, para no depender de una IP fija.
+#
+#   tabla = TablaDispositivos("reportes")          # caché en reportes/estado/dispositivos.json
+#   encontrados = descubrir(tabla)                 # conocidos + finbox-XXXXXX.local, si no toda la /24
+#   direccion = resolver("192.168.1.100", tabla)   # la misma si responde, si no la nueva
+#   identificar("192.168.1.100", tabla)            # id (MAC) de la caja, para marcar sus reportes
+#
+#   python descubrimiento.py --red 192.168.1.0/24 --completo
+#
+# Se consulta /status de cada dirección a la vez (asyncio) con un timeout
+# corto, así recorrer una /24 toma lo que tarda un solo timeout. Solo cuentan
+# las respuestas con la forma del firmware: {"ventas": n, "status": "ok", "id": MAC}.
+# Con varias cajas en la red, una IP nueva solo se adopta si responde la misma
+# caja (mismo "id"); el firmware anterior, sin "id", solo si hay una sola caja.
+# Cada caja se anuncia por mDNS como finbox-<3 últimos bytes de su MAC>.local;
+# se prueban los nombres de las cajas ya conocidas y finbox.local (firmware anterior).
+
+PUERTO = 80
+TIMEOUT = 0.4  # segundos por dirección
+CONCURRENCIA = 256
+PREFIJO_MDNS = "finbox"  # el firmware anuncia finbox-a1b2c3.local con ESPmDNS
+CARPETA_ESTADO = "estado"
+ARCHIVO_DISPOSITIVOS = "dispositivos.json"
+
+
+def ip_local():
+    """IP de este PC en la red local (no envía paquetes)"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.connect(("10.255.255.255", 1))
+            return s.getsockname()[0]
+        except OSError:
+            return "127.0.0.1"
+
+
+def ips_subred(red=None):
+    """Direcciones de la red (por defecto la /24 de este PC)"""
+    red = ipaddress.ip_network(red or f"{ip_local()}/24", strict=False)
+    return [str(ip) for ip in red.hosts()]
+
+
+def direccion(ip, puerto=PUERTO):
+    """Lo que va en la URL: "ip" o "ip:puerto" si no es el 80"""
+    return ip if puerto == PUERTO else f"{ip}:{puerto}"
+
+
+async def sondear(ip, puerto=PUERTO, timeout=TIMEOUT):
+    """Datos del dispositivo si en ip:puerto responde un ESP32 de FinBox, o None"""
+    inicio = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, puerto), timeout)
+        writer.write(f"GET /status HTTP/1.0\r\nHost: {ip}\r\n\r\n".encode('latin-1'))
+        respuesta = await asyncio.wait_for(reader.read(), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        if writer:
+            writer.close()
+
+    cabecera, _, cuerpo = respuesta.partition(b"\r\n\r\n")
+    linea = cabecera.split(b"\r\n", 1)[0].split()
+    if len(linea) < 2 or linea[1] != b"200":
+        return None
+    try:
+        estado = json.loads(cuerpo)
+    except ValueError:
+        return None
+    if not isinstance(estado, dict) or estado.get("status") != "ok" or "ventas" not in estado:
+        return None
+    return {
+        "ip": ip,
+        "puerto": puerto,
+        "direccion": direccion(ip, puerto),
+        "ventas": estado["ventas"],
+        "id": estado.get("id"),  # MAC; None con el firmware anterior
+        "latencia_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+async def explorar(destinos, timeout=TIMEOUT, concurrencia=CONCURRENCIA):
+    """Sondea todos los (ip, puerto) a la vez; devuelve los que respondieron, en el mismo orden"""
+    limite = asyncio.Semaphore(concurrencia)
+
+    async def uno(ip, puerto):
+        async with limite:
+            return await sondear(ip, puerto, timeout)
+
+    resultados = await asyncio.gather(*(uno(ip, puerto) for ip, puerto in destinos))
+    return [d for d in resultados if d]
+
+
+def nombre_mdns(dispositivo_id=None):
+    """Nombre mDNS de la caja con ese id (MAC): finbox-a1b2c3.local; sin id, el del firmware anterior"""
+    if not dispositivo_id:
+        return f"{PREFIJO_MDNS}.local"
+    return f"{PREFIJO_MDNS}-{dispositivo_id.replace(':', '')[-6:].lower()}.local"
+
+
+async def buscar_mdns(nombres=None, timeout=1.0):
+    """IPs que el sistema resuelve para esos nombres .local; vacío si no hay soporte de mDNS"""
+    loop = asyncio.get_running_loop()
+
+    async def resolver_nombre(nombre):
+        try:
+            infos = await asyncio.wait_for(loop.getaddrinfo(nombre, None, family=socket.AF_INET), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return []
+        return [info[4][0] for info in infos]
+
+    resultados = await asyncio.gather(*(resolver_nombre(n) for n in (nombres or [nombre_mdns()])))
+    return sorted({ip for ips in resultados for ip in ips})
+
+
+class TablaDispositivos:
+    """Dispositivos encontrados y cuándo se vieron por última vez"""
+
+    def __init__(self, carpeta_reportes="reportes"):
+        self.ruta = os.path.join(carpeta_reportes, CARPETA_ESTADO, ARCHIVO_DISPOSITIVOS)
+        self.dispositivos = {}  # direccion -> {ip, puerto, direccion, ventas, latencia_ms, origen, visto}
+        if os.path.exists(self.ruta):
+            self.cargar()
+
+    def __len__(self):
+        return len(self.dispositivos)
+
+    def cargar(self):
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                self.dispositivos = json.load(f).get("dispositivos", {})
+        except (OSError, ValueError) as e:
+            print(f"⚠ Tabla de dispositivos ilegible, se empieza vacía: {e}")
+
+    def guardar(self):
+        carpeta = os.path.dirname(self.ruta)
+        if not os.path.exists(carpeta):
+            os.makedirs(carpeta)
+        contenido = json.dumps({"dispositivos": self.dispositivos}, indent=2, ensure_ascii=False)
+        almacenamiento.escribir_atomico(self.ruta, contenido.encode('utf-8'), durable=False)  # se rearma buscando
+
+    def actualizar(self, encontrados):
+        ahora = datetime.now().isoformat(timespec='seconds')
+        for d in encontrados:
+            self.dispositivos[d["direccion"]] = {**self.dispositivos.get(d["direccion"], {}), **d, "visto": ahora}
+        if encontrados:
+            self.guardar()
+
+    def recientes(self):
+        """Dispositivos del más recientemente visto al más antiguo"""
+        return sorted(self.dispositivos.values(), key=lambda d: d.get("visto", ""), reverse=True)
+
+    def id_de(self, direccion):
+        """Id (MAC) de la caja que se vio por última vez en esa dirección, o None"""
+        return self.dispositivos.get(direccion, {}).get("id")
+
+    def preferido(self):
+        """Dirección del último dispositivo visto, o None"""
+        recientes = self.recientes()
+        return recientes[0]["direccion"] if recientes else None
+
+
+async def _descubrir(tabla, red, puerto, timeout, mdns, completo):
+    destinos = {}
+    for d in (tabla.recientes() if tabla else []):
+        destinos.setdefault((d["ip"], d.get("puerto", PUERTO)), "caché")
+    nombres = [nombre_mdns()]
+    for d in (tabla.recientes() if tabla else []):
+        if d.get("id") and nombre_mdns(d["id"]) not in nombres:
+            nombres.append(nombre_mdns(d["id"]))
+    for ip in (await buscar_mdns(nombres) if mdns else []):
+        destinos.setdefault((ip, puerto), "mdns")
+
+    encontrados = await explorar(list(destinos), timeout)
+    if completo or not encontrados:
+        vistos = {(d["ip"], d["puerto"]) for d in encontrados}
+        subred = [(ip, puerto) for ip in ips_subred(red) if (ip, puerto) not in vistos]
+        destinos.update((destino, "subred") for destino in subred if destino not in destinos)
+        encontrados += await explorar(subred, timeout)
+
+    for d in encontrados:
+        d["origen"] = destinos[(d["ip"], d["puerto"])]
+    return encontrados
+
+
+@metricas.medido("descubrimiento.buscar")
+def descubrir(tabla=None, red=None, puerto=PUERTO, timeout=TIMEOUT, mdns=True, completo=False):
+    """Busca ESP32: primero los conocidos y sus nombres mDNS; la subred entera solo si ninguno responde
+
+    Con completo=True siempre se recorre la subred. Actualiza la tabla si se pasa.
+    """
+    encontrados = asyncio.run(_descubrir(tabla, red, puerto, timeout, mdns, completo))
+    metricas.contar("descubrimiento.encontrados", len(encontrados))
+    if tabla is not None:
+        tabla.actualizar(encontrados)
+    return encontrados
+
+
+def elegir(encontrados, dispositivo_id=None):
+    """La caja con ese id entre las encontradas; sin id conocido, solo si se encontró una sola"""
+    if dispositivo_id:
+        return next((d for d in encontrados if d.get("id") == dispositivo_id), None)
+    return encontrados[0] if len(encontrados) == 1 else None
+
+
+def localizar(tabla=None, dispositivo_id=None, **opciones):
+    """(caja con ese id o None, todas las encontradas); si no está entre las conocidas, recorre la subred"""
+    encontrados = descubrir(tabla, **opciones)
+    elegido = elegir(encontrados, dispositivo_id)
+    if elegido is None and dispositivo_id and not opciones.get("completo"):
+        encontrados = descubrir(tabla, **{**opciones, "completo": True})
+        elegido = elegir(encontrados, dispositivo_id)
+    return elegido, encontrados
+
+
+def resolver(actual, tabla=None, dispositivo_id=None, **opciones):
+    """Dirección del ESP32: `actual` si responde la misma caja; si no, dónde está ahora (o None)
+
+    La caja se reconoce por dispositivo_id o, si no se da, por el id que la
+    tabla tenía para `actual`.
+    """
+    if dispositivo_id is None and tabla is not None:
+        dispositivo_id = tabla.id_de(actual)  # antes de que la tabla se actualice
+    ip, _, puerto = actual.partition(":")
+    d = asyncio.run(sondear(ip, int(puerto or PUERTO), opciones.get("timeout", TIMEOUT) * 2))
+    if d and tabla is not None:
+        tabla.actualizar([{**d, "origen": "configurada"}])
+    if d and (not dispositivo_id or d["id"] in (None, dispositivo_id)):
+        return actual
+    elegido, _ = localizar(tabla, dispositivo_id, **opciones)
+    return elegido["direccion"] if elegido else None
+
+
+def identificar(actual, tabla=None, timeout=TIMEOUT):
+    """Id (MAC) de la caja en `actual`: el que tiene la tabla o, si no, el que da su /status"""
+    conocido = tabla.id_de(actual) if tabla is not None else None
+    if conocido:
+        return conocido
+    ip, _, puerto = actual.partition(":")
+    d = asyncio.run(sondear(ip, int(puerto or PUERTO), timeout * 2))
+    if d and tabla is not None:
+        tabla.actualizar([{**d, "origen": "configurada"}])
+    return d["id"] if d else None
+
+
+def mostrar_tabla(dispositivos):
+    if not dispositivos:
+        print("✗ No se encontró ningún ESP32")
+        return
+    print(f"\n{'Dirección':<22} {'Id':<18} {'Ventas':>6} {'Latencia':>9}  {'Origen':<8} Visto")
+    for d in dispositivos:
+        print(f"{d['direccion']:<22} {d.get('id') or '?':<18} {d.get('ventas', '?'):>6} "
+              f"{d.get('latencia_ms', 0):>7.1f}ms  {d.get('origen', ''):<8} {d.get('visto', '')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Busca los ESP32 de FinBox en la red local")
+    parser.add_argument("--red", default=None, help="Red a recorrer, p. ej. 192.168.1.0/24 (por defecto la /24 local)")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT)
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--completo", action="store_true", help="Recorrer la subred aunque respondan los conocidos")
+    parser.add_argument("--sin-mdns", action="store_true")
+    args = parser.parse_args()
+
+    tabla = TablaDispositivos(args.carpeta)
+    print(f"🔍 Buscando ESP32 en {args.red or ip_local() + '/24'}...")
+    inicio = time.perf_counter()
+    encontrados = descubrir(tabla, args.red, args.puerto, args.timeout, not args.sin_mdns, args.completo)
+    print(f"✓ {len(encontrados)} dispositivo(s) en {time.perf_counter() - inicio:.2f}s")
+    mostrar_tabla(tabla.recientes())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+import gzip
+import json
+import time
+import argparse
+import itertools
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import almacenamiento
+import metricas
+
+# Diario de escritura (write-ahead) y verificación de los reportes guardados.
+#
+#   diario = Diario("reportes")
+#   diario.recuperar()                       # al arrancar: rehace lo que quedó a medias
+#   entrada = diario.anotar(datos, "json")   # apenas llega el reporte del ESP32
+#   ruta = diario.confirmar(entrada)         # lo escribe y borra la anotación
+#
+#   verificar("reportes")                    # [(archivo[:línea], problema)] en paralelo
+#   python diario.py --verificar
+#
+# Cada anotación es un archivo en reportes/estado/diario/ con el reporte, el
+# formato y la hora del nombre final. Si el programa se cae entre anotar y
+# confirmar, recuperar() vuelve a escribirlo. Solo mira las anotaciones
+# pendientes, así que arrancar cuesta lo mismo con 10 o con 100.000 reportes.
+
+CARPETA_ESTADO = "estado"
+CARPETA_DIARIO = "diario"
+
+
+class Diario:
+    """Anotaciones de las escrituras de reportes en curso"""
+
+    def __init__(self, carpeta_reportes="reportes"):
+        self.carpeta_reportes = carpeta_reportes
+        self.carpeta = os.path.join(carpeta_reportes, CARPETA_ESTADO, CARPETA_DIARIO)
+        self._contador = itertools.count()
+
+    def anotar(self, datos, formato="json"):
+        """Guarda la escritura pendiente en el diario antes de hacerla"""
+        if formato not in almacenamiento.FORMATOS:
+            raise ValueError(f"Formato de reportes desconocido: {formato}")
+        if not os.path.exists(self.carpeta):
+            os.makedirs(self.carpeta)
+
+        entrada = {"formato": formato, "hora": datetime.now().strftime('%H%M%S'), "datos": datos}
+        if formato == "ndjson":
+            # Tamaño del segmento antes de escribir: al recuperar solo se mira de ahí en adelante
+            fecha = datos.get('fecha', datetime.now().strftime('%Y-%m-%d'))
+            segmento = almacenamiento.AlmacenNDJSON(self.carpeta_reportes).ruta_segmento(fecha[:7])
+            entrada["desde"] = os.path.getsize(segmento) if os.path.exists(segmento) else 0
+
+        nombre = f"{time.time_ns()}_{os.getpid()}_{next(self._contador)}.json"
+        entrada["ruta"] = os.path.join(self.carpeta, nombre)
+        almacenamiento.escribir_atomico(entrada["ruta"], json.dumps(entrada, ensure_ascii=False).encode('utf-8'))
+        return entrada
+
+    def confirmar(self, entrada):
+        """Escribe el reporte anotado y borra la anotación; devuelve la ruta del reporte"""
+        ruta = almacenamiento.guardar_reporte(entrada["datos"], self.carpeta_reportes,
+                                              entrada["formato"], entrada["hora"])
+        os.remove(entrada["ruta"])
+        return ruta
+
+    def guardar(self, datos, formato="json"):
+        """guardar_reporte() pasando por el diario"""
+        return self.confirmar(self.anotar(datos, formato))
+
+    def pendientes(self):
+        """Anotaciones sin confirmar, de la más antigua a la más nueva"""
+        if not os.path.exists(self.carpeta):
+            return []
+        return sorted(a for a in os.listdir(self.carpeta) if a.endswith(".json"))
+
+    @metricas.medido("diario.recuperar")
+    def recuperar(self):
+        """Rehace las escrituras anotadas que no llegaron a confirmarse; devuelve sus rutas"""
+        rutas = []
+        for nombre in self.pendientes():
+            ruta_entrada = os.path.join(self.carpeta, nombre)
+            try:
+                entrada = almacenamiento.leer_json(ruta_entrada)
+                if entrada["formato"] == "ndjson":
+                    rutas.append(self._rehacer_ndjson(entrada))
+                else:
+                    # Mismo nombre que el original: si ya estaba escrito, se reemplaza igual
+                    rutas.append(almacenamiento.guardar_json(entrada["datos"], self.carpeta_reportes,
+                                                             entrada["hora"]))
+            except (OSError, ValueError, KeyError) as e:
+                metricas.contar("diario.errores")
+                print(f"⚠ No se pudo recuperar {nombre}: {e}")
+                continue
+            os.remove(ruta_entrada)
+            metricas.contar("diario.recuperados")
+        return rutas
+
+    def _rehacer_ndjson(self, entrada):
+        """Añade el reporte al segmento solo si no quedó escrito completo"""
+        almacen = almacenamiento.AlmacenNDJSON(self.carpeta_reportes)
+        datos = entrada["datos"]
+        ruta = almacen.ruta_segmento(datos.get('fecha', '0000-00')[:7])
+        linea = almacenamiento.linea_ndjson(datos).rstrip(b"\n")
+
+        if os.path.exists(ruta):
+            with open(ruta, 'rb+') as f:
+                f.seek(entrada.get("desde", 0))
+                cola = f.read()
+                if linea in (l.rstrip(b"\r") for l in cola.split(b"\n")):
+                    return ruta
+                if cola and not cola.endswith(b"\n"):
+                    # Línea cortada al final del segmento: se quita antes de volver a escribir
+                    f.truncate(entrada.get("desde", 0) + cola.rfind(b"\n") + 1)
+        return almacen.agregar(datos)
+
+
+def _problema(contenido):
+    """Descripción del problema de un reporte serializado, o None si se puede usar"""
+    try:
+        datos = almacenamiento.DECODIFICADORES[almacenamiento.decodificador](contenido)
+    except ValueError as e:
+        return f"JSON inválido: {e}"
+    if not isinstance(datos, dict):
+        return "no es un objeto JSON"
+    if not isinstance(datos.get('ventas', []), list):
+        return "'ventas' no es una lista"
+    if not isinstance(datos.get('fecha'), str):
+        return "sin 'fecha'"
+    return None
+
+
+def revisar_archivo(ruta):
+    """[(ubicación, problema)] de un archivo JSON o de cada línea de un segmento NDJSON (o mes archivado)"""
+    try:
+        with open(ruta, 'rb') as f:
+            contenido = f.read()
+        if ruta.endswith(".gz"):
+            contenido = gzip.decompress(contenido)
+    except (OSError, EOFError) as e:
+        return [(ruta, str(e))]
+
+    if not ruta.endswith((".ndjson", ".ndjson.gz")):
+        problema = _problema(contenido)
+        return [(ruta, problema)] if problema else []
+
+    problemas = []
+    for num, linea in enumerate(contenido.split(b"\n"), 1):
+        if linea.strip():
+            problema = _problema(linea)
+            if problema:
+                problemas.append((f"{ruta}:{num}", problema))
+    return problemas
+
+
+@metricas.medido("diario.verificar")
+def verificar(carpeta="reportes", procesos=None):
+    """Revisa todos los reportes en paralelo y devuelve [(ubicación, problema)]"""
+    rutas = []
+    if os.path.exists(carpeta):
+        rutas = [e.path for e in os.scandir(carpeta) if e.name.endswith('.json') and e.is_file()]
+    almacen = almacenamiento.AlmacenNDJSON(carpeta)
+    rutas += [almacen.ruta_segmento(mes) for mes in almacen.segmentos()]
+    indice = almacenamiento.ArchivoMensual(carpeta).indice()
+    pendientes = {os.path.join(carpeta, r) for r in indice["pendientes"]}
+    rutas = [r for r in rutas if r not in pendientes]
+    rutas += [os.path.join(carpeta, p["ruta"]) for p in indice["particiones"].values()]
+
+    if procesos == 1 or len(rutas) < 64:
+        resultados = map(revisar_archivo, rutas)
+    else:
+        with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+            trozo = max(1, len(rutas) // ((procesos or os.cpu_count() or 1) * 4))
+            resultados = list(ejecutor.map(revisar_archivo, rutas, chunksize=trozo))
+    problemas = sorted(p for lista in resultados for p in lista)
+    metricas.contar("diario.ilegibles", len(problemas))
+    return problemas
+
+
+def mostrar_problemas(problemas, carpeta="reportes"):
+    if not problemas:
+        print("✓ Todos los reportes se pueden leer")
+        return
+    print(f"\n⚠ {len(problemas)} reporte(s) ilegible(s):")
+    for ubicacion, problema in problemas:
+        print(f"  - {os.path.relpath(ubicacion, carpeta)}: {problema}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recuperación y verificación de reportes")
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--verificar", action="store_true", help="Listar los reportes ilegibles")
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args()
+
+    recuperados = Diario(args.carpeta).recuperar()
+    print(f"✓ {len(recuperados)} escritura(s) pendiente(s) recuperada(s)")
+    if args.verificar:
+        inicio = time.perf_counter()
+        problemas = verificar(args.carpeta, args.procesos)
+        mostrar_problemas(problemas, args.carpeta)
+        print(f"(revisión en {time.perf_counter() - inicio:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
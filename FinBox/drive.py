@@ -0,0 +1,304 @@
+import io
+import os
+import json
+import time
+import tarfile
+import hashlib
+import argparse
+from datetime import datetime
+import almacenamiento
+import metricas
+
+# Subidas a Google Drive: paquetes mensuales comprimidos y caché de la carpeta.
+#
+#   estado = EstadoDrive("reportes")                 # reportes/estado/drive.json
+#   carpeta_id = carpeta_drive(service, estado)      # la busca una vez; luego solo confirma que sigue ahí
+#   ruta, manifiesto = armar_paquete("reportes", "2024-05")
+#   subir_paquetes(service, "reportes", estado)      # los meses cerrados que cambiaron
+#
+#   python drive.py --paquete 2024-05                # arma el paquete sin subirlo
+#
+# Un paquete es reportes/paquetes/finbox_YYYY-MM.tar.gz con manifiesto.json y
+# reportes.ndjson (un reporte por línea). En vez de un archivo y una llamada
+# por reporte se sube un archivo por mes, y solo si su contenido cambió desde
+# la última subida (se compara el sha256 del manifiesto). Un mes cuyas fuentes
+# (nombres, tamaños y fechas de los archivos) no cambiaron ni se vuelve a armar.
+# Los archivos grandes se suben en trozos reanudables.
+
+CARPETA_DRIVE = "Reportes Financieros"
+CARPETA_PAQUETES = "paquetes"
+CARPETA_ESTADO = "estado"
+ARCHIVO_ESTADO = "drive.json"
+UMBRAL_REANUDABLE = 5 * 1024 * 1024  # desde aquí se sube en trozos
+TAMAÑO_TROZO = 4 * 1024 * 1024  # múltiplo de 256 KB, como pide la API
+REINTENTOS = 3
+
+
+class EstadoDrive:
+    """Lo que se recuerda entre sesiones: el id de la carpeta y los paquetes subidos"""
+
+    def __init__(self, carpeta_reportes="reportes"):
+        self.ruta = os.path.join(carpeta_reportes, CARPETA_ESTADO, ARCHIVO_ESTADO)
+        self.datos = {"carpeta_id": None, "paquetes": {}}
+        self.verificada = False  # si ya se confirmó en esta sesión que la carpeta sigue en Drive
+        if os.path.exists(self.ruta):
+            try:
+                self.datos.update(almacenamiento.leer_json(self.ruta))
+            except (OSError, ValueError) as e:
+                print(f"⚠ Estado de Drive ilegible, se empieza de cero: {e}")
+
+    def guardar(self):
+        carpeta = os.path.dirname(self.ruta)
+        if not os.path.exists(carpeta):
+            os.makedirs(carpeta)
+        almacenamiento.escribir_atomico(
+            self.ruta, json.dumps(self.datos, indent=2, ensure_ascii=False).encode('utf-8'), durable=False)
+
+    @property
+    def carpeta_id(self):
+        return self.datos.get("carpeta_id")
+
+    @carpeta_id.setter
+    def carpeta_id(self, valor):
+        self.datos["carpeta_id"] = valor
+        self.verificada = valor is not None
+        self.guardar()
+
+    def paquete(self, mes):
+        return self.datos["paquetes"].get(mes)
+
+    def anotar_paquete(self, mes, file_id, manifiesto, fuentes=None):
+        self.datos["paquetes"][mes] = {
+            "id": file_id,
+            "sha256": manifiesto["sha256"],
+            "reportes": manifiesto["reportes"],
+            "fuentes": fuentes,
+            "subido": datetime.now().isoformat(timespec='seconds'),
+        }
+        self.guardar()
+
+    def anotar_fuentes(self, mes, fuentes):
+        """Mismo contenido con otras fuentes (p. ej. tras archivar el mes): no hace falta subir"""
+        self.datos["paquetes"][mes]["fuentes"] = fuentes
+        self.guardar()
+
+
+def _carpeta_vigente(service, carpeta_id):
+    """True si la carpeta existe, es de esta cuenta y no está en la papelera"""
+    try:
+        carpeta = service.files().get(fileId=carpeta_id, fields="id,trashed").execute()
+    except Exception as e:
+        if _carpeta_no_existe(e):
+            return False
+        raise
+    finally:
+        metricas.contar("drive.llamadas")
+    return not carpeta.get("trashed")
+
+
+def carpeta_drive(service, estado=None, nombre=CARPETA_DRIVE):
+    """Id de la carpeta de reportes en Drive; la busca (o la crea) solo si no está en caché
+
+    El id guardado se confirma una vez por sesión: si la carpeta se borró, se
+    mandó a la papelera o token.pickle es de otra cuenta, se busca de nuevo.
+    """
+    if estado is not None and estado.carpeta_id:
+        if estado.verificada or _carpeta_vigente(service, estado.carpeta_id):
+            estado.verificada = True
+            return estado.carpeta_id
+        print(f"⚠ La carpeta '{nombre}' guardada ya no está en Drive; se busca de nuevo")
+        estado.carpeta_id = None
+
+    query = f"name='{nombre}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+    carpetas = service.files().list(q=query, fields="files(id, name)").execute().get('files', [])
+    metricas.contar("drive.llamadas")
+    if carpetas:
+        carpeta_id = carpetas[0]['id']
+    else:
+        cuerpo = {'name': nombre, 'mimeType': 'application/vnd.google-apps.folder'}
+        carpeta_id = service.files().create(body=cuerpo, fields='id').execute()['id']
+        metricas.contar("drive.llamadas")
+    if estado is not None:
+        estado.carpeta_id = carpeta_id
+    return carpeta_id
+
+
+def subir_archivo(service, ruta, carpeta_id, mimetype='application/json', file_id=None):
+    """Sube (o reemplaza, si se da file_id) un archivo; los grandes van en trozos reanudables"""
+    from googleapiclient.http import MediaFileUpload
+
+    tamaño = os.path.getsize(ruta)
+    reanudable = tamaño >= UMBRAL_REANUDABLE
+    media = MediaFileUpload(ruta, mimetype=mimetype, resumable=reanudable, chunksize=TAMAÑO_TROZO)
+    if file_id:
+        peticion = service.files().update(fileId=file_id, media_body=media, fields='id')
+    else:
+        cuerpo = {'name': os.path.basename(ruta), 'parents': [carpeta_id]}
+        peticion = service.files().create(body=cuerpo, media_body=media, fields='id')
+
+    if reanudable:
+        respuesta = None
+        while respuesta is None:
+            # Si se corta a mitad, next_chunk reintenta desde el último trozo confirmado
+            _, respuesta = peticion.next_chunk(num_retries=REINTENTOS)
+            metricas.contar("drive.llamadas")
+    else:
+        respuesta = peticion.execute(num_retries=REINTENTOS)
+        metricas.contar("drive.llamadas")
+    metricas.contar("drive.bytes", tamaño)
+    return respuesta['id']
+
+
+def subir_a_carpeta(service, ruta, estado, mimetype='application/json'):
+    """Sube un archivo a la carpeta de reportes; si Drive ya no la tiene (404), la busca o crea y reintenta"""
+    try:
+        return subir_archivo(service, ruta, carpeta_drive(service, estado), mimetype)
+    except Exception as e:
+        if not _carpeta_no_existe(e):
+            raise
+        estado.carpeta_id = None
+        return subir_archivo(service, ruta, carpeta_drive(service, estado), mimetype)
+
+
+def _fuentes_e_indice(carpeta_reportes):
+    import compactacion
+
+    if not os.path.exists(carpeta_reportes):
+        return {}, {"particiones": {}, "pendientes": []}
+    return compactacion.fuentes_por_mes(carpeta_reportes), almacenamiento.ArchivoMensual(carpeta_reportes).indice()
+
+
+def meses_disponibles(carpeta_reportes="reportes"):
+    """Meses (YYYY-MM) con reportes: sueltos, en segmentos o archivados"""
+    fuentes, indice = _fuentes_e_indice(carpeta_reportes)
+    return sorted(set(fuentes) | set(indice["particiones"]))
+
+
+def huella_fuentes(carpeta_reportes, mes, fuentes, indice):
+    """Firma barata de lo que forma el paquete del mes: rutas, tamaños y fechas, sin leer nada"""
+    partes = []
+    for relativa in sorted(fuentes.get(mes, [])):
+        try:
+            info = os.stat(os.path.join(carpeta_reportes, relativa))
+        except FileNotFoundError:
+            continue
+        partes.append(f"{relativa}:{info.st_size}:{info.st_mtime_ns}")
+    particion = indice["particiones"].get(mes)
+    if particion:
+        partes.append(f"{particion['ruta']}:{particion['version']}:{particion['bytes']}")
+    return hashlib.sha256("\n".join(partes).encode('utf-8')).hexdigest()
+
+
+@metricas.medido("drive.paquete")
+def armar_paquete(carpeta_reportes, mes, carpeta_destino=None):
+    """Escribe el paquete .tar.gz del mes y devuelve (ruta, manifiesto)"""
+    # "-31" sirve para cualquier mes: las fechas se comparan como cadenas YYYY-MM-DD
+    datos = list(almacenamiento.iterar_reportes(carpeta_reportes, desde=f"{mes}-01", hasta=f"{mes}-31"))
+    # Ordenado para que el mismo mes dé siempre el mismo sha256
+    contenido = b"".join(sorted(almacenamiento.linea_ndjson(r) for r in datos))
+    fechas = [r.get('fecha', '') for r in datos]
+
+    manifiesto = {
+        "periodo": mes,
+        "formato": "ndjson",
+        "reportes": len(datos),
+        "desde": min(fechas, default=None),
+        "hasta": max(fechas, default=None),
+        "total_dia": sum(r.get('total_dia', 0) for r in datos),
+        "dispositivos": sorted({r['dispositivo'] for r in datos if r.get('dispositivo')}),
+        "bytes_sin_comprimir": len(contenido),
+        "sha256": hashlib.sha256(contenido).hexdigest(),
+        "generado": datetime.now().isoformat(timespec='seconds'),
+    }
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for nombre, cuerpo in (("manifiesto.json", json.dumps(manifiesto, indent=2, ensure_ascii=False).encode('utf-8')),
+                               ("reportes.ndjson", contenido)):
+            info = tarfile.TarInfo(nombre)
+            info.size = len(cuerpo)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(cuerpo))
+
+    carpeta_destino = carpeta_destino or os.path.join(carpeta_reportes, CARPETA_PAQUETES)
+    if not os.path.exists(carpeta_destino):
+        os.makedirs(carpeta_destino)
+    ruta = os.path.join(carpeta_destino, f"finbox_{mes}.tar.gz")
+    almacenamiento.escribir_atomico(ruta, buffer.getvalue(), durable=False)
+    return ruta, manifiesto
+
+
+def leer_paquete(ruta):
+    """(manifiesto, [reportes]) de un paquete; para revisarlo o restaurarlo"""
+    with tarfile.open(ruta, mode='r:gz') as tar:
+        manifiesto = json.loads(tar.extractfile("manifiesto.json").read())
+        contenido = tar.extractfile("reportes.ndjson").read()
+    if hashlib.sha256(contenido).hexdigest() != manifiesto["sha256"]:
+        raise ValueError(f"El contenido de {ruta} no coincide con su manifiesto")
+    return manifiesto, [almacenamiento._loads(l) for l in contenido.splitlines() if l.strip()]
+
+
+def _carpeta_no_existe(e):
+    return getattr(getattr(e, 'resp', None), 'status', None) == 404
+
+
+@metricas.medido("drive.subir_paquetes")
+def subir_paquetes(service, carpeta_reportes="reportes", estado=None, meses=None, incluir_actual=False):
+    """Sube los paquetes de los meses que cambiaron; devuelve {mes: id en Drive}
+
+    Por defecto solo los meses cerrados; un paquete ya subido se reemplaza en
+    Drive (mismo archivo) en vez de crear otro. Los meses cuyas fuentes no
+    cambiaron desde la última subida ni se leen.
+    """
+    estado = estado or EstadoDrive(carpeta_reportes)
+    actual = datetime.now().strftime('%Y-%m')
+    fuentes, indice = _fuentes_e_indice(carpeta_reportes)
+    if meses is None:
+        meses = [m for m in sorted(set(fuentes) | set(indice["particiones"])) if incluir_actual or m < actual]
+
+    subidos = {}
+    for mes in meses:
+        # La firma se toma antes de leer: si algo llega mientras se arma, la próxima vez no coincide
+        firma = huella_fuentes(carpeta_reportes, mes, fuentes, indice)
+        anterior = estado.paquete(mes)
+        if anterior and anterior.get("fuentes") == firma:
+            metricas.contar("drive.paquetes_sin_cambios")
+            continue
+        ruta, manifiesto = armar_paquete(carpeta_reportes, mes)
+        if anterior and anterior["sha256"] == manifiesto["sha256"]:
+            estado.anotar_fuentes(mes, firma)
+            continue
+        carpeta_id = carpeta_drive(service, estado)
+        try:
+            file_id = subir_archivo(service, ruta, carpeta_id, 'application/gzip', anterior and anterior["id"])
+        except Exception as e:
+            if not _carpeta_no_existe(e):
+                raise
+            # La carpeta o el archivo se borraron en Drive: se olvida la caché y se sube de nuevo
+            estado.carpeta_id = None
+            estado.datos["paquetes"].pop(mes, None)
+            file_id = subir_archivo(service, ruta, carpeta_drive(service, estado), 'application/gzip')
+        estado.anotar_paquete(mes, file_id, manifiesto, firma)
+        subidos[mes] = file_id
+    return subidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paquetes mensuales de reportes para Google Drive")
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--paquete", metavar="YYYY-MM", help="Armar el paquete de un mes (sin subirlo)")
+    args = parser.parse_args()
+
+    meses = [args.paquete] if args.paquete else meses_disponibles(args.carpeta)
+    estado = EstadoDrive(args.carpeta)
+    print(f"\n{'Mes':<8} {'Reportes':>8} {'Sin comprimir':>14} {'Paquete':>10}  Drive")
+    for mes in meses:
+        ruta, manifiesto = armar_paquete(args.carpeta, mes)
+        subido = estado.paquete(mes)
+        al_dia = "✓ al día" if subido and subido["sha256"] == manifiesto["sha256"] else "pendiente"
+        print(f"{mes:<8} {manifiesto['reportes']:>8} {manifiesto['bytes_sin_comprimir'] / 1024:>11.1f} KB "
+              f"{os.path.getsize(ruta) / 1024:>7.1f} KB  {al_dia}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import threading
+import traceback
+import metricas
+
+# Bus de eventos en proceso (publicar/suscribir) para el modo en vivo.
+#
+#   eventos.suscribir("venta", funcion)        # funcion(datos)
+#   eventos.publicar("venta", {"dispositivo": ip, "fecha": ..., "venta": {...}})
+#   eventos.publicar("reporte", {"datos": reporte, "ruta": ruta_o_None})
+#   eventos.publicar("bandeja", {"tipo": ..., "datos": ..., "resultado": ...})  # tarea enviada
+#
+#   sondeo = eventos.SondeoESP32("192.168.1.100")   # /status cada 2 s -> eventos "venta"
+#   sondeo.iniciar() ... sondeo.detener()
+#
+# Los suscriptores se llaman en el hilo que publica, así que deben ser rápidos.
+# Para la interfaz se envuelven en un Agrupador: junta lo que llega durante un
+# cuadro (FRAME_MS) y llama una sola vez en el hilo de Tk con todo el lote.
+
+TEMAS = ("venta", "reporte", "bandeja")
+FRAME_MS = 100
+INTERVALO_SONDEO = 2.0  # segundos
+
+_lock = threading.Lock()
+_suscriptores = {}
+
+
+def suscribir(tema, funcion):
+    """Registra funcion(datos) para el tema; devuelve la función para desuscribirla"""
+    with _lock:
+        # Se reemplaza la lista en vez de modificarla: publicar() la recorre sin lock
+        _suscriptores[tema] = _suscriptores.get(tema, []) + [funcion]
+    return funcion
+
+
+def desuscribir(tema, funcion):
+    with _lock:
+        _suscriptores[tema] = [f for f in _suscriptores.get(tema, []) if f is not funcion]
+
+
+def publicar(tema, datos):
+    """Entrega datos a cada suscriptor del tema; un suscriptor que falla no afecta a los demás"""
+    metricas.contar(f"eventos.{tema}")
+    for funcion in _suscriptores.get(tema, ()):
+        try:
+            funcion(datos)
+        except Exception:
+            metricas.contar("eventos.errores")
+            traceback.print_exc()
+
+
+class Agrupador:
+    """Junta los eventos de un cuadro y llama funcion(lote) una sola vez
+
+    programar(ms, callback) decide dónde corre la llamada; con root.after de
+    Tk corre en el hilo de la interfaz.
+    """
+
+    def __init__(self, programar, funcion, intervalo_ms=FRAME_MS):
+        self.programar = programar
+        self.funcion = funcion
+        self.intervalo_ms = intervalo_ms
+        self._lock = threading.Lock()
+        self._pendientes = []
+        self._programado = False
+
+    def __call__(self, datos):
+        with self._lock:
+            self._pendientes.append(datos)
+            if self._programado:
+                return
+            self._programado = True
+        self.programar(self.intervalo_ms, self._vaciar)
+
+    def _vaciar(self):
+        with self._lock:
+            lote, self._pendientes = self._pendientes, []
+            self._programado = False
+        metricas.contar("eventos.lotes")
+        self.funcion(lote)
+
+
+class SondeoESP32:
+    """Consulta /status y publica como eventos "venta" las ventas nuevas del día"""
+
+    def __init__(self, ip, intervalo=INTERVALO_SONDEO, timeout=5):
+        self.ip = ip
+        self.intervalo = intervalo
+        self.timeout = timeout
+        self.vistas = None  # ventas del día ya publicadas; None hasta la primera consulta
+        self.fecha = None   # día al que corresponden esas ventas (el "fecha" de /reporte)
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._ciclo, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+
+    def _ciclo(self):
+        while not self._parar.is_set():
+            try:
+                self.revisar()
+            except Exception:
+                metricas.contar("eventos.sondeo_errores")
+            self._parar.wait(self.intervalo)
+
+    @metricas.medido("eventos.sondeo")
+    def revisar(self):
+        """Una consulta: si el contador de /status cambió, trae /reporte y publica lo nuevo"""
+        import requests
+
+        estado = requests.get(f"http://{self.ip}/status", timeout=self.timeout).json()
+        ventas = estado.get("ventas", 0)
+        dispositivo = estado.get("id") or self.ip  # el mismo id que llevan sus reportes
+        if self.vistas is None:
+            # Lo que ya estaba en el ESP32 al empezar no es "en vivo": solo se toman el
+            # contador y la fecha (para reconocer después el cambio de día)
+            self.vistas = ventas
+            if ventas:
+                self.fecha = requests.get(f"http://{self.ip}/reporte", timeout=self.timeout).json().get("fecha")
+            return 0
+        if ventas == self.vistas:
+            return 0
+
+        datos = requests.get(f"http://{self.ip}/reporte", timeout=self.timeout).json()
+        todas = datos.get("ventas", [])
+        if self.fecha is not None and datos.get("fecha") != self.fecha:
+            self.vistas = 0  # el ESP32 empezó otro día
+        self.fecha = datos.get("fecha")
+        if len(todas) <= self.vistas:
+            # Se borró una venta en la caja: las que quedan ya se publicaron
+            self.vistas = len(todas)
+            return 0
+        nuevas = todas[self.vistas:]
+        for venta in nuevas:
+            publicar("venta", {"dispositivo": dispositivo, "fecha": datos.get("fecha"), "venta": venta})
+        self.vistas += len(nuevas)
+        return len(nuevas)
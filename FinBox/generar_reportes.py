@@ -1,31 +1,92 @@
-import json
 import os
+import time
+import argparse
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 import random
+import almacenamiento
+import catalogo
+
+# Perfiles por defecto del corpus sintético (se normalizan al usarlos)
+ESTACIONALIDAD = [1.4, 1.5, 1.1, 0.9, 0.9, 0.8, 1.2, 1.3, 1.0, 0.9, 0.9, 0.7]  # ene..dic, temporada escolar
+PERFIL_SEMANAL = [1.0, 1.0, 1.0, 1.0, 1.1, 1.2, 0.4]  # lun..dom
+# Precio de referencia por código de producto (COP)
+PRECIOS = {"01": 1500, "02": 800, "03": 600, "04": 1200, "05": 2500, "06": 4500, "07": 3800,
+           "08": 2800, "09": 3200, "10": 800, "11": 300, "12": 1500, "13": 200, "14": 500,
+           "15": 2000, "16": 3500, "17": 1800, "18": 2200, "19": 1600, "20": 4200}
+PERFIL_HORAS = [0] * 8 + [0.6, 0.9, 1.0, 1.0, 1.1, 0.9, 0.8, 1.0, 1.1, 1.1, 1.0, 0.7, 0.4] + [0] * 3  # 8h a 20h
+
+
+def _generar_bloque(tarea):
+    """Genera un mes del corpus para todos los dispositivos y lo escribe en el formato pedido"""
+    import numpy as np
+    
+    rng = np.random.default_rng(tarea['semilla'])
+    productos = tarea['productos']
+    
+    inicio = np.datetime64(tarea['mes'], 'M')
+    dias = np.arange(inicio.astype('datetime64[D]'), (inicio + 1).astype('datetime64[D]'))
+    dia_semana = (dias.astype('int64') + 3) % 7  # 1970-01-01 fue jueves
+    
+    # Ventas esperadas por (día, dispositivo)
+    lam = (tarea['ventas_dia'] * tarea['estacionalidad'][int(tarea['mes'][5:7]) - 1]
+           * tarea['perfil_semanal'][dia_semana][:, None] * tarea['factor_dispositivo'][None, :])
+    conteos = rng.poisson(lam).ravel()
+    total = int(conteos.sum())
+    
+    reporte_de = np.repeat(np.arange(conteos.size), conteos)
+    producto = rng.choice(len(productos), size=total, p=tarea['popularidad'])
+    segundo = rng.choice(24, size=total, p=tarea['perfil_horas']) * 3600 + rng.integers(0, 3600, size=total)
+    
+    # Ventas de cada reporte en orden de hora
+    orden = np.lexsort((segundo, reporte_de))
+    producto, segundo = producto[orden].tolist(), segundo[orden].tolist()
+    limites = np.concatenate(([0], np.cumsum(conteos))).tolist()
+    fechas = dias.astype(str).tolist()
+    n_disp = tarea['dispositivos']
+    
+    reportes = []
+    for r in range(conteos.size):
+        d, k = divmod(r, n_disp)
+        fecha = fechas[d]
+        ventas = []
+        for j in range(limites[r], limites[r + 1]):
+            p, s = productos[producto[j]], segundo[j]
+            ventas.append({
+                "numero": j - limites[r] + 1,
+                "codigo": p["codigo"],
+                "producto": p["producto"],
+                "descripcion": p["descripcion"],
+                "valor": p["valor"],
+                "timestamp": f"{fecha} {s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}"
+            })
+        reportes.append({
+            "fecha": fecha,
+            "dispositivo": f"FINBOX-{k + 1:03d}",
+            "total_ventas": len(ventas),
+            "ventas": ventas,
+            "total_dia": sum(v["valor"] for v in ventas)
+        })
+    
+    formato, carpeta = tarea['formato'], tarea['carpeta']
+    if formato == "ndjson":
+        almacenamiento.AlmacenNDJSON(carpeta).agregar_lote(reportes)
+    elif formato == "json":
+        for r, reporte in enumerate(reportes):
+            almacenamiento.guardar_json(reporte, carpeta, hora=f"{r % n_disp:06d}", durable=False)
+    else:
+        # SQLite admite un solo escritor: el proceso principal inserta
+        return len(reportes), total, reportes
+    return len(reportes), total, None
+
 
 class GeneradorReportes:
     def __init__(self):
+        # Nombres y descripciones salen del catálogo del firmware; aquí solo se ponen precios
         self.productos = [
-            {"codigo": "01", "producto": "Lapicero", "descripcion": "Lapicero tinta azul/negra", "valor": 1500},
-            {"codigo": "02", "producto": "Lapiz", "descripcion": "Lapiz de grafito HB", "valor": 800},
-            {"codigo": "03", "producto": "Borrador", "descripcion": "Borrador blanco o de nata", "valor": 600},
-            {"codigo": "04", "producto": "Sacapuntas", "descripcion": "Sacapuntas metalico o plastico", "valor": 1200},
-            {"codigo": "05", "producto": "Marcador", "descripcion": "Marcador permanente o de pizarra", "valor": 2500},
-            {"codigo": "06", "producto": "Cuaderno", "descripcion": "Cuaderno universitario o pequeno", "valor": 4500},
-            {"codigo": "07", "producto": "Carpeta", "descripcion": "Carpeta plastica o de anillas", "valor": 3800},
-            {"codigo": "08", "producto": "Hojas sueltas", "descripcion": "Resma o paquete de hojas blancas", "valor": 2800},
-            {"codigo": "09", "producto": "Papel cuadriculado", "descripcion": "Hojas cuadriculadas o rayadas", "valor": 3200},
-            {"codigo": "10", "producto": "Cartulina", "descripcion": "Cartulina blanca o de color", "valor": 800},
-            {"codigo": "11", "producto": "Impresion B/N", "descripcion": "Impresion laser o inyeccion B/N", "valor": 300},
-            {"codigo": "12", "producto": "Impresion color", "descripcion": "Impresion a color", "valor": 1500},
-            {"codigo": "13", "producto": "Fotocopia", "descripcion": "Copia en blanco y negro", "valor": 200},
-            {"codigo": "14", "producto": "Escaneo", "descripcion": "Escaneo de documentos o fotos", "valor": 500},
-            {"codigo": "15", "producto": "Plastificado", "descripcion": "Plastificado de hojas o carnets", "valor": 2000},
-            {"codigo": "16", "producto": "Tijeras", "descripcion": "Tijeras escolares o de oficina", "valor": 3500},
-            {"codigo": "17", "producto": "Regla", "descripcion": "Regla de 30 cm o flexible", "valor": 1800},
-            {"codigo": "18", "producto": "Pegante", "descripcion": "Pegante en barra o liquido", "valor": 2200},
-            {"codigo": "19", "producto": "Cinta adhesiva", "descripcion": "Cinta transparente o masking tape", "valor": 1600},
-            {"codigo": "20", "producto": "Grapadora", "descripcion": "Grapadora mediana o mini", "valor": 4200}
+            {"codigo": p["codigo"], "producto": p["nombre"], "descripcion": p["descripcion"],
+             "valor": PRECIOS[p["codigo"]]}
+            for p in catalogo.CATALOGO_BASE
         ]
 
     def generar_reporte_dia(self, fecha):
@@ -57,7 +118,7 @@ class GeneradorReportes:
             "total_dia": total_dia
         }
 
-    def generar_mes(self, año, mes, carpeta="reportes"):
+    def generar_mes(self, año, mes, carpeta="reportes", formato="json"):
         if not os.path.exists(carpeta):
             os.makedirs(carpeta)
         
@@ -77,13 +138,112 @@ class GeneradorReportes:
             fecha = f"{año}-{mes:02d}-{dia:02d}"
             reporte = self.generar_reporte_dia(fecha)
             
-            nombre_archivo = f"reporte_{fecha}_120000.json"
-            with open(os.path.join(carpeta, nombre_archivo), 'w', encoding='utf-8') as f:
-                json.dump(reporte, f, indent=2, ensure_ascii=False)
+            almacenamiento.guardar_reporte(reporte, carpeta, formato, hora="120000")
         
         print(f"Generados {total_dias} reportes para {mes:02d}/{año} en carpeta '{carpeta}'")
 
+    def generar_corpus(self, inicio="2022-01", meses=36, dispositivos=1, carpeta="reportes",
+                       formato="ndjson", ventas_dia=8.0, sesgo=1.1, semilla=None,
+                       estacionalidad=None, perfil_semanal=None, perfil_horas=None, procesos=None):
+        """
+        Genera un corpus grande y reproducible para pruebas de carga
+        
+        Args:
+            inicio: Primer mes (YYYY-MM)
+            meses: Número de meses a generar
+            dispositivos: Cajas FinBox simuladas (cada una con su reporte diario)
+            formato: "json", "ndjson" o "sqlite" (reportes/finbox.db)
+            ventas_dia: Ventas promedio por día y dispositivo
+            sesgo: Exponente Zipf de popularidad de productos (0 = uniforme)
+            semilla: Misma semilla -> mismo corpus, sin importar los procesos
+            estacionalidad, perfil_semanal, perfil_horas: Pesos por mes (12), día (7) y hora (24)
+            procesos: Procesos en paralelo (un mes por tarea)
+        """
+        import numpy as np
+        
+        if formato not in almacenamiento.FORMATOS + ("sqlite",):
+            raise ValueError(f"Formato desconocido: {formato}")
+        if not os.path.exists(carpeta):
+            os.makedirs(carpeta)
+        
+        def normalizar(pesos):
+            pesos = np.asarray(pesos, dtype=float)
+            return pesos / pesos.mean()
+        
+        semillas = np.random.SeedSequence(semilla).spawn(meses + 1)
+        rng = np.random.default_rng(semillas[0])
+        
+        # Popularidad Zipf sobre un orden aleatorio del catálogo
+        rangos = rng.permutation(len(self.productos)) + 1
+        popularidad = 1.0 / rangos ** sesgo
+        horas = np.asarray(perfil_horas or PERFIL_HORAS, dtype=float)
+        
+        base = {
+            'productos': self.productos,
+            'popularidad': popularidad / popularidad.sum(),
+            'perfil_horas': horas / horas.sum(),
+            'estacionalidad': normalizar(estacionalidad or ESTACIONALIDAD),
+            'perfil_semanal': normalizar(perfil_semanal or PERFIL_SEMANAL),
+            'factor_dispositivo': rng.lognormal(0.0, 0.3, size=dispositivos),
+            'dispositivos': dispositivos,
+            'ventas_dia': ventas_dia,
+            'formato': formato,
+            'carpeta': carpeta
+        }
+        primer_mes = np.datetime64(inicio, 'M')
+        tareas = [dict(base, mes=str(primer_mes + i), semilla=semillas[i + 1]) for i in range(meses)]
+        
+        t0 = time.perf_counter()
+        if procesos == 1:
+            resultados = map(_generar_bloque, tareas)
+        else:
+            ejecutor = ProcessPoolExecutor(max_workers=procesos)
+            resultados = ejecutor.map(_generar_bloque, tareas)
+        
+        bd = None
+        if formato == "sqlite":
+            from base_datos import BaseDatosReportes
+            bd = BaseDatosReportes(os.path.join(carpeta, "finbox.db"))
+        
+        total_reportes = total_ventas = 0
+        for n_reportes, n_ventas, reportes in resultados:
+            total_reportes += n_reportes
+            total_ventas += n_ventas
+            if bd:
+                with bd.conexion:
+                    for reporte in reportes:
+                        bd._insertar(reporte)
+        
+        if procesos != 1:
+            ejecutor.shutdown()
+        if bd:
+            bd.cerrar()
+        
+        segundos = time.perf_counter() - t0
+        print(f"Generados {total_reportes:,} reportes y {total_ventas:,} ventas "
+              f"({meses} meses, {dispositivos} dispositivos) en {segundos:.1f}s -> '{carpeta}' [{formato}]")
+        return total_reportes, total_ventas
+
 # Uso del programa
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generador de reportes de prueba")
+    parser.add_argument("--corpus", action="store_true",
+                        help="Corpus grande multi-año y multi-dispositivo (requiere numpy)")
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--inicio", default="2022-01", help="Primer mes del corpus (YYYY-MM)")
+    parser.add_argument("--meses", type=int, default=36)
+    parser.add_argument("--dispositivos", type=int, default=1)
+    parser.add_argument("--ventas-dia", type=float, default=8.0)
+    parser.add_argument("--sesgo", type=float, default=1.1)
+    parser.add_argument("--formato", default="ndjson", choices=["json", "ndjson", "sqlite"])
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args()
+    
     generador = GeneradorReportes()
-    generador.generar_mes(2024, 10)  # Genera reportes para octubre 2024
\ No newline at end of file
+    if args.corpus:
+        generador.generar_corpus(args.inicio, args.meses, args.dispositivos, args.carpeta,
+                                 args.formato, args.ventas_dia, args.sesgo, args.semilla,
+                                 procesos=args.procesos)
+    else:
+        generador.generar_mes(2024, 10, args.carpeta)  # Genera reportes para octubre 2024
\ No newline at end of file
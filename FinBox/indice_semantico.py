@@ -0,0 +1,338 @@
+import io
+import os
+import re
+import glob
+import json
+import math
+import zlib
+import hashlib
+import argparse
+import unicodedata
+from collections import Counter
+from datetime import date
+import almacenamiento
+import metricas
+import nucleo_analitico
+
+# Índice local para recuperar contexto del chat sin mandar todos los reportes.
+#
+#   indice = IndiceSemantico("reportes")       # reportes/estado/indice_semantico.*
+#   indice.sincronizar(analisis)               # días, productos y conversaciones exportadas
+#   indice.buscar("ventas de cuadernos en mayo", k=6)  -> [(puntaje, documento)]
+#   indice.actualizar_dias(["2024-05-03"])     # al llegar un reporte nuevo
+#
+#   python indice_semantico.py --buscar "papel en diciembre"
+#
+# Cada documento se convierte en un vector TF-IDF de DIMENSIONES columnas con
+# el truco del hashing (crc32 de cada palabra), así no hay vocabulario que
+# guardar y un documento nuevo no cambia las columnas de los demás. Los
+# vectores viven en una matriz de NumPy y la búsqueda es un producto por la
+# consulta (coseno) y un argpartition para los k mejores. Solo se recalculan
+# los documentos cuyo texto cambió.
+
+DIMENSIONES = 4096
+K = 6
+CARPETA_ESTADO = "estado"
+ARCHIVO_MATRIZ = "indice_semantico.npz"
+ARCHIVO_DOCUMENTOS = "indice_semantico.json"
+CARPETA_CONVERSACIONES = "conversaciones"
+MESES = ("enero", "febrero", "marzo", "abril", "mayo", "junio", "julio",
+         "agosto", "septiembre", "octubre", "noviembre", "diciembre")
+DIAS_SEMANA = ("lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo")
+VACIAS = frozenset("""a al con como cual cuales cuando de del el en es esta este la las lo los me mi
+mis o para por que se sin su sus un una uno y yo""".split())
+
+# Fechas enteras y montos como "15,600" en una sola palabra (si no, el 15 del monto
+# se confundiría con el día 15)
+_TOKEN = re.compile(r"\d{4}-\d{2}(?:-\d{2})?|\d+(?:[.,]\d+)+|[a-z0-9]+")
+
+
+def tokens(texto):
+    """Palabras en minúsculas y sin tildes; fechas YYYY-MM(-DD) y montos quedan enteros"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in _TOKEN.findall(texto) if t not in VACIAS]
+
+
+def vector_tf(texto):
+    """Frecuencias (1 + log tf) de las palabras, repartidas en DIMENSIONES columnas por hash"""
+    import numpy as np
+
+    vector = np.zeros(DIMENSIONES, dtype=np.float32)
+    for token, n in Counter(tokens(texto)).items():
+        # crc32 y no hash(): tiene que dar lo mismo en cada ejecución
+        vector[zlib.crc32(token.encode('utf-8')) % DIMENSIONES] += 1 + math.log(n)
+    return vector
+
+
+def texto_dia(fecha, reportes, nombre_producto):
+    """Resumen en palabras de un día, con la fecha escrita de varias formas para que se encuentre
+
+    `reportes`: uno por caja (nucleo_analitico.ultimos_reportes), no las fotos acumuladas.
+    """
+    ventas = [v for r in reportes for v in r.get('ventas', [])]
+    total = sum(r.get('total_dia', 0) for r in reportes)
+    unidades, ingresos, horas = Counter(), Counter(), Counter()
+    for v in ventas:
+        producto = nombre_producto(v)
+        unidades[producto] += v.get('cantidad', 1)
+        ingresos[producto] += v.get('valor', 0)
+        hora = v.get('timestamp', '')[11:13]
+        if hora.isdigit():
+            horas[hora] += 1
+
+    try:
+        d = date.fromisoformat(fecha)
+        encabezado = f"{DIAS_SEMANA[d.weekday()]} {d.day} de {MESES[d.month - 1]} de {d.year} ({fecha}, {fecha[:7]})"
+    except ValueError:
+        encabezado = fecha
+    texto = f"Día {encabezado}: {len(ventas)} ventas, total ${total:,} COP en {len(reportes)} caja(s)."
+    if unidades:
+        texto += "\nProductos: " + ", ".join(f"{p} x{n} (${ingresos[p]:,})" for p, n in unidades.most_common(10)) + "."
+    if horas:
+        texto += "\nHoras con más ventas: " + ", ".join(f"{h}h ({n})" for h, n in horas.most_common(3)) + "."
+    return texto
+
+
+def rutas_conversaciones(carpeta_reportes="reportes"):
+    """Conversaciones exportadas: reportes/conversaciones/ y las antiguas del directorio actual"""
+    rutas = glob.glob(os.path.join(carpeta_reportes, CARPETA_CONVERSACIONES, "conversacion_*.json"))
+    return sorted(rutas + glob.glob("conversacion_*.json"))
+
+
+def documentos_conversacion(ruta):
+    """[(id, texto)] con cada pregunta y su respuesta de una conversación exportada"""
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            mensajes = json.load(f)
+    except (OSError, ValueError):
+        return []
+    documentos = []
+    nombre = os.path.basename(ruta)
+    for i, m in enumerate(mensajes):
+        if m.get("role") != "user":
+            continue
+        respuesta = mensajes[i + 1]["content"] if i + 1 < len(mensajes) and mensajes[i + 1].get("role") == "assistant" else ""
+        texto = f"Conversación {nombre[13:-5]}. Pregunta: {m.get('content', '')}\nRespuesta: {respuesta}"
+        documentos.append((f"chat:{nombre}:{i}", texto[:2000]))
+    return documentos
+
+
+class IndiceSemantico:
+    """Documentos (días, productos, conversaciones) y su matriz TF-IDF para búsqueda por coseno"""
+
+    def __init__(self, carpeta_reportes="reportes"):
+        import numpy as np
+
+        self.carpeta_reportes = carpeta_reportes
+        carpeta = os.path.join(carpeta_reportes, CARPETA_ESTADO)
+        self.ruta_matriz = os.path.join(carpeta, ARCHIVO_MATRIZ)
+        self.ruta_documentos = os.path.join(carpeta, ARCHIVO_DOCUMENTOS)
+        self.documentos = []  # [{id, tipo, texto, huella}], en el orden de las filas
+        self._fila = {}  # id -> fila
+        self._tf = np.zeros((64, DIMENSIONES), dtype=np.float32)  # con espacio para crecer
+        self.df = np.zeros(DIMENSIONES, dtype=np.int32)  # documentos con cada columna
+        self._matriz = None  # TF-IDF normalizada; se recalcula tras cada cambio
+        self.cambios = 0
+        if os.path.exists(self.ruta_documentos):
+            self.cargar()
+
+    def __len__(self):
+        return len(self.documentos)
+
+    def documento(self, id):
+        fila = self._fila.get(id)
+        return None if fila is None else self.documentos[fila]
+
+    def cargar(self):
+        import numpy as np
+
+        try:
+            with open(self.ruta_documentos, 'rb') as f:
+                datos = json.loads(f.read())
+            with np.load(self.ruta_matriz) as archivo:
+                tf = archivo["tf"]
+            if datos.get("dimensiones") != DIMENSIONES or len(tf) != len(datos["documentos"]):
+                raise ValueError("no coincide con esta versión; se reconstruye")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠ Índice semántico ilegible, se reconstruye: {e}")
+            return
+        self.documentos = datos["documentos"]
+        self._fila = {d["id"]: i for i, d in enumerate(self.documentos)}
+        self._tf = np.zeros((max(64, len(tf) * 2), DIMENSIONES), dtype=np.float32)
+        self._tf[:len(tf)] = tf
+        self.df = (tf > 0).sum(axis=0).astype(np.int32)
+
+    def guardar(self):
+        import numpy as np
+
+        if not os.path.exists(os.path.dirname(self.ruta_matriz)):
+            os.makedirs(os.path.dirname(self.ruta_matriz))
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, tf=self._tf[:len(self.documentos)])
+        almacenamiento.escribir_atomico(self.ruta_matriz, buffer.getvalue(), durable=False)
+        datos = {"dimensiones": DIMENSIONES, "documentos": self.documentos}
+        almacenamiento.escribir_atomico(self.ruta_documentos,
+                                        json.dumps(datos, ensure_ascii=False).encode('utf-8'), durable=False)
+
+    def agregar(self, id, tipo, texto):
+        """Agrega o reemplaza un documento; False si ya estaba con el mismo texto"""
+        import numpy as np
+
+        huella = hashlib.sha1(texto.encode('utf-8')).hexdigest()
+        fila = self._fila.get(id)
+        if fila is not None and self.documentos[fila]["huella"] == huella:
+            return False
+
+        vector = vector_tf(texto)
+        if fila is None:
+            fila = len(self.documentos)
+            if fila == len(self._tf):
+                self._tf = np.concatenate([self._tf, np.zeros_like(self._tf)])
+            self.documentos.append(None)
+            self._fila[id] = fila
+        else:
+            self.df -= self._tf[fila] > 0
+        self._tf[fila] = vector
+        self.df += vector > 0
+        self.documentos[fila] = {"id": id, "tipo": tipo, "texto": texto, "huella": huella}
+        self._matriz = None
+        self.cambios += 1
+        return True
+
+    def quitar(self, id):
+        """Quita un documento moviendo el último a su fila"""
+        fila = self._fila.pop(id)
+        self.df -= self._tf[fila] > 0
+        ultima = len(self.documentos) - 1
+        if fila != ultima:
+            self._tf[fila] = self._tf[ultima]
+            self.documentos[fila] = self.documentos[ultima]
+            self._fila[self.documentos[fila]["id"]] = fila
+        self._tf[ultima] = 0
+        self.documentos.pop()
+        self._matriz = None
+        self.cambios += 1
+
+    def _preparar(self):
+        """Matriz TF-IDF con filas de norma 1 (se arma solo si hubo cambios)"""
+        import numpy as np
+
+        if self._matriz is None:
+            n = len(self.documentos)
+            self._idf = (np.log((1 + n) / (1 + self.df)) + 1).astype(np.float32)
+            matriz = self._tf[:n] * self._idf
+            normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+            normas[normas == 0] = 1
+            self._matriz = matriz / normas
+            self._tipos = np.array([d["tipo"] for d in self.documentos])
+        return self._matriz
+
+    @metricas.medido("indice.buscar")
+    def buscar(self, consulta, k=K, tipos=None):
+        """[(puntaje, documento)] de los k documentos más parecidos a la consulta"""
+        import numpy as np
+
+        if not self.documentos:
+            return []
+        matriz = self._preparar()
+        q = vector_tf(consulta) * self._idf
+        norma = np.linalg.norm(q)
+        if not norma:
+            return []
+        puntajes = matriz @ (q / norma)
+        if tipos:
+            puntajes = np.where(np.isin(self._tipos, list(tipos)), puntajes, -1.0)
+        k = min(k, len(puntajes))
+        mejores = np.argpartition(-puntajes, k - 1)[:k]
+        mejores = mejores[np.argsort(-puntajes[mejores])]
+        return [(float(puntajes[i]), self.documentos[i]) for i in mejores if puntajes[i] > 0]
+
+    @metricas.medido("indice.sincronizar")
+    def sincronizar(self, analisis=None):
+        """Pone al día días, productos y conversaciones; devuelve cuántos documentos cambiaron"""
+        if analisis is None:
+            analisis = nucleo_analitico.cargar(self.carpeta_reportes)
+        antes = self.cambios
+        vigentes = set()
+
+        dias = {}
+        for r in analisis.reportes:
+            dias.setdefault(r.get('fecha', ''), []).append(r)
+        for fecha, reportes in dias.items():
+            vigentes.add(f"dia:{fecha}")
+            self.agregar(f"dia:{fecha}", "dia", texto_dia(fecha, reportes, analisis.producto))
+
+        for p in analisis.catalogo.productos():
+            if not p["descripcion"] and not p["nombre"]:
+                continue
+            vigentes.add(f"producto:{p['codigo']}")
+            self.agregar(f"producto:{p['codigo']}", "producto",
+                         f"Producto {p['nombre']} (código {p['codigo']}): {p['descripcion']}")
+
+        for ruta in rutas_conversaciones(self.carpeta_reportes):
+            for id, texto in documentos_conversacion(ruta):
+                vigentes.add(id)
+                self.agregar(id, "chat", texto)
+
+        for id in [id for id in self._fila if id not in vigentes]:
+            self.quitar(id)
+        if self.cambios != antes:
+            self.guardar()
+        return self.cambios - antes
+
+    @metricas.medido("indice.actualizar")
+    def actualizar_dias(self, fechas, catalogo_productos=None):
+        """Recalcula solo los días dados (al llegar reportes nuevos); lee solo ese rango"""
+        import catalogo
+
+        fechas = set(fechas)
+        if not fechas:
+            return 0
+        catalogo_productos = catalogo_productos or catalogo.Catalogo(self.carpeta_reportes)
+        dias = {f: [] for f in fechas}
+        for r in almacenamiento.iterar_reportes(self.carpeta_reportes, ligero=True, catalogo=catalogo_productos,
+                                                desde=min(fechas), hasta=max(fechas)):
+            if r['fecha'] in dias:
+                dias[r['fecha']].append(r)
+
+        antes = self.cambios
+        nombre = lambda v: catalogo_productos.nombre(v['pid'])
+        for fecha, reportes in dias.items():
+            if reportes:
+                self.agregar(f"dia:{fecha}", "dia",
+                             texto_dia(fecha, nucleo_analitico.ultimos_reportes(reportes), nombre))
+        if self.cambios != antes:
+            self.guardar()
+        return self.cambios - antes
+
+
+def existe(carpeta_reportes="reportes"):
+    """True si el índice ya se creó (lo crea el chat la primera vez que se usa)"""
+    return os.path.exists(os.path.join(carpeta_reportes, CARPETA_ESTADO, ARCHIVO_DOCUMENTOS))
+
+
+def main():
+    import time
+
+    parser = argparse.ArgumentParser(description="Índice semántico de reportes, productos y conversaciones")
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--buscar", default=None, help="Consulta de prueba")
+    parser.add_argument("-k", type=int, default=K)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    indice = IndiceSemantico(args.carpeta)
+    cambios = indice.sincronizar()
+    print(f"✓ Índice con {len(indice)} documento(s), {cambios} actualizado(s) "
+          f"en {time.perf_counter() - inicio:.2f}s")
+    if args.buscar:
+        inicio = time.perf_counter()
+        resultados = indice.buscar(args.buscar, args.k)
+        print(f"\n🔎 «{args.buscar}» ({(time.perf_counter() - inicio) * 1000:.1f} ms)")
+        for puntaje, d in resultados:
+            print(f"  {puntaje:.3f}  [{d['tipo']}] {d['texto'].splitlines()[0][:110]}")
+
+
+if __name__ == "__main__":
+    main()
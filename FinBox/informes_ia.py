@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from datetime import datetime
+import almacenamiento
+import metricas
+import nucleo_analitico
+
+# Análisis escritos por la IA para cada día (o mes) de un rango, en lote.
+#
+#   generar("reportes", "2024-05-01", "2024-05-31")             # uno por día
+#   generar("reportes", "2024-01-01", "2024-06-30", por="mes")
+#
+#   python informes_ia.py --desde 2024-05-01 --hasta 2024-05-31 --concurrencia 8
+#   python informes_ia.py --desde ... --base-url http://127.0.0.1:8099/v1   # simulador
+#
+# Las peticiones salen a la vez (asyncio) sin pasar de POR_MINUTO, y las que
+# fallan por 429, 5xx o cortes se reintentan con espera creciente. Cada
+# análisis queda en reportes/analisis_ia/<periodo>.json con la huella (sha256)
+# de los datos del periodo, el modelo y la versión del prompt: un periodo que
+# no cambió no se vuelve a enviar. benchmark_informes.py trae un servidor de
+# completions simulado para probarlo sin gastar en la API.
+
+CARPETA_ANALISIS = "analisis_ia"
+MODELO = "gpt-4o-mini"
+VERSION_PROMPT = 1  # subirla cuando cambie PROMPT: invalida lo guardado
+CONCURRENCIA = 8
+POR_MINUTO = 300  # peticiones por minuto
+REINTENTOS = 4
+ESPERA_BASE = 1.0  # segundos; se duplica en cada reintento
+TIMEOUT = 60
+PROMPT = """Eres un analista financiero de una papelería en Colombia. Con los datos del periodo
+(en JSON) escribe un análisis breve, máximo 2 párrafos: cómo fueron las ventas, qué productos
+y horas destacan y una recomendación concreta. Menciona los valores en pesos colombianos (COP)."""
+
+
+def resumen_periodo(periodo, reportes, catalogo_productos=None):
+    """Datos compactos del periodo que se envían a la IA"""
+    a = nucleo_analitico.Analisis(reportes, catalogo_productos)
+    horas = Counter()
+    for r in a.reportes:  # ya con una sola foto por caja y fecha
+        for v in r.get('ventas', []):
+            hora = v.get('timestamp', '')[11:13]
+            if hora.isdigit():
+                horas[hora] += 1
+    return {
+        "periodo": periodo,
+        "dias": len({r.get('fecha') for r in a.reportes}),
+        "reportes": len(a.reportes),
+        "ventas": a.total_ventas,
+        "ingresos": a.total_dinero,
+        "promedio_por_venta": round(a.promedio_por_venta, 2),
+        "productos": [{"producto": p, "unidades": u, "ingresos": a.ingresos_producto[p]}
+                      for p, u in a.top_productos(10, por="unidades")],
+        "ventas_por_hora": dict(sorted(horas.items())),
+    }
+
+
+@metricas.medido("informes.resumir")
+def resumir_periodos(carpeta, desde=None, hasta=None, por="dia"):
+    """{periodo: resumen} con periodo YYYY-MM-DD (por="dia") o YYYY-MM (por="mes")"""
+    analisis = nucleo_analitico.cargar(carpeta, desde=desde, hasta=hasta)
+    largo = 10 if por == "dia" else 7
+    grupos = {}
+    for r in analisis.reportes:
+        grupos.setdefault(r.get('fecha', '')[:largo], []).append(r)
+    return {p: resumen_periodo(p, reportes, analisis.catalogo) for p, reportes in sorted(grupos.items())}
+
+
+def huella(resumen, modelo=MODELO):
+    """sha256 de lo que determina la respuesta: datos, modelo y versión del prompt"""
+    clave = json.dumps({"v": VERSION_PROMPT, "modelo": modelo, "datos": resumen},
+                       sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(clave.encode('utf-8')).hexdigest()
+
+
+def ruta_analisis(carpeta, periodo):
+    return os.path.join(carpeta, CARPETA_ANALISIS, f"{periodo}.json")
+
+
+def leer_analisis(carpeta, periodo):
+    """Análisis guardado del periodo, o None"""
+    try:
+        return almacenamiento.leer_json(ruta_analisis(carpeta, periodo))
+    except (OSError, ValueError):
+        return None
+
+
+class LimiteTasa:
+    """Espacia las peticiones para no pasar de `por_minuto` (un solo bucle de asyncio)"""
+
+    def __init__(self, por_minuto=POR_MINUTO):
+        self.intervalo = 60.0 / por_minuto if por_minuto else 0.0
+        self._siguiente = 0.0
+
+    async def esperar(self):
+        ahora = time.monotonic()
+        turno = max(ahora, self._siguiente)
+        self._siguiente = turno + self.intervalo
+        if turno > ahora:
+            await asyncio.sleep(turno - ahora)
+
+
+def crear_completar(modelo=MODELO, api_key=None, base_url=None, timeout=TIMEOUT):
+    """Corrutina completar(mensajes) -> texto sobre el cliente asíncrono de OpenAI"""
+    from openai import AsyncOpenAI
+
+    api_key = api_key or os.getenv("OPENAI_API_KEY") or ("simulador" if base_url else None)
+    # Los reintentos los hace generar(), que además respeta el límite por minuto
+    cliente = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout)
+
+    async def completar(mensajes):
+        with metricas.medir("llm.informe"):
+            respuesta = await cliente.chat.completions.create(
+                model=modelo, messages=mensajes, temperature=0.5, max_tokens=500)
+        return respuesta.choices[0].message.content
+
+    return completar
+
+
+def _reintentable(e):
+    """429, 5xx, timeouts y cortes de conexión se reintentan; 400/401 no"""
+    estado = getattr(e, "status_code", None)
+    if estado is not None:
+        return estado in (408, 409, 429) or estado >= 500
+    return isinstance(e, (OSError, asyncio.TimeoutError)) or type(e).__name__ in (
+        "APIConnectionError", "APITimeoutError")
+
+
+def _espera(e, intento):
+    """Retry-After si el servidor lo manda; si no, espera exponencial con azar"""
+    cabeceras = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(cabeceras.get("retry-after"))
+    except (TypeError, ValueError):
+        return ESPERA_BASE * 2 ** intento * (0.5 + random.random())
+
+
+async def _generar_uno(periodo, resumen, firma, completar, limite, semaforo, carpeta, modelo):
+    mensajes = [{"role": "system", "content": PROMPT},
+                {"role": "user", "content": json.dumps(resumen, ensure_ascii=False)}]
+    async with semaforo:
+        for intento in range(REINTENTOS + 1):
+            await limite.esperar()
+            try:
+                texto = await completar(mensajes)
+                break
+            except Exception as e:
+                if intento == REINTENTOS or not _reintentable(e):
+                    metricas.contar("informes.errores")
+                    return periodo, e
+                metricas.contar("informes.reintentos")
+                await asyncio.sleep(_espera(e, intento))
+
+    analisis = {
+        "periodo": periodo,
+        "huella": firma,
+        "modelo": modelo,
+        "version_prompt": VERSION_PROMPT,
+        "generado": datetime.now().isoformat(timespec='seconds'),
+        "datos": resumen,
+        "texto": texto,
+    }
+    almacenamiento.escribir_atomico(ruta_analisis(carpeta, periodo),
+                                    json.dumps(analisis, indent=2, ensure_ascii=False).encode('utf-8'),
+                                    durable=False)
+    metricas.contar("informes.generados")
+    return periodo, None
+
+
+async def _generar_todos(pendientes, completar, carpeta, modelo, concurrencia, por_minuto):
+    limite = LimiteTasa(por_minuto)
+    semaforo = asyncio.Semaphore(concurrencia)
+    return await asyncio.gather(*(
+        _generar_uno(periodo, resumen, firma, completar, limite, semaforo, carpeta, modelo)
+        for periodo, resumen, firma in pendientes))
+
+
+@metricas.medido("informes.generar")
+def generar(carpeta="reportes", desde=None, hasta=None, por="dia", completar=None, modelo=MODELO,
+            concurrencia=CONCURRENCIA, por_minuto=POR_MINUTO, forzar=False, base_url=None):
+    """Genera los análisis que faltan o cambiaron en el rango
+
+    completar(mensajes) es una corrutina que devuelve el texto; por defecto
+    la de crear_completar(modelo, base_url=base_url), que solo se crea si hay
+    algo que enviar. Devuelve {"generados", "en_cache", "errores"}.
+    """
+    pendientes = []
+    en_cache = 0
+    for periodo, resumen in resumir_periodos(carpeta, desde, hasta, por).items():
+        firma = huella(resumen, modelo)
+        guardado = leer_analisis(carpeta, periodo)
+        if not forzar and guardado and guardado.get("huella") == firma:
+            en_cache += 1
+            continue
+        pendientes.append((periodo, resumen, firma))
+    metricas.contar("informes.en_cache", en_cache)
+
+    resultados = []
+    if pendientes:
+        carpeta_salida = os.path.join(carpeta, CARPETA_ANALISIS)
+        if not os.path.exists(carpeta_salida):
+            os.makedirs(carpeta_salida)
+        completar = completar or crear_completar(modelo, base_url=base_url)
+        resultados = asyncio.run(_generar_todos(pendientes, completar, carpeta, modelo,
+                                                concurrencia, por_minuto))
+    return {
+        "generados": [p for p, error in resultados if error is None],
+        "en_cache": en_cache,
+        "errores": {p: str(error) for p, error in resultados if error is not None},
+    }
+
+
+def mostrar_resultado(resultado, carpeta="reportes"):
+    print(f"✓ {len(resultado['generados'])} análisis generado(s), {resultado['en_cache']} sin cambios (en caché)")
+    if resultado["errores"]:
+        print(f"⚠ {len(resultado['errores'])} periodo(s) con error:")
+        for periodo, error in sorted(resultado["errores"].items()):
+            print(f"  - {periodo}: {error}")
+    print(f"📁 Guardados en {os.path.join(carpeta, CARPETA_ANALISIS)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Análisis de la IA por día o por mes, en lote")
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--desde", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--hasta", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--por", choices=["dia", "mes"], default="dia")
+    parser.add_argument("--modelo", default=MODELO)
+    parser.add_argument("--concurrencia", type=int, default=CONCURRENCIA)
+    parser.add_argument("--por-minuto", type=int, default=POR_MINUTO)
+    parser.add_argument("--base-url", default=None, help="Otro servidor compatible, p. ej. el simulador")
+    parser.add_argument("--forzar", action="store_true", help="Regenerar aunque los datos no hayan cambiado")
+    parser.add_argument("--mostrar", action="store_true", help="Imprimir los análisis al terminar")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resultado = generar(args.carpeta, args.desde, args.hasta, args.por, modelo=args.modelo,
+                        concurrencia=args.concurrencia, por_minuto=args.por_minuto,
+                        forzar=args.forzar, base_url=args.base_url)
+    mostrar_resultado(resultado, args.carpeta)
+    print(f"(en {time.perf_counter() - inicio:.2f}s)")
+
+    if args.mostrar:
+        for periodo in sorted(resultado["generados"]):
+            print(f"\n📅 {periodo}\n{leer_analisis(args.carpeta, periodo)['texto']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import subprocess
+import os
+import sys
+import time
+import json
+import argparse
+from datetime import datetime
+
+# Compara tamaño y arranque en frío de distintas compilaciones de FinBox.
+#
+# Ejemplo (después de compilar cada perfil y renombrar la salida de dist/):
+#   python medir_build.py dist_base/FinBox.exe dist_release/FinBox.exe dist_onedir/FinBox/FinBox.exe
+
+
+def tamaño_bundle(ruta_exe):
+    """Tamaño en bytes: el .exe si es onefile, toda la carpeta si es onedir"""
+    carpeta = os.path.dirname(os.path.abspath(ruta_exe))
+    if not os.path.isdir(os.path.join(carpeta, "_internal")):
+        return os.path.getsize(ruta_exe)
+
+    total = 0
+    for raiz, _, archivos in os.walk(carpeta):
+        for archivo in archivos:
+            total += os.path.getsize(os.path.join(raiz, archivo))
+    return total
+
+
+def medir_arranque(ruta_exe, repeticiones=5):
+    """Lanza el ejecutable hasta que la ventana está lista y se cierra sola"""
+    entorno = dict(os.environ, FINBOX_MEDIR_INICIO="1")
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run([ruta_exe], env=entorno, timeout=120)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamaño y arranque en frío de builds de FinBox")
+    parser.add_argument("ejecutables", nargs="+")
+    parser.add_argument("-n", "--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    resultados = []
+    print("\n" + "="*72)
+    print(f"{'Build':40s} {'Tamaño':>10s} {'1er inicio':>10s} {'Mediana':>10s}")
+    print("="*72)
+
+    for ruta in args.ejecutables:
+        if not os.path.exists(ruta):
+            print(f"✗ No existe: {ruta}")
+            continue
+
+        tamaño = tamaño_bundle(ruta)
+        tiempos = medir_arranque(ruta, args.repeticiones)
+        mediana = sorted(tiempos)[len(tiempos) // 2]
+        resultados.append({
+            "build": ruta,
+            "bytes": tamaño,
+            "primer_inicio_s": tiempos[0],
+            "mediana_s": mediana,
+            "tiempos_s": tiempos
+        })
+        print(f"{ruta[-40:]:40s} {tamaño/1e6:>8.1f}MB {tiempos[0]:>9.2f}s {mediana:>9.2f}s")
+
+    print("="*72 + "\n")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump({"fecha": datetime.now().isoformat(), "python": sys.version,
+                       "resultados": resultados}, f, indent=2, ensure_ascii=False)
+        print(f"✓ Resultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import os
+import time
+import json
+import bisect
+import threading
+import functools
+from datetime import datetime
+
+# Instrumentación ligera: tiempos (spans), contadores e histogramas en memoria.
+#
+#   with metricas.medir("esp32.reporte"):
+#       ...
+#
+#   @metricas.medido("estadisticas.calcular")
+#   def calcular_estadisticas(self): ...
+#
+# Se desactiva con FINBOX_METRICAS=0 o metricas.activar(False); desactivado,
+# medir() devuelve un contexto vacío compartido y no se toma ningún tiempo.
+
+activo = os.environ.get("FINBOX_METRICAS", "1") != "0"
+
+# Límites superiores de las cubetas de los histogramas (ms)
+LIMITES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+_lock = threading.Lock()
+_contadores = {}
+_histogramas = {}
+
+
+class Histograma:
+    __slots__ = ("n", "suma", "minimo", "maximo", "cubetas")
+
+    def __init__(self):
+        self.n = 0
+        self.suma = 0.0
+        self.minimo = float('inf')
+        self.maximo = 0.0
+        self.cubetas = [0] * (len(LIMITES_MS) + 1)
+
+    def agregar(self, valor):
+        self.n += 1
+        self.suma += valor
+        if valor < self.minimo:
+            self.minimo = valor
+        if valor > self.maximo:
+            self.maximo = valor
+        self.cubetas[bisect.bisect_left(LIMITES_MS, valor)] += 1
+
+    def percentil(self, p):
+        """Percentil aproximado: límite superior de la cubeta que lo contiene"""
+        if not self.n:
+            return 0.0
+        objetivo = p / 100 * self.n
+        acumulado = 0
+        for i, cantidad in enumerate(self.cubetas):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return min(LIMITES_MS[i], self.maximo) if i < len(LIMITES_MS) else self.maximo
+        return self.maximo
+
+    def resumen(self):
+        return {
+            "n": self.n,
+            "total": round(self.suma, 3),
+            "promedio": round(self.suma / self.n, 3) if self.n else 0,
+            "min": round(self.minimo, 3) if self.n else 0,
+            "max": round(self.maximo, 3),
+            "p50": self.percentil(50),
+            "p95": self.percentil(95),
+            "cubetas": dict(zip([f"<={l}" for l in LIMITES_MS] + ["mas"], self.cubetas))
+        }
+
+
+def activar(valor=True):
+    global activo
+    activo = valor
+
+
+def contar(nombre, n=1):
+    """Suma n al contador `nombre`"""
+    if not activo:
+        return
+    with _lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + n
+
+
+def observar(nombre, valor):
+    """Agrega un valor (en ms para los tiempos) al histograma `nombre`"""
+    if not activo:
+        return
+    with _lock:
+        histograma = _histogramas.get(nombre)
+        if histograma is None:
+            histograma = _histogramas[nombre] = Histograma()
+        histograma.agregar(valor)
+
+
+class _Span:
+    __slots__ = ("nombre", "inicio")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        observar(self.nombre, (time.perf_counter() - self.inicio) * 1000)
+        if tipo is not None:
+            contar(f"{self.nombre}.errores")
+        return False
+
+
+class _SpanNulo:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        return False
+
+
+_NULO = _SpanNulo()
+
+
+def medir(nombre):
+    """Contexto que registra la duración del bloque en el histograma `nombre`"""
+    return _Span(nombre) if activo else _NULO
+
+
+def medido(nombre):
+    """Decorador equivalente a envolver la función en medir(nombre)"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not activo:
+                return funcion(*args, **kwargs)
+            with _Span(nombre):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def reiniciar():
+    with _lock:
+        _contadores.clear()
+        _histogramas.clear()
+
+
+def instantanea():
+    """Copia de todas las métricas como diccionario serializable"""
+    with _lock:
+        return {
+            "generado": datetime.now().isoformat(timespec='seconds'),
+            "activo": activo,
+            "contadores": dict(sorted(_contadores.items())),
+            "tiempos_ms": {n: h.resumen() for n, h in sorted(_histogramas.items())}
+        }
+
+
+def exportar(ruta=None):
+    """Guarda las métricas en JSON y devuelve la ruta"""
+    if not ruta:
+        ruta = f"metricas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(instantanea(), f, indent=2, ensure_ascii=False)
+    return ruta
+
+
+def texto_resumen():
+    """Tabla de métricas para la consola o la pestaña de diagnóstico"""
+    datos = instantanea()
+    lineas = [f"Métricas {'activas' if datos['activo'] else 'desactivadas'} - {datos['generado']}", ""]
+
+    if datos["tiempos_ms"]:
+        lineas.append(f"{'Operación':30s} {'N':>6s} {'Prom':>9s} {'p50':>8s} {'p95':>8s} {'Máx':>9s}")
+        lineas.append("─" * 75)
+        for nombre, h in datos["tiempos_ms"].items():
+            lineas.append(f"{nombre:30s} {h['n']:>6d} {h['promedio']:>8.1f}ms {h['p50']:>6.0f}ms "
+                          f"{h['p95']:>6.0f}ms {h['max']:>8.1f}ms")
+        lineas.append("")
+
+    if datos["contadores"]:
+        lineas.append("Contadores")
+        lineas.append("─" * 75)
+        for nombre, valor in datos["contadores"].items():
+            lineas.append(f"  {nombre:40s} {valor:>10,}")
+
+    if not datos["tiempos_ms"] and not datos["contadores"]:
+        lineas.append("Sin datos todavía.")
+
+    return "\n".join(lineas)
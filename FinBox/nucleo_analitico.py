@@ -0,0 +1,321 @@
+import bisect
+from collections import Counter
+import almacenamiento
+import catalogo
+import metricas
+
+# Núcleo de estadísticas compartido por la GUI, el análisis en consola y el chat.
+# Una sola carga y una sola pasada por las ventas producen todas las métricas.
+#
+# Conteo de productos:
+#   ventas_producto   -> número de ventas (una por registro), base de la "moda"
+#   unidades_producto -> suma de 'cantidad' (1 si el registro no la trae)
+# Con el firmware actual ambos coinciden, porque cada venta es una unidad.
+# Los contadores internos van por id de producto (catalogo.Catalogo); los
+# nombres se resuelven solo al consultarlos.
+#
+# El ESP32 manda el acumulado del día, así que de cada caja y fecha solo cuenta
+# la foto más reciente (ultimos_reportes); agregar() reemplaza la anterior.
+
+
+class Percentiles:
+    """Valores ordenados con inserción por bisección: percentiles exactos al instante
+
+    Usa la interpolación lineal de np.percentile (método por defecto) y
+    reproduce su redondeo, así los resultados coinciden con NumPy.
+    """
+
+    def __init__(self, valores=()):
+        self.valores = sorted(valores)
+        self.suma = sum(self.valores)
+        self.suma_cuadrados = sum(v * v for v in self.valores)
+
+    def __len__(self):
+        return len(self.valores)
+
+    def agregar(self, valor):
+        bisect.insort(self.valores, valor)
+        self.suma += valor
+        self.suma_cuadrados += valor * valor
+
+    def quitar(self, valor):
+        del self.valores[bisect.bisect_left(self.valores, valor)]
+        self.suma -= valor
+        self.suma_cuadrados -= valor * valor
+
+    def percentil(self, p):
+        n = len(self.valores)
+        if not n:
+            return 0.0
+        indice = (n - 1) * (p / 100)
+        anterior = min(int(indice), n - 1)
+        siguiente = min(anterior + 1, n - 1)
+        t = indice - anterior
+        a, b = self.valores[anterior], self.valores[siguiente]
+        # Igual que numpy._lerp: desde el extremo más cercano para no perder precisión
+        if t >= 0.5:
+            return float(b - (b - a) * (1 - t))
+        return float(a + (b - a) * t)
+
+    def mediana(self):
+        return self.percentil(50)
+
+    def media(self):
+        return self.suma / len(self.valores) if self.valores else 0.0
+
+    def desviacion(self):
+        """Desviación estándar poblacional (como np.std)"""
+        n = len(self.valores)
+        if not n:
+            return 0.0
+        # Con ingresos enteros las sumas son exactas y no hay cancelación
+        varianza = (n * self.suma_cuadrados - self.suma * self.suma) / (n * n)
+        return max(varianza, 0) ** 0.5
+
+
+class Analisis:
+    """Métricas de un conjunto de reportes, calculadas en una sola pasada"""
+
+    def __init__(self, reportes, catalogo_productos=None):
+        self.catalogo = catalogo_productos if catalogo_productos is not None else catalogo.Catalogo()
+        self._vigentes = _ultimos(reportes)  # (fecha, dispositivo) -> reporte
+        self.reportes = sorted(self._vigentes.values(), key=lambda r: r.get('fecha', '0000-00-00'))
+        self.fechas = []
+        self.ingresos = []
+        self.ventas_dia = []
+        self.por_mes = {}
+        self._ventas_pid = Counter()
+        self._unidades_pid = Counter()
+        self._ingresos_pid = Counter()
+        self._cubo = None
+        self.ilegibles = []  # rutas que no se pudieron leer (las llena cargar())
+
+        with metricas.medir("estadisticas.pasada"):
+            for r in self.reportes:
+                self.fechas.append(r.get('fecha', '0000-00-00'))
+                self.ingresos.append(r.get('total_dia', 0))
+                self.ventas_dia.append(r.get('total_ventas', 0))
+                self._acumular(r)
+
+        self.dias = len(self.reportes)
+        self.total_dinero = sum(self.ingresos)
+        self.total_ventas = sum(self.ventas_dia)
+        self.orden_ingresos = Percentiles(self.ingresos)
+
+    def _acumular(self, r, signo=1):
+        """Suma (o con signo=-1 resta) un reporte a los totales por mes y por producto"""
+        fecha = r.get('fecha', '0000-00-00')
+        total_dia = signo * r.get('total_dia', 0)
+        total_ventas = signo * r.get('total_ventas', 0)
+
+        mes = self.por_mes.get(fecha[:7])
+        if mes is None:
+            mes = self.por_mes[fecha[:7]] = {'ingresos': 0, 'ventas': 0}
+        mes['ingresos'] += total_dia
+        mes['ventas'] += total_ventas
+
+        id_de = self.catalogo.id_de
+        for v in r.get('ventas', []):
+            pid = v.get('pid')
+            if pid is None:
+                pid = id_de(v.get('codigo'), v.get('producto'))
+            self._ventas_pid[pid] += signo
+            self._unidades_pid[pid] += signo * v.get('cantidad', 1)
+            self._ingresos_pid[pid] += signo * v.get('valor', 0)
+            if not self._ventas_pid[pid]:
+                for contador in (self._ventas_pid, self._unidades_pid, self._ingresos_pid):
+                    del contador[pid]
+
+    def _retirar(self, r):
+        """Descuenta un reporte al que reemplaza una foto más reciente de la misma caja y fecha"""
+        i = bisect.bisect_left(self.fechas, r.get('fecha', '0000-00-00'))
+        while self.reportes[i] is not r:
+            i += 1
+        del self.reportes[i], self.fechas[i], self.ingresos[i], self.ventas_dia[i]
+        self.orden_ingresos.quitar(r.get('total_dia', 0))
+        self._acumular(r, -1)
+
+        self.dias -= 1
+        self.total_dinero -= r.get('total_dia', 0)
+        self.total_ventas -= r.get('total_ventas', 0)
+
+    def agregar(self, reportes):
+        """Incorpora reportes nuevos recorriendo solo esos reportes
+
+        Una foto más reciente de una caja y fecha ya cargadas reemplaza a la anterior;
+        una más vieja que llega tarde se ignora.
+        """
+        agregados, retirados = [], []
+        with metricas.medir("estadisticas.incremental"):
+            for r in reportes:
+                clave = _clave(r)
+                anterior = self._vigentes.get(clave)
+                if anterior is not None:
+                    if not _mas_reciente(r, anterior):
+                        continue
+                    self._retirar(anterior)
+                    retirados.append(anterior)
+                self._vigentes[clave] = r
+                agregados.append(r)
+
+                fecha = r.get('fecha', '0000-00-00')
+                # Lo normal es que el reporte nuevo sea el más reciente
+                i = bisect.bisect_right(self.fechas, fecha)
+                self.reportes.insert(i, r)
+                self.fechas.insert(i, fecha)
+                self.ingresos.insert(i, r.get('total_dia', 0))
+                self.orden_ingresos.agregar(r.get('total_dia', 0))
+                self.ventas_dia.insert(i, r.get('total_ventas', 0))
+                self._acumular(r)
+
+                self.dias += 1
+                self.total_dinero += r.get('total_dia', 0)
+                self.total_ventas += r.get('total_ventas', 0)
+        if self._cubo is not None:
+            self._cubo.quitar(retirados)
+            self._cubo.agregar(agregados)
+
+    def __bool__(self):
+        return self.dias > 0
+
+    @property
+    def promedio_dia(self):
+        return self.total_dinero / self.dias if self.dias else 0
+
+    @property
+    def promedio_por_venta(self):
+        return self.total_dinero / self.total_ventas if self.total_ventas else 0
+
+    @property
+    def rango_fechas(self):
+        return f"{self.fechas[0]} a {self.fechas[-1]}" if self.fechas else 'N/A'
+
+    def meses(self):
+        """Meses (YYYY-MM) en orden"""
+        return sorted(self.por_mes)
+
+    def _por_nombre(self, contador):
+        nombres = Counter()
+        for pid, n in contador.items():
+            nombres[self.catalogo.nombre(pid)] += n
+        return nombres
+
+    @property
+    def ventas_producto(self):
+        """Counter {producto: número de ventas}"""
+        return self._por_nombre(self._ventas_pid)
+
+    @property
+    def unidades_producto(self):
+        return self._por_nombre(self._unidades_pid)
+
+    @property
+    def ingresos_producto(self):
+        return self._por_nombre(self._ingresos_pid)
+
+    def producto(self, venta):
+        """Nombre del producto de una venta (con 'pid' o con sus textos originales)"""
+        pid = venta.get('pid')
+        return self.catalogo.nombre(pid) if pid is not None else venta.get('producto', 'N/A')
+
+    def info_producto(self, venta):
+        """(código, nombre, descripción) de una venta, resueltos con el catálogo"""
+        pid = venta.get('pid')
+        if pid is None:
+            pid = self.catalogo.id_de(venta.get('codigo'), venta.get('producto'))
+        return self.catalogo.codigo(pid), self.catalogo.nombre(pid), self.catalogo.descripcion(pid)
+
+    def top_productos(self, n=5, por="ventas"):
+        """[(producto, valor)] ordenado por 'ventas', 'unidades' o 'ingresos'"""
+        contador = {"ventas": self._ventas_pid, "unidades": self._unidades_pid,
+                    "ingresos": self._ingresos_pid}[por]
+        return self._por_nombre(contador).most_common(n)
+
+    def moda(self, por="ventas"):
+        """Producto más frecuente y su conteo"""
+        top = self.top_productos(1, por)
+        return top[0] if top else ('N/A', 0)
+
+    def cubo(self):
+        """Cubo fecha × producto × hora; se arma al primer uso y luego crece con agregar()"""
+        if self._cubo is None:
+            from cubo_ventas import CuboVentas
+            self._cubo = CuboVentas(self.reportes, self.catalogo)
+        return self._cubo
+
+    def percentil(self, p):
+        """Percentil exacto de los ingresos diarios"""
+        return self.orden_ingresos.percentil(p)
+
+    def distribucion(self):
+        """Media, mediana, percentiles y desviación de los ingresos diarios"""
+        if not self.dias:
+            return None
+        orden = self.orden_ingresos
+        return {
+            'media': orden.media(),
+            'mediana': orden.mediana(),
+            'percentil_25': orden.percentil(25),
+            'percentil_50': orden.percentil(50),
+            'percentil_75': orden.percentil(75),
+            'desviacion': orden.desviacion(),
+            'promedio_mes': sum(m['ingresos'] for m in self.por_mes.values()) / len(self.por_mes),
+            'mejor_dia': float(orden.valores[-1]),
+            'peor_dia': float(orden.valores[0]),
+        }
+
+
+def _clave(r):
+    return r.get('fecha'), r.get('dispositivo')
+
+
+def _mas_reciente(r, anterior):
+    """Si r se tomó después (o a la vez) que anterior; sin 'recibido', gana el que llega después"""
+    return r.get('recibido', '') >= anterior.get('recibido', '')
+
+
+def ultimos_reportes(reportes):
+    """Un reporte por fecha y dispositivo: la foto más reciente
+
+    El ESP32 manda el acumulado del día, así que varios reportes de la misma
+    caja y fecha son fotos sucesivas y no se suman. Manda la de 'recibido' más
+    reciente, no la de más ventas: si en la caja se borró una venta, la foto
+    corregida tiene menos. Se conserva el orden en que llegaron.
+    """
+    return list(_ultimos(reportes).values())
+
+
+def _ultimos(reportes):
+    ultimos = {}
+    for r in reportes:
+        clave = _clave(r)
+        anterior = ultimos.get(clave)
+        if anterior is None or _mas_reciente(r, anterior):
+            ultimos[clave] = r
+    return ultimos
+
+
+@metricas.medido("reportes.cargar")
+def cargar(carpeta="reportes", al_fallar=None, catalogo_productos=None, desde=None, hasta=None):
+    """Lee los reportes de la carpeta una vez y devuelve su Analisis
+
+    Sin catálogo se usa el guardado en la carpeta (o el del firmware). Los
+    reportes ilegibles quedan en analisis.ilegibles; sin al_fallar se avisa una vez.
+    desde/hasta (YYYY-MM-DD) limitan el rango y evitan leer los meses archivados de fuera.
+    """
+    if catalogo_productos is None:
+        catalogo_productos = catalogo.Catalogo(carpeta)
+    ilegibles = []
+
+    def anotar_fallo(ruta, e):
+        ilegibles.append(ruta)
+        if al_fallar:
+            al_fallar(ruta, e)
+
+    reportes = almacenamiento.iterar_reportes(carpeta, anotar_fallo, ligero=True, catalogo=catalogo_productos,
+                                              desde=desde, hasta=hasta)
+    analisis = Analisis(reportes, catalogo_productos)
+    analisis.ilegibles = ilegibles
+    if ilegibles and al_fallar is None:
+        print(f"⚠ {len(ilegibles)} reporte(s) ilegible(s) omitido(s); detalle con: python diario.py --verificar")
+    return analisis
@@ -0,0 +1,106 @@
+import os
+import io
+import time
+from datetime import datetime
+
+# Modo de perfilado opcional para los puntos de entrada (CLI y GUI).
+#
+#   python receptor.py --profile                 -> perfila toda la sesión
+#   python analisis_financiero.py --profile-accion estadisticas --profile-repeticiones 50
+#                                                -> repite una sola acción, sin menú
+#
+# Con cProfile se guarda un .prof (abrible con snakeviz o pstats) y un .txt con
+# el top-N; con --profile-motor pyinstrument (si está instalado) se guarda un .html.
+
+MOTORES = ("cprofile", "pyinstrument")
+
+
+def agregar_opciones(parser, acciones=None):
+    """Agrega las opciones --profile* a un ArgumentParser"""
+    grupo = parser.add_argument_group("perfilado")
+    grupo.add_argument("--profile", nargs="?", const="", metavar="ARCHIVO",
+                       help="Perfila la sesión y guarda el resultado (por defecto perfil_<fecha>)")
+    grupo.add_argument("--profile-top", type=int, default=25, metavar="N",
+                       help="Funciones a mostrar en el resumen")
+    grupo.add_argument("--profile-motor", choices=MOTORES, default="cprofile")
+    if acciones:
+        grupo.add_argument("--profile-accion", choices=list(acciones),
+                           help="Perfila solo esta acción, sin mostrar el menú")
+        grupo.add_argument("--profile-repeticiones", type=int, default=1, metavar="N",
+                           help="Veces que se repite la acción perfilada")
+
+
+def ejecutar(args, sesion, acciones=None, crear=None):
+    """Corre la sesión normal, la sesión perfilada o una acción perfilada N veces
+
+    acciones: {nombre: funcion(objeto)}; crear() construye el objeto fuera del perfil.
+    """
+    accion = getattr(args, "profile_accion", None)
+
+    if accion:
+        objeto = crear() if crear else None
+        funcion = acciones[accion]
+        repeticiones = max(1, args.profile_repeticiones)
+
+        def objetivo():
+            for _ in range(repeticiones):
+                funcion(objeto)
+        etiqueta = f"{accion}_x{repeticiones}"
+    elif args.profile is not None:
+        objetivo = sesion
+        etiqueta = "sesion"
+    else:
+        return sesion()
+
+    return perfilar(objetivo, args.profile or None, args.profile_top, args.profile_motor, etiqueta)
+
+
+def perfilar(funcion, ruta=None, top=25, motor="cprofile", etiqueta="sesion"):
+    """Ejecuta la función bajo el perfilador, guarda el resultado e imprime el top-N"""
+    if motor == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("⚠ pyinstrument no instalado, se usa cProfile")
+            motor = "cprofile"
+
+    if not ruta:
+        extension = "html" if motor == "pyinstrument" else "prof"
+        ruta = f"perfil_{etiqueta}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+    inicio = time.perf_counter()
+    if motor == "pyinstrument":
+        perfilador = Profiler()
+        perfilador.start()
+        try:
+            return funcion()
+        finally:
+            perfilador.stop()
+            with open(ruta, 'w', encoding='utf-8') as f:
+                f.write(perfilador.output_html())
+            _mostrar(perfilador.output_text(unicode=True), ruta, time.perf_counter() - inicio)
+
+    import cProfile
+    import pstats
+    perfilador = cProfile.Profile()
+    perfilador.enable()
+    try:
+        return funcion()
+    finally:
+        perfilador.disable()
+        perfilador.dump_stats(ruta)
+
+        salida = io.StringIO()
+        stats = pstats.Stats(perfilador, stream=salida)
+        stats.sort_stats("cumulative").print_stats(top)
+        resumen = salida.getvalue()
+        with open(os.path.splitext(ruta)[0] + ".txt", 'w', encoding='utf-8') as f:
+            f.write(resumen)
+        _mostrar(resumen, ruta, time.perf_counter() - inicio)
+
+
+def _mostrar(resumen, ruta, segundos):
+    print("\n" + "="*60)
+    print(f"⏱ PERFIL ({segundos:.2f}s) guardado en: {ruta}")
+    print("="*60)
+    print(resumen)
@@ -0,0 +1,187 @@
+import numpy as np
+import metricas
+from cubo_ventas import DIAS_SEMANA
+
+# Pronóstico de ingresos sobre la serie diaria de total_dia. La serie sale de
+# un nucleo_analitico.Analisis, que deja una sola foto por caja y día; las
+# cajas de un mismo día se suman.
+#
+#   p = pronostico.pronosticar(analisis)     -> mañana y el mes siguiente
+#   pronostico.texto_contexto(p)             -> resumen para el chat
+#   pronostico.pronosticar_lote(Y, 7)        -> muchas series a la vez (T × S)
+#
+# Holt-Winters aditivo con estacionalidad semanal. El bucle recorre el tiempo
+# una sola vez y cada paso opera sobre todas las series y todas las
+# combinaciones de parámetros de la rejilla; se queda la de menor error.
+
+PERIODO = 7
+REJILLA_ALFA = (0.1, 0.3, 0.5)
+REJILLA_BETA = (0.0, 0.05)
+REJILLA_GAMA = (0.05, 0.2)
+
+
+def serie_diaria(fechas, valores):
+    """(días datetime64[D], totales) continuos: suma las cajas del mismo día y rellena con 0
+
+    Espera un reporte por caja y día (Analisis.fechas/ingresos), no fotos acumuladas.
+    """
+    pares = [(f, v) for f, v in zip(fechas, valores) if f and f[:4] != '0000']
+    if not pares:
+        return np.array([], dtype='datetime64[D]'), np.zeros(0)
+    fechas, valores = zip(*pares)
+    valores = np.asarray(valores, dtype=float)
+
+    dias = np.array(fechas, dtype='datetime64[D]')
+    unicos, inverso = np.unique(dias, return_inverse=True)
+    totales = np.bincount(inverso, weights=valores)
+
+    inicio = unicos[0]
+    serie = np.zeros(int((unicos[-1] - inicio).astype(np.int64)) + 1)
+    serie[(unicos - inicio).astype(np.int64)] = totales
+    return inicio + np.arange(len(serie)), serie
+
+
+def medias_moviles(Y, ventana):
+    """Media de cada ventana de `ventana` días (filas) para cada serie (columnas)"""
+    Y = np.asarray(Y, dtype=float)
+    if len(Y) < ventana:
+        return np.zeros((0,) + Y.shape[1:])
+    acumulado = np.cumsum(np.insert(Y, 0, 0, axis=0), axis=0)
+    return (acumulado[ventana:] - acumulado[:-ventana]) / ventana
+
+
+def factores_semanales(Y, dias):
+    """Matriz 7 × S: promedio de cada día de la semana (lunes=0) sobre el promedio general"""
+    Y = np.asarray(Y, dtype=float).reshape(len(Y), -1)
+    dia_semana = (dias.astype(np.int64) + 3) % 7  # 1970-01-01 fue jueves
+    sumas = np.zeros((7, Y.shape[1]))
+    np.add.at(sumas, dia_semana, Y)
+    conteos = np.bincount(dia_semana, minlength=7)[:, None]
+    promedio = Y.mean(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        factores = sumas / np.maximum(conteos, 1) / promedio
+    return np.nan_to_num(factores, nan=1.0, posinf=1.0)
+
+
+def holt_winters(Y, horizonte, alfa, beta, gama, periodo=PERIODO):
+    """Holt-Winters aditivo vectorizado
+
+    Y: T × S. alfa/beta/gama: escalares o arreglos que se difunden contra (S,).
+    Devuelve (pronóstico horizonte × ..., suma de errores cuadrados un paso adelante).
+    """
+    T = len(Y)
+    nivel = Y[:periodo].mean(axis=0)
+    tendencia = (Y[periodo:2 * periodo].mean(axis=0) - nivel) / periodo
+    forma = np.broadcast(nivel, alfa, beta, gama).shape
+    nivel = np.broadcast_to(nivel, forma).copy()
+    tendencia = np.broadcast_to(tendencia, forma).copy()
+    inicial = Y[:periodo] - Y[:periodo].mean(axis=0)
+    # (periodo, S) -> (periodo, 1, ..., S) para difundir contra los ejes de la rejilla
+    inicial = inicial.reshape((periodo,) + (1,) * (len(forma) - inicial.ndim + 1) + inicial.shape[1:])
+    estacion = np.broadcast_to(inicial, (periodo,) + forma).copy()
+    error = np.zeros(forma)
+
+    for t in range(T):
+        y = Y[t]
+        s = estacion[t % periodo]
+        error += (y - (nivel + tendencia + s)) ** 2
+        anterior = nivel
+        nivel = alfa * (y - s) + (1 - alfa) * (nivel + tendencia)
+        tendencia = beta * (nivel - anterior) + (1 - beta) * tendencia
+        estacion[t % periodo] = gama * (y - nivel) + (1 - gama) * s
+
+    pasos = np.arange(1, horizonte + 1)
+    pronostico = (nivel + pasos.reshape((-1,) + (1,) * len(forma)) * tendencia[None]
+                  + estacion[(T - 1 + pasos) % periodo])
+    return np.maximum(pronostico, 0), error
+
+
+@metricas.medido("pronostico.lote")
+def pronosticar_lote(Y, horizonte, periodo=PERIODO):
+    """Ajusta y pronostica cada columna de Y (T × S) eligiendo parámetros por rejilla
+
+    Con menos de dos semanas de historia se usa la media de los últimos días.
+    """
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    if len(Y) < 2 * periodo:
+        base = Y[-periodo:].mean(axis=0) if len(Y) else np.zeros(Y.shape[1])
+        return {'pronostico': np.tile(base, (horizonte, 1)), 'metodo': "media móvil",
+                'alfa': None, 'beta': None, 'gama': None}
+
+    # Una fila por combinación de la rejilla: los estados quedan (G, S)
+    alfa, beta, gama = (np.array(v, dtype=float)[:, None] for v in zip(
+        *[(a, b, g) for a in REJILLA_ALFA for b in REJILLA_BETA for g in REJILLA_GAMA]))
+    pronostico, error = holt_winters(Y, horizonte, alfa, beta, gama, periodo)
+
+    mejor = error.argmin(axis=0)
+    columnas = np.arange(Y.shape[1])
+    return {
+        'pronostico': pronostico[:, mejor, columnas],
+        'metodo': "Holt-Winters aditivo (semanal)",
+        'alfa': alfa[mejor, 0], 'beta': beta[mejor, 0], 'gama': gama[mejor, 0],
+    }
+
+
+def pronosticar(analisis):
+    """Pronóstico de ingresos para mañana y para el mes calendario siguiente (analisis: Analisis)"""
+    dias, serie = serie_diaria(analisis.fechas, analisis.ingresos)
+    if not len(serie):
+        return None
+
+    ultimo = dias[-1]
+    mes = ultimo.astype('datetime64[M]') + 1
+    fin_mes = (mes + 1).astype('datetime64[D]') - 1
+    horizonte = int((fin_mes - ultimo).astype(np.int64))
+
+    resultado = pronosticar_lote(serie, horizonte)
+    valores = resultado['pronostico'][:, 0]
+    fechas = ultimo + np.arange(1, horizonte + 1)
+    medias_7 = medias_moviles(serie, 7)
+    medias_28 = medias_moviles(serie, 28)
+
+    return {
+        'dias': dias,
+        'historia': serie,
+        'fechas': fechas,
+        'pronostico': valores,
+        'manana': float(valores[0]),
+        'fecha_manana': str(fechas[0]),
+        'mes': str(mes),
+        'proximo_mes': float(valores[fechas.astype('datetime64[M]') == mes].sum()),
+        'media_7': float(medias_7[-1]) if len(medias_7) else float(serie.mean()),
+        'media_28': float(medias_28[-1]) if len(medias_28) else float(serie.mean()),
+        'factores_semanales': factores_semanales(serie, dias)[:, 0],
+        'metodo': resultado['metodo'],
+    }
+
+
+def pronosticar_productos(cubo, horizonte=7):
+    """{producto: ingresos pronosticados para los próximos `horizonte` días} en un solo lote"""
+    if not cubo:
+        return {}
+    Y = cubo.datos("ingresos").sum(axis=2)
+    totales = pronosticar_lote(Y, horizonte)['pronostico'].sum(axis=0)
+    return dict(sorted(zip(cubo.productos, totales.tolist()), key=lambda x: x[1], reverse=True))
+
+
+def texto_contexto(p, productos=None):
+    """Resumen del pronóstico para el contexto del chat"""
+    if not p:
+        return ""
+    factores = p['factores_semanales']
+    fuerte, debil = int(factores.argmax()), int(factores.argmin())
+
+    texto = "\n=== PRONÓSTICO DE INGRESOS ===\n\n"
+    texto += f"🔮 Mañana ({p['fecha_manana']}): ${p['manana']:,.0f} COP\n"
+    texto += f"📅 Mes siguiente ({p['mes']}): ${p['proximo_mes']:,.0f} COP\n"
+    texto += f"📈 Media móvil 7 días: ${p['media_7']:,.0f} COP | 28 días: ${p['media_28']:,.0f} COP\n"
+    texto += (f"🗓 Día más fuerte: {DIAS_SEMANA[fuerte]} (x{factores[fuerte]:.2f}), "
+              f"más débil: {DIAS_SEMANA[debil]} (x{factores[debil]:.2f})\n")
+    if productos:
+        texto += "📦 Ingresos esperados próximos 7 días por producto:\n"
+        for producto, valor in list(productos.items())[:5]:
+            texto += f"   - {producto}: ${valor:,.0f} COP\n"
+    texto += f"(Método: {p['metodo']})\n"
+    return texto
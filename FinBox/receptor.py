@@ -2,16 +2,29 @@ import requests
 import json
 import os
 from datetime import datetime
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 import pickle
+import argparse
+import almacenamiento
+import anomalias
+import bandeja
+import catalogo
+import descubrimiento
+import diario
+import drive
+import indice_semantico
+import metricas
+import perfilado
+
+# Las librerías de Google se importan solo al configurar Drive (opción 1),
+# así el menú arranca sin cargar todo el cliente de la API.
 
 # Configuración
-ESP32_IP = "192.168.1.100"  # Cambiar por la IP de tu ESP32
+ESP32_IP = "192.168.1.100"  # IP inicial; luego se usa la última encontrada (opción 11)
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
+FORMATO_REPORTES = "json"  # "json" (un archivo por reporte) o "ndjson" (segmentos mensuales)
+MODO_DRIVE = "reporte"  # "reporte" (un JSON por descarga) o "paquete" (un .tar.gz por mes cerrado)
+USAR_SQLITE = False  # Indexar también cada reporte en reportes/finbox.db
+REVISAR_ANOMALIAS = True  # Comparar cada reporte nuevo con las líneas base (reportes/estado/)
 CREDENTIALS_PATH = r"C:\Users\cris4\OneDrive\Documents\Clases\ElectronicaDigital\ProyectoAutomatizacionFinanzas\AutoFinanzas\PAF\credentials.json"
 
 class SistemaFinanciero:
@@ -20,14 +33,46 @@ class SistemaFinanciero:
         self.carpeta_drive = None
         self.service = None
         self.esp32_ip = ESP32_IP
+        self.formato = FORMATO_REPORTES
         
         # Crear carpeta de reportes si no existe
         if not os.path.exists(self.carpeta_reportes):
             os.makedirs(self.carpeta_reportes)
             print(f"✓ Carpeta '{self.carpeta_reportes}' creada")
+        
+        self.catalogo = catalogo.Catalogo(self.carpeta_reportes)
+        self.dispositivos = descubrimiento.TablaDispositivos(self.carpeta_reportes)
+        self.estado_drive = drive.EstadoDrive(self.carpeta_reportes)
+        
+        # Reportes que quedaron a medio guardar si el programa se cerró de golpe
+        self.diario = diario.Diario(self.carpeta_reportes)
+        recuperados = self.diario.recuperar()
+        if recuperados:
+            print(f"✓ {len(recuperados)} reporte(s) recuperado(s) del diario")
+        self.esp32_ip = self.dispositivos.preferido() or self.esp32_ip
+        
+        # Subidas y preguntas que fallaron sin internet; se envían solas al volver la conexión
+        self.bandeja = bandeja.Bandeja(self.carpeta_reportes)
+        self.bandeja.registrar("drive.archivo", self._subir_pendiente, limite=1)
+        self.bandeja.registrar("drive.paquetes", self._subir_paquetes_pendientes, limite=1)
+        self.bandeja.registrar("llm.pregunta", self._responder_pendiente, limite=2)
+        self.bandeja.iniciar()
+        
+        self.detector = None
+        if REVISAR_ANOMALIAS:
+            self.detector = anomalias.DetectorAnomalias(self.carpeta_reportes)
+        
+        self.base_datos = None
+        if USAR_SQLITE:
+            from base_datos import BaseDatosReportes
+            self.base_datos = BaseDatosReportes(os.path.join(self.carpeta_reportes, "finbox.db"))
     
     def autenticar_google_drive(self):
         """Autentica con Google Drive"""
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
+        from googleapiclient.discovery import build
+        
         creds = None
         
         # Ruta del token en la misma carpeta que credentials
@@ -70,67 +115,72 @@ class SistemaFinanciero:
         return True
     
     def crear_carpeta_drive(self):
-        """Crea carpeta 'Reportes Financieros' en Drive"""
-        query = "name='Reportes Financieros' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = self.service.files().list(q=query, fields="files(id, name)").execute()
-        folders = results.get('files', [])
-        
-        if folders:
-            self.carpeta_drive = folders[0]['id']
-            print(f"✓ Carpeta existente encontrada: {folders[0]['name']}")
+        """Busca (o crea) la carpeta 'Reportes Financieros' en Drive; el id queda en caché"""
+        en_cache = self.estado_drive.carpeta_id
+        self.carpeta_drive = drive.carpeta_drive(self.service, self.estado_drive)
+        if en_cache:
+            print(f"✓ Carpeta '{drive.CARPETA_DRIVE}' (guardada de la sesión anterior)")
         else:
-            file_metadata = {
-                'name': 'Reportes Financieros',
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            folder = self.service.files().create(body=file_metadata, fields='id').execute()
-            self.carpeta_drive = folder.get('id')
-            print("✓ Carpeta 'Reportes Financieros' creada en Drive")
+            print(f"✓ Carpeta '{drive.CARPETA_DRIVE}' lista en Drive")
     
-    def obtener_reporte_esp32(self):
-        """Obtiene el reporte del ESP32 vía HTTP"""
+    @metricas.medido("esp32.reporte")
+    def obtener_reporte_esp32(self, buscar=True):
+        """Obtiene el reporte del ESP32 vía HTTP; si no responde, lo busca en la red una vez"""
         try:
             print(f"Conectando a ESP32 en {self.esp32_ip}...")
             url = f"http://{self.esp32_ip}/reporte"
-            response = requests.get(url, timeout=10)
+            response = requests.get(url, timeout=(3, 10))
             
             if response.status_code == 200:
-                datos = response.json()
+                # Con el id de la caja y la hora, varias descargas del mismo día no se suman
+                datos = almacenamiento.marcar_recibido(
+                    response.json(), descubrimiento.identificar(self.esp32_ip, self.dispositivos))
                 print("✓ Reporte obtenido del ESP32")
                 return datos
             else:
+                metricas.contar("esp32.errores")
                 print(f"✗ Error HTTP: {response.status_code}")
                 return None
         except requests.exceptions.ConnectionError:
+            metricas.contar("esp32.errores")
             print(f"✗ Error: No se pudo conectar al ESP32 en {self.esp32_ip}")
+            if buscar and self.buscar_esp32():
+                return self.obtener_reporte_esp32(buscar=False)
             print("  Verifica que:")
             print("  - El ESP32 esté encendido")
             print("  - Esté conectado a la misma red WiFi")
             print("  - La IP sea correcta")
             return None
         except requests.exceptions.Timeout:
+            metricas.contar("esp32.timeouts")
             print(f"✗ Error: Timeout al conectar con {self.esp32_ip}")
+            if buscar and self.buscar_esp32():
+                return self.obtener_reporte_esp32(buscar=False)
             return None
         except Exception as e:
+            metricas.contar("esp32.errores")
             print(f"✗ Error de conexión: {e}")
             return None
     
-    def guardar_reporte_local(self, datos):
-        """Guarda el reporte en archivo JSON local"""
+    def guardar_reporte_local(self, datos, entrada=None):
+        """Guarda el reporte localmente (escritura atómica, pasando por el diario)"""
         if not datos:
             return None
         
-        fecha = datos.get('fecha', datetime.now().strftime('%Y-%m-%d'))
-        hora = datetime.now().strftime('%H%M%S')
-        nombre_archivo = f"reporte_{fecha}_{hora}.json"
-        ruta_completa = os.path.join(self.carpeta_reportes, nombre_archivo)
+        if entrada is None:
+            entrada = self.diario.anotar(datos, self.formato)
+        ruta_completa = self.diario.confirmar(entrada)
         
-        with open(ruta_completa, 'w', encoding='utf-8') as f:
-            json.dump(datos, f, indent=2, ensure_ascii=False)
+        print(f"✓ Reporte guardado localmente: {os.path.basename(ruta_completa)}")
         
-        print(f"✓ Reporte guardado localmente: {nombre_archivo}")
+        if self.base_datos:
+            try:
+                self.base_datos.insertar_reporte(datos)
+            except Exception as e:
+                print(f"⚠ No se pudo indexar en SQLite: {e}")
         return ruta_completa
     
+    @metricas.medido("drive.subir")
     def subir_a_drive(self, ruta_archivo):
         """Sube el archivo a Google Drive"""
         if not self.service:
@@ -138,27 +188,85 @@ class SistemaFinanciero:
             return False
         
         try:
-            nombre_archivo = os.path.basename(ruta_archivo)
-            
-            file_metadata = {
-                'name': nombre_archivo,
-                'parents': [self.carpeta_drive]
-            }
-            
-            media = MediaFileUpload(ruta_archivo, mimetype='application/json')
-            
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
-            
-            print(f"✓ Archivo subido a Google Drive (ID: {file.get('id')})")
+            file_id = drive.subir_a_carpeta(self.service, ruta_archivo, self.estado_drive)
+            self.carpeta_drive = self.estado_drive.carpeta_id
+            print(f"✓ Archivo subido a Google Drive (ID: {file_id})")
             return True
         
         except Exception as e:
+            metricas.contar("drive.errores")
             print(f"✗ Error al subir a Drive: {e}")
+            self.bandeja.encolar("drive.archivo", {"ruta": ruta_archivo}, clave=ruta_archivo)
+            print("📥 Quedó en la bandeja de salida; se subirá cuando vuelva la conexión")
+            return False
+    
+    def subir_paquetes(self, incluir_actual=False):
+        """Sube a Drive el paquete comprimido de cada mes que cambió desde la última subida"""
+        if not self.service:
+            print("✗ No hay conexión con Google Drive")
+            return False
+        
+        try:
+            subidos = drive.subir_paquetes(self.service, self.carpeta_reportes, self.estado_drive,
+                                           incluir_actual=incluir_actual)
+        except Exception as e:
+            metricas.contar("drive.errores")
+            print(f"✗ Error al subir paquetes a Drive: {e}")
+            self.bandeja.encolar("drive.paquetes", {"incluir_actual": incluir_actual}, clave="paquetes")
+            print("📥 Quedó en la bandeja de salida; se subirá cuando vuelva la conexión")
             return False
+        
+        if subidos:
+            print(f"✓ {len(subidos)} paquete(s) mensual(es) subido(s): {', '.join(subidos)}")
+        else:
+            print("✓ Los paquetes de Drive ya están al día")
+        return True
+    
+    def _subir_pendiente(self, datos):
+        """Subida a Drive que quedó en la bandeja de salida"""
+        if not self.service:
+            raise RuntimeError("Google Drive no está autenticado (opción 1)")
+        return drive.subir_a_carpeta(self.service, datos["ruta"], self.estado_drive)
+    
+    def _subir_paquetes_pendientes(self, datos):
+        if not self.service:
+            raise RuntimeError("Google Drive no está autenticado (opción 1)")
+        return drive.subir_paquetes(self.service, self.carpeta_reportes, self.estado_drive,
+                                    incluir_actual=datos.get("incluir_actual", False))
+    
+    def _responder_pendiente(self, datos):
+        """Pregunta a la IA que quedó en la bandeja (el chat se importa solo si hay alguna)"""
+        import chat_financiero
+        return chat_financiero.responder_diferida(datos, self.carpeta_reportes)
+    
+    def generar_informes_ia(self):
+        """Análisis de la IA para cada día de un rango (solo se envían los días que cambiaron)"""
+        import informes_ia
+        
+        desde = input("\n➤ Desde (YYYY-MM-DD, Enter = todo): ").strip() or None
+        hasta = input("➤ Hasta (YYYY-MM-DD, Enter = hoy): ").strip() or None
+        por = "mes" if input("➤ ¿Por día o por mes? (d/m): ").strip().lower() == 'm' else "dia"
+        print("\n🤖 Generando análisis...")
+        try:
+            resultado = informes_ia.generar(self.carpeta_reportes, desde, hasta, por)
+        except Exception as e:
+            print(f"✗ No se pudieron generar los análisis: {e}")
+            return False
+        informes_ia.mostrar_resultado(resultado, self.carpeta_reportes)
+        return not resultado["errores"]
+    
+    def ver_bandeja(self):
+        """Estado de la bandeja de salida; ofrece enviar ya lo pendiente"""
+        estado = self.bandeja.estado()
+        print(bandeja.texto_estado(estado))
+        if estado["pendientes"] and input("¿Intentar enviar ahora? (s/n): ").strip().lower() == 's':
+            enviadas, fallidas = self.bandeja.vaciar(forzar=True)
+            if not bandeja.conectado():
+                print("✗ Sigue sin haber conexión")
+            else:
+                print(f"✓ {enviadas} enviada(s), {fallidas} con error")
+        if estado["fallidas"] and input("¿Reintentar las tareas descartadas? (s/n): ").strip().lower() == 's':
+            print(f"✓ {self.bandeja.reintentar_fallidas()} tarea(s) de vuelta en la bandeja")
     
     def generar_resumen(self, datos):
         """Genera resumen del reporte"""
@@ -197,18 +305,29 @@ class SistemaFinanciero:
             print("\n✗ No se pudo obtener el reporte del ESP32")
             print("El proceso ha finalizado sin éxito.\n")
             return False
+        # Se anota de inmediato: si algo falla antes de guardarlo, se recupera al reiniciar
+        entrada = self.diario.anotar(datos, self.formato)
         
-        # 2. Mostrar resumen
+        # 2. Actualizar el catálogo si cambió, mostrar resumen y revisar anomalías
+        self.sincronizar_catalogo()
         self.generar_resumen(datos)
+        if self.detector:
+            anomalias.mostrar_alertas(self.detector.revisar(datos))
         
         # 3. Guardar localmente
-        ruta_archivo = self.guardar_reporte_local(datos)
+        ruta_archivo = self.guardar_reporte_local(datos, entrada)
         if not ruta_archivo:
             print("✗ Error al guardar reporte local")
             return False
-        
-        # 4. Subir a Google Drive
-        if self.service:
+        self.actualizar_indice([datos.get('fecha')])
+        
+        # 4. Subir a Google Drive: el paquete de los meses cerrados o el JSON individual
+        if self.service and MODO_DRIVE == "paquete":
+            self.subir_paquetes()
+        elif self.service:
+            if self.formato != "json":
+                ruta_archivo = almacenamiento.guardar_json(
+                    datos, os.path.join(self.carpeta_reportes, "exportados"))
             self.subir_a_drive(ruta_archivo)
         else:
             print("⚠ Google Drive no configurado, solo guardado local")
@@ -218,6 +337,64 @@ class SistemaFinanciero:
         print("✅ "*20 + "\n")
         return True
     
+    def actualizar_indice(self, fechas):
+        """Pone al día en el índice semántico del chat los días que recibieron reportes"""
+        if not indice_semantico.existe(self.carpeta_reportes):
+            return  # lo crea el chat la primera vez que se usa
+        try:
+            indice_semantico.IndiceSemantico(self.carpeta_reportes).actualizar_dias(
+                [f for f in fechas if f], self.catalogo)
+        except Exception as e:
+            print(f"⚠ No se pudo actualizar el índice del chat (se rehace al preguntar): {e}")
+    
+    def sincronizar_catalogo(self):
+        """Descarga /catalogo del ESP32 si cambió desde la última vez"""
+        try:
+            if self.catalogo.sincronizar(self.esp32_ip):
+                print(f"✓ Catálogo actualizado ({len(self.catalogo)} productos)")
+            return True
+        except Exception as e:
+            metricas.contar("catalogo.errores")
+            print(f"⚠ No se pudo sincronizar el catálogo, se usa el guardado: {e}")
+            return False
+    
+    def recibir_reportes(self, puerto=None):
+        """Escucha los reportes que las cajas envían por POST hasta Ctrl+C"""
+        import asyncio
+        import servidor_ingesta
+
+        def al_guardar(reportes):
+            for datos in reportes:
+                print(f"📥 Reporte {datos.get('fecha')} de {datos.get('dispositivo', 'ESP32')}: "
+                      f"{datos.get('total_ventas', 0)} ventas, ${datos.get('total_dia', 0):,} COP")
+                if self.detector:
+                    anomalias.mostrar_alertas(self.detector.revisar(datos))
+
+        async def servir():
+            servidor = servidor_ingesta.ServidorIngesta(self.carpeta_reportes, self.formato,
+                                                       al_guardar=al_guardar)
+            await servidor.iniciar(puerto=puerto or servidor_ingesta.PUERTO)
+            print(f"✓ Esperando reportes en el puerto {puerto or servidor_ingesta.PUERTO} (Ctrl+C para volver)")
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await servidor.detener()
+
+        try:
+            asyncio.run(servir())
+        except KeyboardInterrupt:
+            print("\n✓ Servidor de ingesta detenido")
+
+    def ver_catalogo(self):
+        """Muestra el catálogo de productos"""
+        self.sincronizar_catalogo()
+        print("\n" + "="*60)
+        print(f"CATÁLOGO ({len(self.catalogo)} productos, actualizado: {self.catalogo.actualizado or 'nunca'})")
+        print("="*60)
+        for p in self.catalogo.productos():
+            print(f"  [{p['codigo']:>4s}] {p['nombre']:20s} {p['descripcion']}")
+        print("="*60)
+    
     def ver_reportes_locales(self):
         """Muestra los reportes guardados localmente"""
         if not os.path.exists(self.carpeta_reportes):
@@ -262,10 +439,66 @@ class SistemaFinanciero:
         except Exception as e:
             print(f"✗ Error al leer el archivo: {e}")
     
+    def archivar_meses(self):
+        """Comprime los meses cerrados en reportes/archivo/ (un archivo por mes)"""
+        import compactacion
+
+        print("\n🗜 Archivando meses cerrados...")
+        archivados = compactacion.compactar(self.carpeta_reportes)
+        if not archivados:
+            print("✓ No hay meses cerrados sin archivar")
+            return
+        print(f"✓ {len(archivados)} mes(es) archivado(s): {sum(archivados.values())} reporte(s)")
+        compactacion.mostrar_indice(self.carpeta_reportes)
+
+    def buscar_esp32(self, completo=False):
+        """Busca el ESP32 en la red local; devuelve True si cambió la IP en uso"""
+        print("\n🔍 Buscando ESP32 en la red...")
+        esperado = self.dispositivos.id_de(self.esp32_ip)  # la caja en uso, antes de actualizar la tabla
+        elegido, encontrados = descubrimiento.localizar(self.dispositivos, esperado, completo=completo)
+        print(f"{'✓' if encontrados else '✗'} {len(encontrados)} ESP32 encontrado(s)")
+        if elegido is None:
+            if encontrados:
+                print(f"⚠ Ninguno es con seguridad la caja en uso ({esperado or 'id desconocido'}); "
+                      "elige la IP con la opción 4")
+            return False
+        if elegido['direccion'] == self.esp32_ip:
+            return False
+        self.configurar_ip(elegido['direccion'])
+        return True
+    
     def configurar_ip(self, nueva_ip):
         """Configura nueva IP del ESP32"""
         self.esp32_ip = nueva_ip
         print(f"✓ IP del ESP32 configurada: {nueva_ip}")
+    
+    def verificar_conexion(self):
+        """Consulta /status del ESP32 y muestra el resultado"""
+        print("\n🔍 Verificando conexión con ESP32...\n")
+        
+        try:
+            url = f"http://{self.esp32_ip}/status"
+            response = requests.get(url, timeout=5)
+            if response.status_code == 200:
+                datos = response.json()
+                print("\n✓ ESP32 conectado y funcionando")
+                print(f"  - IP: {self.esp32_ip}")
+                print(f"  - Ventas registradas: {datos.get('ventas', 0)}")
+                print(f"  - Estado: {datos.get('status', 'N/A')}")
+                return True
+            print(f"\n⚠ ESP32 responde pero con error: {response.status_code}")
+        except:
+            print(f"\n✗ No se pudo conectar al ESP32 en {self.esp32_ip}")
+            print("  Verifica que el ESP32 esté encendido y en la misma red")
+            print("  o búscalo con la opción 11 (Buscar ESP32 en la red)")
+        return False
+
+
+# Acciones que se pueden perfilar sin menú (--profile-accion)
+ACCIONES_PERFIL = {
+    "reporte": lambda s: s.procesar_reporte_completo(),
+    "verificar": lambda s: s.verificar_conexion(),
+}
 
 
 def menu_principal():
@@ -288,6 +521,13 @@ def menu_principal():
         print("5. Verificar conexión con ESP32")
         print("6. Salir")
         print("7. Chat Financiero")
+        print("8. Diagnóstico (métricas)")
+        print("9. Ver catálogo de productos")
+        print("10. Recibir reportes de las cajas (servidor de ingesta)")
+        print("11. Buscar ESP32 en la red")
+        print("12. Archivar meses cerrados")
+        print("13. Subir paquetes mensuales a Drive")
+        print("14. Análisis de la IA por día o mes (en lote)")
         print("─"*60)
         
         opcion = input("\n➤ Seleccione una opción: ").strip()
@@ -313,36 +553,47 @@ def menu_principal():
                 print("⚠ IP no cambiada")
         
         elif opcion == "5":
-            print("\n🔍 Verificando conexión con ESP32...\n")
-            
-            try:
-                url = f"http://{sistema.esp32_ip}/status"
-                response = requests.get(url, timeout=5)
-                if response.status_code == 200:
-                    datos = response.json()
-                    print("\n✓ ESP32 conectado y funcionando")
-                    print(f"  - IP: {sistema.esp32_ip}")
-                    print(f"  - Ventas registradas: {datos.get('ventas', 0)}")
-                    print(f"  - Estado: {datos.get('status', 'N/A')}")
-                else:
-                    print(f"\n⚠ ESP32 responde pero con error: {response.status_code}")
-            except:
-                print(f"\n✗ No se pudo conectar al ESP32 en {sistema.esp32_ip}")
-                print("  Verifica que el ESP32 esté encendido y en la misma red")
+            sistema.verificar_conexion()
         
         elif opcion == "6":
             print("\n👋 ¡Hasta luego!\n")
             break
         elif opcion == "7":
              from chat_financiero import menu_chat
-             menu_chat()
+             menu_chat(sistema.bandeja)
+        elif opcion == "8":
+            print("\n" + "="*75)
+            print(metricas.texto_resumen())
+            print("="*75)
+            sistema.ver_bandeja()
+            if input("\n¿Exportar a JSON? (s/n): ").strip().lower() == 's':
+                print(f"✓ Métricas exportadas a: {metricas.exportar()}")
+        elif opcion == "9":
+            sistema.ver_catalogo()
+        elif opcion == "10":
+            sistema.recibir_reportes()
+        elif opcion == "11":
+            sistema.buscar_esp32(completo=True)
+            descubrimiento.mostrar_tabla(sistema.dispositivos.recientes())
+            print(f"\n➤ En uso: {sistema.esp32_ip}")
+        elif opcion == "12":
+            sistema.archivar_meses()
+        elif opcion == "13":
+            if sistema.service or sistema.autenticar_google_drive():
+                sistema.subir_paquetes(incluir_actual=True)
+        elif opcion == "14":
+            sistema.generar_informes_ia()
         else:
             print("\n⚠ Opción inválida, intente nuevamente")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sistema de gestión financiera")
+    perfilado.agregar_opciones(parser, ACCIONES_PERFIL)
+    args = parser.parse_args()
+    
     try:
-        menu_principal()
+        perfilado.ejecutar(args, menu_principal, ACCIONES_PERFIL, SistemaFinanciero)
     except KeyboardInterrupt:
         print("\n\n👋 Programa interrumpido por el usuario\n")
     except Exception as e:
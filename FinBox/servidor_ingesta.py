@@ -0,0 +1,502 @@
+import os
+import json
+import asyncio
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import almacenamiento
+import eventos
+import metricas
+
+# Servidor de ingesta: las cajas envían sus reportes (o ventas sueltas) por
+# POST en vez de que el PC tenga que conocer la IP de cada una.
+#
+#   python servidor_ingesta.py --puerto 8080 --formato ndjson
+#
+#   POST /reporte   {"fecha", "ventas": [...], "total_dia", "total_ventas", "dispositivo"?, "id"?}
+#   POST /venta     {"dispositivo", "fecha", "venta": {...}, "id"?}
+#   POST /cierre    {"dispositivo", "fecha"}  -> reporte con las ventas sueltas del día hasta ahora
+#                                             (404 si ese día no llegó ninguna)
+#   GET  /status
+#
+# Cada petición se valida y se confirma cuando su lote ya está escrito. Los
+# lotes agrupan lo que llega durante ESPERA_LOTE segundos (o TAMAÑO_LOTE
+# peticiones) y se escriben con una sola apertura por archivo. Reenviar lo
+# mismo (mismo "id", cabecera Idempotency-Key o mismo contenido) no duplica:
+# se responde con el resultado original y "duplicado": true (durante DIAS_IDS
+# días: las claves confirmadas se guardan por día y luego se borran). Cada cierre
+# reemplaza el reporte acumulado del día de ese dispositivo
+# (reporte_<fecha>_cierre_<dispositivo>.json, en cualquier formato, porque un
+# segmento NDJSON solo admite agregar); un cierre repetido solo es duplicado
+# si desde el anterior no llegaron ventas nuevas.
+#
+# Tras cada lote se publican eventos "venta" y "reporte" (ver eventos.py) para
+# que las vistas en vivo se actualicen sin volver a leer la carpeta, y
+# al_guardar recibe los reportes escritos (aquí y en la GUI, el detector de
+# anomalías: un reporte cuyos totales no cuadran se guarda y queda marcado).
+
+PUERTO = 8080
+TAMAÑO_LOTE = 500
+ESPERA_LOTE = 0.02  # segundos
+MAX_CUERPO = 1 << 20
+CARPETA_ESTADO = "estado"
+CARPETA_VENTAS = "ventas_sueltas"
+CARPETA_IDS = "ingesta_ids"  # un archivo de claves confirmadas por día
+ARCHIVO_IDS_ANTERIOR = "ingesta_ids.txt"  # versión anterior: un solo archivo que no dejaba de crecer
+DIAS_IDS = 30  # un reenvío más viejo que esto ya no se reconoce como duplicado
+
+RAZONES = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def _es_fecha(valor):
+    try:
+        datetime.strptime(valor, '%Y-%m-%d')
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _validar_venta(venta, prefijo="venta"):
+    errores = []
+    if not isinstance(venta, dict):
+        return [f"{prefijo}: debe ser un objeto"]
+    if not isinstance(venta.get('valor'), int) or venta['valor'] < 0:
+        errores.append(f"{prefijo}.valor: entero >= 0 requerido")
+    if not (venta.get('producto') or venta.get('codigo')):
+        errores.append(f"{prefijo}: falta producto o codigo")
+    return errores
+
+
+def validar_reporte(datos):
+    """Lista de errores del reporte (vacía si es válido)
+
+    Que total_dia o total_ventas no cuadren con el detalle no es un error: el
+    reporte se guarda y el detector de anomalías lo marca (ver al_guardar).
+    """
+    if not isinstance(datos, dict):
+        return ["el cuerpo debe ser un objeto JSON"]
+    errores = []
+    if not _es_fecha(datos.get('fecha')):
+        errores.append("fecha: se espera YYYY-MM-DD")
+    ventas = datos.get('ventas')
+    if not isinstance(ventas, list):
+        return errores + ["ventas: se espera una lista"]
+    for i, venta in enumerate(ventas):
+        errores += _validar_venta(venta, f"ventas[{i}]")
+    return errores
+
+
+def validar_evento(datos, con_venta=True):
+    """Errores de una venta suelta (/venta) o de un cierre (/cierre)"""
+    if not isinstance(datos, dict):
+        return ["el cuerpo debe ser un objeto JSON"]
+    errores = []
+    if not datos.get('dispositivo'):
+        errores.append("dispositivo: requerido")
+    if not _es_fecha(datos.get('fecha')):
+        errores.append("fecha: se espera YYYY-MM-DD")
+    if con_venta:
+        errores += _validar_venta(datos.get('venta'))
+    return errores
+
+
+class ServidorIngesta:
+    """Recibe reportes por HTTP y los escribe en lotes"""
+
+    def __init__(self, carpeta="reportes", formato="ndjson", tamaño_lote=TAMAÑO_LOTE,
+                 espera_lote=ESPERA_LOTE, al_guardar=None):
+        if formato not in almacenamiento.FORMATOS:
+            raise ValueError(f"Formato de reportes desconocido: {formato}")
+        self.carpeta = carpeta
+        self.formato = formato
+        self.tamaño_lote = tamaño_lote
+        self.espera_lote = espera_lote
+        self.al_guardar = al_guardar  # función(lista de reportes) tras cada lote escrito, en otro hilo
+        self.carpeta_estado = os.path.join(carpeta, CARPETA_ESTADO)
+        self.carpeta_ventas = os.path.join(self.carpeta_estado, CARPETA_VENTAS)
+        self.carpeta_ids = os.path.join(self.carpeta_estado, CARPETA_IDS)
+        self._decodificar = almacenamiento.DECODIFICADORES[almacenamiento.decodificador]
+
+        self.confirmados = set()
+        self._dia_ids = None
+        self._pendientes = {}
+        self._cola = None
+        self._escritor = None
+        self._servidor = None
+        self._conexiones = {}  # writer -> tarea que atiende la conexión
+        # al_guardar corre fuera del bucle (puede escribir archivos, como las líneas base
+        # de anomalías) y en un solo hilo, así los lotes se avisan en orden y sin carreras
+        self._hilo_avisos = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingesta-avisos")
+        self._avisos = set()
+        self.recibidos = 0
+
+        for carpeta_nueva in (carpeta, self.carpeta_ventas, self.carpeta_ids):
+            os.makedirs(carpeta_nueva, exist_ok=True)
+        anterior = os.path.join(self.carpeta_estado, ARCHIVO_IDS_ANTERIOR)
+        if os.path.exists(anterior):
+            # Sus claves pasan a ser de hoy y vencen como las demás
+            with open(anterior, 'rb') as origen, open(self._ruta_ids(date.today()), 'ab') as destino:
+                destino.write(origen.read())
+            os.remove(anterior)
+        self._podar_ids(date.today())
+
+    def _ruta_ids(self, dia):
+        return os.path.join(self.carpeta_ids, f"{dia.isoformat()}.txt")
+
+    def _podar_ids(self, hoy):
+        """Borra las claves de hace más de DIAS_IDS días y carga las demás en confirmados"""
+        limite = (hoy - timedelta(days=DIAS_IDS)).isoformat()
+        confirmados = set()
+        for entrada in os.scandir(self.carpeta_ids):
+            if not entrada.name.endswith(".txt"):
+                continue
+            if entrada.name[:-4] < limite:
+                os.remove(entrada.path)
+                continue
+            with open(entrada.path, 'r', encoding='utf-8') as f:
+                confirmados.update(linea.strip() for linea in f if linea.strip())
+        self.confirmados = confirmados
+        self._dia_ids = hoy
+
+    # ========== CICLO DE VIDA ==========
+
+    async def iniciar(self, host="0.0.0.0", puerto=PUERTO):
+        self._cola = asyncio.Queue()
+        self._escritor = asyncio.create_task(self._escribir_lotes())
+        self._servidor = await asyncio.start_server(self._atender, host, puerto, backlog=1024)
+        return self._servidor
+
+    async def detener(self):
+        """Deja de aceptar conexiones y espera a que se escriba lo pendiente"""
+        if self._servidor:
+            self._servidor.close()
+            for writer in list(self._conexiones):
+                writer.close()
+            await asyncio.gather(*self._conexiones.values(), return_exceptions=True)
+            await self._servidor.wait_closed()
+        if self._cola is not None:
+            await self._cola.join()
+        if self._escritor:
+            self._escritor.cancel()
+        if self._avisos:
+            await asyncio.gather(*self._avisos, return_exceptions=True)
+        self._hilo_avisos.shutdown(wait=False)
+
+    # ========== HTTP ==========
+
+    async def _atender(self, reader, writer):
+        """Atiende una conexión; HTTP/1.1 con keep-alive"""
+        self._conexiones[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    cabecera = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._responder(writer, 413, {"error": "cabeceras demasiado grandes"}, False)
+                    break
+
+                lineas = cabecera.decode('latin-1').split("\r\n")
+                try:
+                    metodo, ruta, version = lineas[0].split(" ", 2)
+                except ValueError:
+                    await self._responder(writer, 400, {"error": "línea de petición inválida"}, False)
+                    break
+                encabezados = {}
+                for linea in lineas[1:]:
+                    if ":" in linea:
+                        nombre, valor = linea.split(":", 1)
+                        encabezados[nombre.strip().lower()] = valor.strip()
+
+                seguir = (encabezados.get("connection", "").lower() != "close"
+                          and version.upper() == "HTTP/1.1")
+                try:
+                    largo = int(encabezados.get("content-length", 0) or 0)
+                except ValueError:
+                    largo = -1
+                if largo < 0:
+                    # Sin un largo válido no se sabe dónde termina el cuerpo: se cierra
+                    await self._responder(writer, 400, {"error": "Content-Length inválido"}, False)
+                    break
+                if largo > MAX_CUERPO:
+                    await self._responder(writer, 413, {"error": f"máximo {MAX_CUERPO} bytes"}, False)
+                    break
+                cuerpo = await reader.readexactly(largo) if largo else b""
+
+                estado, respuesta = await self._despachar(metodo, ruta.split("?", 1)[0], encabezados, cuerpo)
+                await self._responder(writer, estado, respuesta, seguir)
+                if not seguir:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._conexiones.pop(writer, None)
+            writer.close()
+
+    async def _responder(self, writer, estado, datos, seguir):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {estado} {RAZONES.get(estado, '')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if seguir else 'close'}\r\n\r\n".encode('latin-1') + cuerpo)
+        await writer.drain()
+
+    async def _despachar(self, metodo, ruta, encabezados, cuerpo):
+        metricas.contar("ingesta.peticiones")
+        if ruta == "/status":
+            return 200, {"status": "ok", "recibidos": self.recibidos,
+                         "pendientes": self._cola.qsize() if self._cola else 0}
+        if ruta not in ("/reporte", "/venta", "/cierre"):
+            return 404, {"error": f"ruta desconocida: {ruta}"}
+        if metodo != "POST":
+            return 405, {"error": "use POST"}
+
+        try:
+            datos = self._decodificar(cuerpo)
+        except ValueError as e:
+            metricas.contar("ingesta.invalidos")
+            return 400, {"error": f"JSON inválido: {e}"}
+
+        tipo = ruta[1:]
+        errores = (validar_reporte(datos) if tipo == "reporte"
+                   else validar_evento(datos, con_venta=(tipo == "venta")))
+        if errores:
+            metricas.contar("ingesta.invalidos")
+            return 400, {"error": "reporte inválido", "detalles": errores[:20]}
+
+        if tipo == "cierre":
+            # Solo junta cierres simultáneos; el duplicado real se decide al escribir,
+            # por el número de ventas consolidadas (ver _escribir)
+            clave = f"cierre:{datos['dispositivo']}:{datos['fecha']}"
+        else:
+            clave = (encabezados.get("idempotency-key") or (datos.get("id") if isinstance(datos, dict) else None)
+                     or hashlib.sha1(cuerpo).hexdigest())
+            clave = f"{tipo}:{clave}"
+        return await self._encolar(clave, tipo, datos)
+
+    # ========== LOTES ==========
+
+    async def _encolar(self, clave, tipo, datos):
+        """Confirma una sola vez por clave; las repeticiones esperan al mismo lote"""
+        if tipo != "cierre" and clave in self.confirmados:
+            metricas.contar("ingesta.duplicados")
+            return 200, {"ok": True, "id": clave, "duplicado": True}
+
+        futuro = self._pendientes.get(clave)
+        duplicado = futuro is not None
+        if futuro is None:
+            futuro = self._pendientes[clave] = asyncio.get_running_loop().create_future()
+            self.recibidos += 1
+            await self._cola.put((clave, tipo, datos, futuro))
+        else:
+            metricas.contar("ingesta.duplicados")
+
+        try:
+            resultado = await asyncio.shield(futuro)
+        except Exception as e:
+            return 500, {"error": f"no se pudo guardar: {e}"}
+        if resultado == "vacio":
+            return 404, {"error": f"no hay ventas sueltas de {datos['dispositivo']} el {datos['fecha']}",
+                         "id": clave}
+        if resultado == "duplicado":
+            metricas.contar("ingesta.duplicados")
+        return 200, {"ok": True, "id": clave, "duplicado": duplicado or resultado == "duplicado"}
+
+    async def _escribir_lotes(self):
+        while True:
+            lote = [await self._cola.get()]
+            if self._cola.qsize() < self.tamaño_lote:
+                # Se espera un poco para juntar más peticiones en el mismo lote
+                await asyncio.sleep(self.espera_lote)
+            while len(lote) < self.tamaño_lote and not self._cola.empty():
+                lote.append(self._cola.get_nowait())
+
+            try:
+                with metricas.medir("ingesta.lote"):
+                    reportes, guardadas, repetidos, vacios = await asyncio.to_thread(self._escribir, lote)
+                self.confirmados.update(guardadas)
+                for clave, _, _, futuro in lote:
+                    futuro.set_result("vacio" if clave in vacios else
+                                      "duplicado" if clave in repetidos else "nuevo")
+                self._publicar(lote, reportes)
+            except Exception as e:
+                metricas.contar("ingesta.errores")
+                for _, _, _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+            finally:
+                for clave, _, _, _ in lote:
+                    self._pendientes.pop(clave, None)
+                    self._cola.task_done()
+
+    def _publicar(self, lote, reportes):
+        for _, tipo, datos, _ in lote:
+            if tipo == "venta":
+                eventos.publicar("venta", datos)
+        for datos in reportes:
+            eventos.publicar("reporte", {"datos": datos, "ruta": None})
+        if self.al_guardar and reportes:
+            aviso = asyncio.get_running_loop().run_in_executor(self._hilo_avisos, self.al_guardar, reportes)
+            self._avisos.add(aviso)
+            aviso.add_done_callback(self._aviso_terminado)
+
+    def _aviso_terminado(self, aviso):
+        self._avisos.discard(aviso)
+        if not aviso.cancelled() and aviso.exception() is not None:
+            metricas.contar("ingesta.errores")
+            print(f"⚠ Error al procesar reportes recibidos: {aviso.exception()}")
+
+    def _escribir(self, lote):
+        """Escribe un lote (en un hilo aparte): ventas sueltas, cierres, reportes e ids"""
+        reportes = [(clave, almacenamiento.marcar_recibido(datos)) for clave, tipo, datos, _ in lote
+                    if tipo == "reporte"]
+
+        ventas = {}
+        for _, tipo, datos, _ in lote:
+            if tipo == "venta":
+                ventas.setdefault(self._ruta_ventas(datos), []).append(
+                    json.dumps(datos['venta'], ensure_ascii=False, separators=(',', ':')))
+        for ruta, lineas in ventas.items():
+            with open(ruta, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lineas) + "\n")
+
+        # Un cierre se confirma con la clave de su contenido: el mismo día y dispositivo
+        # con otro número de ventas reemplaza al anterior, con el mismo es un duplicado.
+        # Sin ventas sueltas no se guarda nada (y no se confirma)
+        repetidos, vacios, cierres = set(), set(), {}
+        for clave, tipo, datos, _ in lote:
+            if tipo == "cierre":
+                reporte = self._consolidar(datos)
+                if reporte is None:
+                    vacios.add(clave)
+                    continue
+                contenido = f"{clave}:{reporte['total_ventas']}"
+                if contenido in self.confirmados or contenido in cierres:
+                    repetidos.add(clave)
+                else:
+                    cierres[contenido] = reporte
+        for reporte in cierres.values():
+            almacenamiento.guardar_json(reporte, self.carpeta, hora=f"cierre_{self._nombre_dispositivo(reporte)}")
+
+        if reportes:
+            if self.formato == "ndjson":
+                almacenamiento.AlmacenNDJSON(self.carpeta).agregar_lote([datos for _, datos in reportes])
+            else:
+                hora = datetime.now().strftime('%H%M%S')
+                for clave, datos in reportes:
+                    # La clave ya es única entre los confirmados: dos lotes del mismo segundo
+                    # (o un reinicio) no pueden pisarse el archivo
+                    sufijo = hashlib.sha1(clave.encode('utf-8')).hexdigest()[:12]
+                    almacenamiento.guardar_json(datos, self.carpeta, hora=f"{hora}_{sufijo}")
+
+        guardadas = [clave for clave, tipo, _, _ in lote if tipo != "cierre"] + list(cierres)
+        hoy = date.today()
+        if hoy != self._dia_ids:
+            self._podar_ids(hoy)  # el servidor puede quedar encendido varios días
+        with open(self._ruta_ids(hoy), 'a', encoding='utf-8') as f:
+            f.write("".join(f"{clave}\n" for clave in guardadas))
+
+        reportes = [datos for _, datos in reportes] + list(cierres.values())
+        metricas.contar("ingesta.reportes", len(reportes))
+        return reportes, guardadas, repetidos, vacios
+
+    @staticmethod
+    def _nombre_dispositivo(datos):
+        """El dispositivo sin caracteres que no sirven en un nombre de archivo"""
+        return "".join(c for c in str(datos['dispositivo']) if c.isalnum() or c in "-_")
+
+    def _ruta_ventas(self, datos):
+        return os.path.join(self.carpeta_ventas, f"{datos['fecha']}_{self._nombre_dispositivo(datos)}.ndjson")
+
+    def _consolidar(self, datos):
+        """Reporte acumulado del día con las ventas sueltas de un dispositivo (el archivo se conserva)"""
+        ruta = self._ruta_ventas(datos)
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, 'rb') as f:
+            ventas = [self._decodificar(linea) for linea in f if linea.strip()]
+        for i, venta in enumerate(ventas, 1):
+            venta['numero'] = i
+        return almacenamiento.marcar_recibido({
+            'fecha': datos['fecha'],
+            'dispositivo': datos['dispositivo'],
+            'total_ventas': len(ventas),
+            'ventas': ventas,
+            'total_dia': sum(v['valor'] for v in ventas),
+        })
+
+
+def en_hilo(carpeta="reportes", formato="ndjson", host="0.0.0.0", puerto=PUERTO, al_guardar=None):
+    """Arranca el servidor en un hilo con su propio bucle; devuelve la función para detenerlo"""
+    listo = threading.Event()
+    estado = {}
+
+    async def correr():
+        estado['bucle'] = asyncio.get_running_loop()
+        estado['parar'] = asyncio.Event()
+        servidor = ServidorIngesta(carpeta, formato, al_guardar=al_guardar)
+        try:
+            await servidor.iniciar(host, puerto)
+        except Exception as e:
+            estado['error'] = e
+            return
+        finally:
+            listo.set()
+        try:
+            await estado['parar'].wait()
+        finally:
+            await servidor.detener()
+
+    hilo = threading.Thread(target=asyncio.run, args=(correr(),), daemon=True)
+    hilo.start()
+    listo.wait()
+    if 'error' in estado:
+        raise estado['error']
+
+    def detener():
+        estado['bucle'].call_soon_threadsafe(estado['parar'].set)
+        hilo.join(timeout=5)
+    return detener
+
+
+async def servir(carpeta, formato, host, puerto):
+    import anomalias
+    detector = anomalias.DetectorAnomalias(carpeta)
+
+    def al_guardar(reportes):
+        for datos in reportes:
+            alertas = detector.revisar(datos)
+            if alertas:
+                print(f"📥 Reporte {datos.get('fecha')} de {datos.get('dispositivo', 'ESP32')}:")
+                anomalias.mostrar_alertas(alertas)
+
+    servidor = ServidorIngesta(carpeta, formato, al_guardar=al_guardar)
+    await servidor.iniciar(host, puerto)
+    print(f"✓ Servidor de ingesta escuchando en http://{host}:{puerto} (guardando en '{carpeta}', {formato})")
+    print("  Ctrl+C para detener")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await servidor.detener()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP de ingesta de reportes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--carpeta", default="reportes")
+    parser.add_argument("--formato", choices=almacenamiento.FORMATOS, default="ndjson")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(servir(args.carpeta, args.formato, args.host, args.puerto))
+    except KeyboardInterrupt:
+        print("\n👋 Servidor detenido\n")
+
+
+if __name__ == "__main__":
+    main()